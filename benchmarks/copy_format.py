@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+"""Compare CSV and binary COPY throughput on a synthetic table
+
+python benchmarks/copy_format.py --uri postgresql://localhost/ppmidb_bench --rows 5000000
+
+The table is dropped and recreated for each format, so point --uri at a
+scratch database.
+"""
+
+import time
+
+import click
+import polars as pl
+import psycopg
+
+from ppmidb.infer_schema import infer_schema
+from ppmidb.loader import COPY_FORMATS, copy_dataframe
+from ppmidb.utils import generate_sql_create_table_ddl
+
+TABLE_NAME = "bench_copy_format"
+
+
+def synthetic_frame(n_rows: int) -> pl.DataFrame:
+    """Returns a PPMI-like frame with integer, float, boolean, date, timestamp and text columns"""
+    h = pl.col("h")
+    return (
+        pl.DataFrame({"i": pl.int_range(0, n_rows, dtype=pl.Int64, eager=True)})
+        .with_columns(h=pl.col("i").hash(seed=42))
+        .select(
+            REC_ID=pl.format("IA{}", "i"),
+            PATNO=(3000 + h % 100_000).cast(pl.Int64),
+            EVENT_ID=pl.lit(pl.Series(["BL", "V01", "V02", "V04", "V06", "SC"])).gather(h % 6),
+            PAG_NAME=pl.lit(pl.Series(["VITALS", "NUPDRS3", "MOCA"])).gather(h % 3),
+            SCORE=(h % 40).cast(pl.Int64),
+            WGTKG=(h % 100_000).cast(pl.Float64) / 1000 + 40,
+            FLAG=(h % 2) == 0,
+            INFODT=pl.date(2010, 1, 1) + pl.duration(days=(h % 5000).cast(pl.Int64)),
+            LAST_UPDATE=pl.datetime(2020, 1, 1) + pl.duration(seconds=(h % 100_000_000).cast(pl.Int64)),
+            COMMENTS=pl.when(h % 10 == 0).then(pl.lit('Subject said "no tremors today."')),
+        )
+    )
+
+
+@click.command()
+@click.option("--uri", type=str, required=True, help="Scratch PostgreSQL database")
+@click.option("--rows", type=int, default=5_000_000, show_default=True)
+def main(uri: str, rows: int):
+    df = synthetic_frame(rows)
+    schema = infer_schema(df)
+    ddl = generate_sql_create_table_ddl(schema, TABLE_NAME).replace(" IF NOT EXISTS", "")
+    mbytes = len(df.write_csv()) / 1e6
+
+    with psycopg.connect(uri) as con:
+        for copy_format in COPY_FORMATS:
+            with con.cursor() as cur:
+                cur.execute(f'DROP TABLE IF EXISTS "{TABLE_NAME}"'.encode())
+                cur.execute(ddl.encode())
+            con.commit()
+
+            t0 = time.perf_counter()
+            copy_dataframe(con, TABLE_NAME, df, schema, copy_format=copy_format)
+            con.commit()
+            elapsed = time.perf_counter() - t0
+
+            print(
+                f"{copy_format:<8} {rows} rows in {elapsed:8.2f}s: "
+                f"{rows / elapsed:12,.0f} rows/s {mbytes / elapsed:8.1f} MB/s (CSV-equivalent)"
+            )
+
+        with con.cursor() as cur:
+            cur.execute(f'DROP TABLE IF EXISTS "{TABLE_NAME}"'.encode())
+        con.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+"""Time the main stages of ppmidb on a synthetic (or real) freeze
+
+python benchmarks/suite.py --tables 20 --rows 200000 --save-baseline /tmp/baseline.json
+python benchmarks/suite.py --tables 20 --rows 200000 --baseline /tmp/baseline.json
+
+Benchmarks:
+
+* read: decode and fix every member (CsvMember.iter_chunks)
+* infer_schema: parse every member into a frame and infer its schema
+* infer_schema_from_csv: infer schemas from spooled members without materializing them
+* ddl: generate CREATE TABLE DDL for every inferred schema
+* copy: load every member with -t into a scratch schema (only with --uri)
+
+Everything runs offline; the copy benchmark needs a local PostgreSQL
+database and drops its scratch schema afterwards.  Results are compared
+with a baseline saved by an earlier run with --save-baseline.
+"""
+
+from io import StringIO
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import time
+from typing import Callable, Dict, List, Optional
+
+import click
+import polars as pl
+
+from ppmidb.infer_schema import infer_schema, infer_schema_from_csv
+from ppmidb.loader import LoadOptions, load_member
+from ppmidb.schemas import set_search_path
+from ppmidb.sources import CsvMember, member_generator, spool_chunks
+from ppmidb.utils import format_text_table, generate_sql_create_table_ddl
+
+from synthetic_freeze import write_synthetic_freeze
+
+BENCH_SCHEMA = "ppmidb_bench"
+DDL_REPEAT = 100
+
+
+def run_timed(fn: Callable[[], None], repeat: int) -> float:
+    """Returns the best of REPEAT wall-clock times of FN, in seconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def bench_copy(uri: str, members: List[CsvMember]) -> None:
+    import psycopg
+
+    with psycopg.connect(uri) as con:
+        with con.cursor() as cur:
+            cur.execute(f'DROP SCHEMA IF EXISTS "{BENCH_SCHEMA}" CASCADE'.encode())
+            cur.execute(f'CREATE SCHEMA "{BENCH_SCHEMA}"'.encode())
+        con.commit()
+        set_search_path(con, BENCH_SCHEMA)
+        errors = []
+        try:
+            for member in members:
+                load_member(con, member, LoadOptions(create_table=True), errors)
+        finally:
+            with con.cursor() as cur:
+                cur.execute(f'DROP SCHEMA IF EXISTS "{BENCH_SCHEMA}" CASCADE'.encode())
+            con.commit()
+        if errors:
+            raise RuntimeError(f"{len(errors)} members failed to load: {errors[0]}")
+
+
+def run_benchmarks(zip_file: Path, uri: Optional[str], repeat: int) -> Dict[str, dict]:
+    members = list(member_generator(file_paths=[], zip_file=str(zip_file)))
+    n_bytes = sum(m.file_size for m in members)
+    n_rows = sum("".join(m.iter_chunks()).count("\n") for m in members)
+
+    with TemporaryDirectory(prefix="ppmidb-bench-") as spool_dir:
+        spool_paths = []
+        for member in members:
+            spool_paths.append(Path(spool_dir) / f"{member.table_name}.csv")
+            spool_chunks(member.iter_chunks(), spool_paths[-1])
+        schemas = [infer_schema_from_csv(path) for path in spool_paths]
+
+        benchmarks: Dict[str, Callable[[], None]] = {
+            "read": lambda: [sum(len(chunk) for chunk in m.iter_chunks()) for m in members],
+            "infer_schema": lambda: [
+                infer_schema(pl.read_csv(StringIO("".join(m.iter_chunks())), infer_schema_length=None))
+                for m in members
+            ],
+            "infer_schema_from_csv": lambda: [infer_schema_from_csv(path) for path in spool_paths],
+            "ddl": lambda: [
+                generate_sql_create_table_ddl(schema, member.table_name)
+                for _ in range(DDL_REPEAT)
+                for schema, member in zip(schemas, members)
+            ],
+        }
+        if uri:
+            benchmarks["copy"] = lambda: bench_copy(uri, members)
+
+        results = {}
+        for name, fn in benchmarks.items():
+            seconds = run_timed(fn, repeat)
+            scale = DDL_REPEAT if name == "ddl" else 1
+            results[name] = {
+                "seconds": seconds,
+                "rows_per_s": n_rows * scale / seconds,
+                "mb_per_s": n_bytes * scale / 1e6 / seconds,
+            }
+            click.echo(f"{name}: {seconds:.3f}s", err=True)
+    return results
+
+
+def results_as_table(results: Dict[str, dict], baseline: Optional[Dict[str, dict]]) -> str:
+    headers = ["Benchmark", "Seconds", "Rows/s", "MB/s", "Baseline MB/s", "Change"]
+    rows = []
+    for name, r in results.items():
+        b = (baseline or {}).get(name)
+        rows.append(
+            [
+                name,
+                f"{r['seconds']:.3f}",
+                f"{r['rows_per_s']:,.0f}",
+                f"{r['mb_per_s']:.1f}",
+                f"{b['mb_per_s']:.1f}" if b else "",
+                f"{(r['mb_per_s'] / b['mb_per_s'] - 1) * 100:+.1f}%" if b else "",
+            ]
+        )
+    return format_text_table(headers, rows)
+
+
+@click.command()
+@click.option("--zip-file", "-z", type=click.Path(exists=True, path_type=Path), default=None,
+                help="Freeze to benchmark; by default, a synthetic freeze is generated.")
+@click.option("--tables", type=click.IntRange(min=1), default=10, show_default=True)
+@click.option("--rows", type=click.IntRange(min=1), default=100_000, show_default=True)
+@click.option("--text-width", type=click.IntRange(min=1), default=64, show_default=True)
+@click.option("--seed", type=int, default=0, show_default=True)
+@click.option("--uri", type=str, default=None, help="Scratch PostgreSQL database for the copy benchmark.")
+@click.option("--repeat", type=click.IntRange(min=1), default=3, show_default=True,
+                help="Runs per benchmark; the best time is reported.")
+@click.option("--baseline", type=click.Path(exists=True, dir_okay=False, path_type=Path), default=None,
+                help="Results of an earlier run to compare with.")
+@click.option("--save-baseline", type=click.Path(dir_okay=False, path_type=Path), default=None,
+                help="Write results as JSON for later comparison.")
+def main(zip_file: Optional[Path], tables: int, rows: int, text_width: int, seed: int, uri: Optional[str],
+         repeat: int, baseline: Optional[Path], save_baseline: Optional[Path]):
+    with TemporaryDirectory(prefix="ppmidb-bench-") as tmp_dir:
+        if zip_file is None:
+            zip_file = write_synthetic_freeze(
+                Path(tmp_dir) / "PPMI_20990101.zip", n_tables=tables, n_rows=rows, text_width=text_width, seed=seed
+            )
+        results = run_benchmarks(zip_file, uri, repeat)
+
+    baseline_results = json.loads(baseline.read_text()) if baseline else None
+    print(results_as_table(results, baseline_results))
+    if save_baseline:
+        save_baseline.write_text(json.dumps(results, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+"""Generate a synthetic PPMI-like freeze zip file
+
+python benchmarks/synthetic_freeze.py --tables 20 --rows 200000 /tmp/PPMI_20990101.zip
+
+Each member has REC_ID, PATNO, EVENT_ID, PAG_NAME, INFODT (MM/YYYY) and
+LAST_UPDATE columns followed by integer, float, code and free-text
+columns.  Like the real freeze, all values are quoted, nulls are empty,
+the text is cp1252-encoded with non-ASCII characters, and embedded quotes
+are (incorrectly) escaped as \\" rather than "".  Output is deterministic
+for a given seed.
+"""
+
+from pathlib import Path
+from zipfile import ZIP_DEFLATED, ZipFile
+
+import click
+import polars as pl
+
+from ppmidb.sources import PPMI_CSV_ENCODING
+
+EVENT_IDS = ["SC", "BL", "V01", "V02", "V04", "V06", "V08", "V10", "V12", "ST", "U01", "PW"]
+PAG_NAMES = ["VITAL", "NUPDRS3", "MOCA", "UPSIT", "SCOPA", "GDS", "PENEURO"]
+PHRASES = [
+    'Subject said \\"no tremors today.\\"',
+    "Résumé of visit – no change",
+    "Participant’s spouse reported mild symptoms",
+    "Protocol deviation; see note",
+    "Naïve to dopaminergic therapy",
+    "Assessment completed off medication",
+]
+BATCH_ROWS = 100_000
+
+
+def table_names(n_tables: int) -> list[str]:
+    return [f"Synthetic_Table_{i:03d}" for i in range(n_tables)]
+
+
+def synthetic_batch(
+    offset: int, n_rows: int, table_index: int, n_int: int, n_float: int, n_text: int, text_width: int, seed: int
+) -> pl.DataFrame:
+    """Returns rows OFFSET..OFFSET+N_ROWS of a synthetic member as strings"""
+    h = pl.col("i").hash(seed=seed + table_index)
+    phrases = pl.lit(pl.Series(PHRASES))
+
+    columns = {
+        "REC_ID": pl.format("IA{}", pl.col("i")),
+        "PATNO": (3000 + h % 80_000).cast(pl.String),
+        "EVENT_ID": pl.lit(pl.Series(EVENT_IDS)).gather(h % len(EVENT_IDS)),
+        "PAG_NAME": pl.lit(pl.Series(PAG_NAMES)).gather(h % len(PAG_NAMES)),
+        "INFODT": pl.format("{}/{}", ((h % 12) + 1).cast(pl.String).str.zfill(2), (2010 + h % 15).cast(pl.String)),
+        "LAST_UPDATE": pl.format("2024-{}-{} 00:00:00.0", ((h % 12) + 1).cast(pl.String).str.zfill(2),
+                                 ((h % 28) + 1).cast(pl.String).str.zfill(2)),
+    }
+    for j in range(n_int):
+        hj = pl.col("i").hash(seed=seed + 1000 * table_index + j)
+        columns[f"ITEM_{j:02d}"] = pl.when(hj % 20 != 0).then((hj % (10 ** (1 + j % 6))).cast(pl.String))
+    for j in range(n_float):
+        hj = pl.col("i").hash(seed=seed + 2000 * table_index + j)
+        columns[f"MEAS_{j:02d}"] = pl.when(hj % 10 != 0).then(((hj % 100_000) / 100).round(2).cast(pl.String))
+    for j in range(n_text):
+        hj = pl.col("i").hash(seed=seed + 3000 * table_index + j)
+        text = phrases.gather(hj % len(PHRASES))
+        repeats = max(1, text_width // 32)
+        columns[f"COMMENT_{j:02d}"] = pl.when(hj % 3 == 0).then(pl.concat_str([text] * repeats, separator=" "))
+
+    return (
+        pl.DataFrame({"i": pl.int_range(offset, offset + n_rows, dtype=pl.Int64, eager=True)})
+        .select(**columns)
+    )
+
+
+def write_synthetic_freeze(
+    zip_path: Path,
+    n_tables: int = 10,
+    n_rows: int = 100_000,
+    n_int: int = 8,
+    n_float: int = 4,
+    n_text: int = 2,
+    text_width: int = 64,
+    seed: int = 0,
+) -> Path:
+    """Writes a synthetic freeze with N_TABLES members of N_ROWS rows each to ZIP_PATH.
+    Member sizes vary: table i has N_ROWS * (i % 4 + 1) / 4 rows (at least 1)."""
+    date = "20990101"
+    with ZipFile(zip_path, "w", compression=ZIP_DEFLATED) as zf:
+        for table_index, table_name in enumerate(table_names(n_tables)):
+            member_rows = max(1, n_rows * (table_index % 4 + 1) // 4)
+            with zf.open(f"{table_name}_{date}.csv", "w") as fh:
+                for offset in range(0, member_rows, BATCH_ROWS):
+                    batch = synthetic_batch(
+                        offset, min(BATCH_ROWS, member_rows - offset), table_index, n_int, n_float, n_text,
+                        text_width, seed,
+                    )
+                    text = batch.write_csv(include_header=offset == 0, quote_style="non_numeric", line_terminator="\r\n")
+                    # PPMI escapes embedded quotes as \" instead of ""
+                    text = text.replace('\\""', '\\"')
+                    fh.write(text.encode(PPMI_CSV_ENCODING))
+    return zip_path
+
+
+@click.command()
+@click.argument("zip_path", type=click.Path(dir_okay=False, path_type=Path))
+@click.option("--tables", type=click.IntRange(min=1), default=10, show_default=True)
+@click.option("--rows", type=click.IntRange(min=1), default=100_000, show_default=True,
+                help="Rows in the largest members; members have 1/4 to all of this.")
+@click.option("--int-columns", type=click.IntRange(min=0), default=8, show_default=True)
+@click.option("--float-columns", type=click.IntRange(min=0), default=4, show_default=True)
+@click.option("--text-columns", type=click.IntRange(min=0), default=2, show_default=True)
+@click.option("--text-width", type=click.IntRange(min=1), default=64, show_default=True,
+                help="Approximate characters per free-text value.")
+@click.option("--seed", type=int, default=0, show_default=True)
+def main(zip_path: Path, tables: int, rows: int, int_columns: int, float_columns: int, text_columns: int,
+         text_width: int, seed: int):
+    write_synthetic_freeze(zip_path, tables, rows, int_columns, float_columns, text_columns, text_width, seed)
+    print(f"Wrote {zip_path} ({zip_path.stat().st_size / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
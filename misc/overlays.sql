@@ -19,7 +19,8 @@ select
     CLA.itm_name,
     CLA.code,
     coalesce(CLO.decode, CLA.decode) as decode,
-    coalesce(CLO.mapping_notes, CLA.mapping_notes) as mapping_notes
+    coalesce(CLO.mapping_notes, CLA.mapping_notes) as mapping_notes,
+    CLO.code is not null as overlaid
 from
     code_list_annotated CLA
     left join _code_list_overlay CLO on (CLA.mod_name = CLO.mod_name
@@ -37,11 +38,33 @@ from
     left join _data_dictionary_overlay DDO on (DDA.mod_name = DDO.mod_name
     and DDA.itm_name = DDO.itm_name);
 
+-- Decodes of code_list_v, precomputed once per code rather than per row
+-- of the bridge views, which join against it.  Rebuild after loading a
+-- freeze or editing the overlays with `ppmidb refresh-bridge SCHEMA`.
+-- One row per code, so that joins never duplicate rows of the bridge
+-- views: where the code list or the overlay repeats a code, an overlaid
+-- decode is preferred, then the first decode in sort order.  The unique
+-- index also allows REFRESH MATERIALIZED VIEW CONCURRENTLY.
+create materialized view if not exists code_decode as
+select distinct on (mod_name, itm_name, code)
+    mod_name,
+    itm_name,
+    code,
+    decode,
+    safe_cast_to_boolean(decode) as decode_boolean
+from
+    code_list_v
+order by
+    mod_name, itm_name, code, overlaid desc, decode;
+
+create unique index if not exists code_decode_lookup on code_decode (mod_name, itm_name, code) include (decode, decode_boolean);
+
+-- For ad hoc queries; views should join code_decode instead
 CREATE OR REPLACE FUNCTION code_lookup (
     f_mod_name text,
     f_itm_name text,
     f_code text
-) RETURNS text LANGUAGE sql IMMUTABLE STRICT AS $function$
-select code from code_list_v
+) RETURNS text LANGUAGE sql STABLE STRICT AS $function$
+select decode from code_decode
 where mod_name=f_mod_name and itm_name=f_itm_name and code=f_code;
 $function$;
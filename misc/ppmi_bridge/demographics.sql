@@ -1,28 +1,25 @@
 create or replace view demographics as
 select
-    rec_id,
-    patno, -- as-is
+    D.rec_id,
+    D.patno, -- as-is
     -- event_id
     -- pag_name
-    infodt, -- as-is
-,
-    = safe_cast_to_boolean (
-        code_lookup ('SCREEN', 'AFICBERB', aficberb::text)
-    ) as aficberb,
-    safe_cast_to_boolean (code_lookup ('SCREEN', 'ASHKJEW', ashkjew::text)) as ashkjew,
-    safe_cast_to_boolean (code_lookup ('SCREEN', 'BASQUE', basque::text)) as basque,
-    convert_mm_yyyy_to_yyyy_mm (birthdt) as birthdt,
-    code_lookup ('SCREEN', 'SEX', sex::text) as sex,
+    D.infodt, -- as-is
+    AFICBERB.decode_boolean as aficberb,
+    ASHKJEW.decode_boolean as ashkjew,
+    BASQUE.decode_boolean as basque,
+    convert_mm_yyyy_to_yyyy_mm (D.birthdt) as birthdt,
+    SEX.decode as sex,
     -- chldbear
-    code_lookup ('SCREEN', 'HOWLIVE', howlive::text) as gender,
+    HOWLIVE.decode as gender,
     -- gayles
     -- hetero
     -- bisexual
     -- pansexual
     -- asexual
     -- othsexuality
-    code_lookup ('SCREEN', 'HANDED', handed::text) as handed,
-    code_lookup ('SCREEN', 'HISPLAT', hisplat::text) as ethnicity,
+    HANDED.decode as handed,
+    HISPLAT.decode as ethnicity,
     CASE
         WHEN (
             raasian + rablack + rahawopi + raindals + ranos + rawhite + raunknown
@@ -30,26 +27,44 @@ select
         WHEN (
             raasian + rablack + rahawopi + raindals + ranos + rawhite + raunknown
         ) > 1 THEN 'Two or More Races'
-        ELSE CASE
-            WHEN raasian = 1 THEN code_lookup ('SCREEN', 'RAASIAN', 1::text)
-            WHEN rablack = 1 THEN code_lookup ('SCREEN', 'RABLACK', 1::text)
-            WHEN rahawopi = 1 THEN code_lookup ('SCREEN', 'RAHAWOPI', 1::text)
-            WHEN raindals = 1 THEN code_lookup ('SCREEN', 'RAINDALS', 1::text)
-            WHEN ranos = 1 THEN code_lookup ('SCREEN', 'RANOS', 1::text)
-            WHEN rawhite = 1 THEN code_lookup ('SCREEN', 'RAWHITE', 1::text)
-            WHEN raunknown = 1 THEN code_lookup ('SCREEN', 'RAUNKNOWN', 1::text)
-            ELSE NULL
-        END
+        ELSE RACE.decode
     END AS race,
-    convert_mm_yyyy_to_yyyy_mm (orig_entry) as orig_entry,
-    last_update,
-    (
+    convert_mm_yyyy_to_yyyy_mm (D.orig_entry) as orig_entry,
+    D.last_update,
+    SE.educyrs
+from
+    demographics D
+    left join code_decode AFICBERB on (AFICBERB.mod_name = 'SCREEN' and AFICBERB.itm_name = 'AFICBERB'
+    and AFICBERB.code = D.aficberb::text)
+    left join code_decode ASHKJEW on (ASHKJEW.mod_name = 'SCREEN' and ASHKJEW.itm_name = 'ASHKJEW'
+    and ASHKJEW.code = D.ashkjew::text)
+    left join code_decode BASQUE on (BASQUE.mod_name = 'SCREEN' and BASQUE.itm_name = 'BASQUE'
+    and BASQUE.code = D.basque::text)
+    left join code_decode SEX on (SEX.mod_name = 'SCREEN' and SEX.itm_name = 'SEX'
+    and SEX.code = D.sex::text)
+    left join code_decode HOWLIVE on (HOWLIVE.mod_name = 'SCREEN' and HOWLIVE.itm_name = 'HOWLIVE'
+    and HOWLIVE.code = D.howlive::text)
+    left join code_decode HANDED on (HANDED.mod_name = 'SCREEN' and HANDED.itm_name = 'HANDED'
+    and HANDED.code = D.handed::text)
+    left join code_decode HISPLAT on (HISPLAT.mod_name = 'SCREEN' and HISPLAT.itm_name = 'HISPLAT'
+    and HISPLAT.code = D.hisplat::text)
+    -- the decode of the single race item that is 1
+    left join code_decode RACE on (RACE.mod_name = 'SCREEN' and RACE.code = '1'
+    and RACE.itm_name = CASE
+        WHEN D.raasian = 1 THEN 'RAASIAN'
+        WHEN D.rablack = 1 THEN 'RABLACK'
+        WHEN D.rahawopi = 1 THEN 'RAHAWOPI'
+        WHEN D.raindals = 1 THEN 'RAINDALS'
+        WHEN D.ranos = 1 THEN 'RANOS'
+        WHEN D.rawhite = 1 THEN 'RAWHITE'
+        WHEN D.raunknown = 1 THEN 'RAUNKNOWN'
+    END)
+    left join (
         select
-            max(educyrs::smallint)
+            patno,
+            max(educyrs::smallint) as educyrs
         from
-            socio_economics SE
-        where
-            SE.patno = D.patno
-    ) as educyrs
-from
-    demographics D;
+            socio_economics
+        group by
+            patno
+    ) SE on (SE.patno = D.patno);
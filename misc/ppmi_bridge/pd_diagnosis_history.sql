@@ -43,20 +43,22 @@ $$;
 
 create or replace view pd_diagnosis_history as
 select
-    rec_id,
-    patno,
-    event_id,
-    convert_mm_yyyy_to_yyyy_mm (infodt) as infodt,
-    convert_mm_yyyy_to_yyyy_mm (sxdt) as sxdt,
-    convert_mm_yyyy_to_yyyy_mm (pddxdt) as pddxdt,
+    H.rec_id,
+    H.patno,
+    H.event_id,
+    convert_mm_yyyy_to_yyyy_mm (H.infodt) as infodt,
+    convert_mm_yyyy_to_yyyy_mm (H.sxdt) as sxdt,
+    convert_mm_yyyy_to_yyyy_mm (H.pddxdt) as pddxdt,
     get_diagnosis_symptom_status (
-        p_dxtremor => dxtremor,
-        p_dxrigid => dxrigid,
-        p_dxbrady => dxbrady,
-        p_dxposins => dxposins,
-        p_dxothsx => dxothsx
+        p_dxtremor => H.dxtremor,
+        p_dxrigid => H.dxrigid,
+        p_dxbrady => H.dxbrady,
+        p_dxposins => H.dxposins,
+        p_dxothsx => H.dxothsx
     ) as dx_symptoms,
-    code_lookup(pag_name, 'DOMSIDE', domside::text) as domside,
-    convert_mm_yyyy_to_yyyy_mm (orig_entry) as orig_entry
+    DOMSIDE.decode as domside,
+    convert_mm_yyyy_to_yyyy_mm (H.orig_entry) as orig_entry
 from
-    pd_diagnosis_history;
+    pd_diagnosis_history H
+    left join code_decode DOMSIDE on (DOMSIDE.mod_name = H.pag_name and DOMSIDE.itm_name = 'DOMSIDE'
+    and DOMSIDE.code = H.domside::text);
@@ -0,0 +1,167 @@
+"""Load members into BigQuery as typed Parquet with concurrent load jobs
+
+Each member is exported to a Parquet file in a worker process (see
+export.export_member), and a load job is submitted with an explicit
+schema built from the inferred column types, so BigQuery does not
+autodetect types.  Up to max_load_jobs jobs run at once; their
+completions are polled together while further members are exported.
+
+The client and the google.cloud.bigquery module are passed in, so that a
+stand-in client (with load_table_from_file returning objects with done()
+and result()) can be used without BigQuery; see tests/fakebigquery.py.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+import logging
+from multiprocessing import get_context
+from pathlib import Path
+import re
+from tempfile import TemporaryDirectory
+import time
+from typing import Iterable, List, Optional
+
+from .export import ExportedMember, ExportOptions, export_member
+from .infer_schema import ColumnSchema
+from .metrics import TableMetrics
+from .sources import CsvMember
+
+_logger = logging.getLogger()
+
+DEFAULT_MAX_LOAD_JOBS = 8
+POLL_INTERVAL = 2.0  # seconds between polls of running load jobs
+
+# BigQuery column types for the base SQL types chosen by get_optimal_sql_type
+BIGQUERY_TYPES = {
+    "SMALLINT": "INT64",
+    "INTEGER": "INT64",
+    "BIGINT": "INT64",
+    "REAL": "FLOAT64",
+    "DOUBLE PRECISION": "FLOAT64",
+    "BOOLEAN": "BOOL",
+    "DATE": "DATE",
+    "TIME": "TIME",
+    "TIMESTAMP WITHOUT TIME ZONE": "DATETIME",
+    "TEXT": "STRING",
+}
+
+
+@dataclass
+class _RunningJob:
+    job: object
+    exported: ExportedMember
+    table_id: str
+    started: float
+
+
+def bigquery_type(col: ColumnSchema) -> str:
+    base_type = re.sub(r"\s+(NOT\s+)?NULL$", "", col.sql_type)
+    if base_type.startswith("NUMERIC"):
+        return "BIGNUMERIC"
+    return BIGQUERY_TYPES.get(base_type, "STRING")
+
+
+def schema_fields(bigquery, schema: List[ColumnSchema]) -> list:
+    """Returns a bigquery.SchemaField for each column of SCHEMA, named by its SQL name
+
+    All fields are NULLABLE: Polars writes every Parquet column as OPTIONAL,
+    and BigQuery does not load OPTIONAL columns into REQUIRED fields.
+    """
+    return [bigquery.SchemaField(col.sql_name, bigquery_type(col), mode="NULLABLE") for col in schema]
+
+
+def _submit_load(bigquery, client, dataset: str, exported: ExportedMember) -> _RunningJob:
+    table_id = f"{dataset}.{exported.table_name}"
+    job_config = bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.PARQUET,
+        schema=schema_fields(bigquery, exported.schema),
+    )
+    with exported.metrics.stage("upload"), open(exported.path, "rb") as fh:
+        job = client.load_table_from_file(fh, table_id, job_config=job_config)
+    # the upload is complete once the job is created
+    exported.path.unlink(missing_ok=True)
+    _logger.info(f"{exported.table_name}: Submitted load job for {table_id}")
+    return _RunningJob(job=job, exported=exported, table_id=table_id, started=time.monotonic())
+
+
+def load_bigquery(
+    client,
+    dataset: str,
+    members: Iterable[CsvMember],
+    options: ExportOptions,
+    jobs: int,
+    errors: List[str],
+    max_load_jobs: int = DEFAULT_MAX_LOAD_JOBS,
+    bigquery=None,
+    poll_interval: float = POLL_INTERVAL,
+    metrics: Optional[List[TableMetrics]] = None,
+) -> None:
+    """Loads MEMBERS into DATASET ("project.dataset") with CLIENT
+
+    Members are exported to Parquet by JOBS worker processes, largest
+    first.  At most MAX_LOAD_JOBS load jobs run at once, and at most JOBS
+    further members are exported ahead of them, which bounds the Parquet
+    files on disk.  BIGQUERY is the google.cloud.bigquery module (imported
+    if None).  Failures are logged and appended to ERRORS, and member metrics
+    to METRICS, if given.  The time from submission to completion of each
+    load job is recorded as its "load" stage.
+    """
+    if bigquery is None:
+        from google.cloud import bigquery
+
+    members = sorted(members, key=lambda m: m.file_size, reverse=True)
+    member_iter = iter(members)
+    exporting = {}  # future -> member
+    ready: List[ExportedMember] = []
+    running: List[_RunningJob] = []
+
+    with (
+        TemporaryDirectory(prefix="ppmidb-") as parquet_dir,
+        ProcessPoolExecutor(max_workers=jobs, mp_context=get_context("spawn")) as pool,
+    ):
+        while True:
+            while len(exporting) + len(ready) < jobs and (member := next(member_iter, None)):
+                exporting[pool.submit(export_member, member, Path(parquet_dir), options)] = member
+
+            for future in [f for f in exporting if f.done()]:
+                member = exporting.pop(future)
+                try:
+                    ready.append(future.result())
+                except Exception as e:
+                    _logger.error(f"Error exporting '{member.csv_path}': {e}")
+                    errors.append(member.table_name + " (" + str(e) + ")")
+
+            while ready and len(running) < max_load_jobs:
+                exported = ready.pop(0)
+                try:
+                    running.append(_submit_load(bigquery, client, dataset, exported))
+                except Exception as e:
+                    _logger.error(f"Error submitting load job for '{exported.table_name}': {e}")
+                    errors.append(exported.table_name + " (" + str(e) + ")")
+                    exported.path.unlink(missing_ok=True)
+                    if metrics is not None:
+                        metrics.append(exported.metrics)
+
+            for rj in [rj for rj in running if rj.job.done()]:
+                running.remove(rj)
+                rj.exported.metrics.stages["load"] = time.monotonic() - rj.started
+                if metrics is not None:
+                    metrics.append(rj.exported.metrics)
+                try:
+                    rj.job.result()
+                    _logger.info(
+                        f"{rj.exported.table_name}: Loaded into BigQuery table {rj.table_id} "
+                        f"({rj.exported.n_rows} rows, {time.monotonic() - rj.started:.1f}s)"
+                    )
+                except Exception as e:
+                    _logger.error(f"Error loading '{rj.exported.table_name}' into BigQuery: {e}")
+                    errors.append(rj.exported.table_name + " (" + str(e) + ")")
+
+            if not (exporting or ready or running):
+                break
+            if exporting and not running:
+                wait(exporting, return_when=FIRST_COMPLETED)
+            elif exporting:
+                wait(exporting, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            else:
+                time.sleep(poll_interval)
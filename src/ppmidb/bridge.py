@@ -0,0 +1,60 @@
+"""Materialized lookup tables for the bridge views
+
+The bridge views (misc/ppmi_bridge) decode coded values by joining
+against code_decode, a materialized, indexed view of code_list_v (the
+code list with the overlay applied) created by misc/overlays.sql, rather
+than by calling code_lookup() for every row and column.  Materialized
+views reflect the tables as of their last refresh, so they must be
+refreshed after a freeze is loaded or the overlays are edited.
+Materialized views that are populated and have a unique index, such as
+code_decode, are refreshed CONCURRENTLY, so that queries of the bridge
+views are not blocked during the refresh.
+"""
+
+import logging
+from typing import List
+
+_logger = logging.getLogger()
+
+DECODE_VIEW = "code_decode"
+
+
+def bridge_matviews(cur, schema: str) -> List[str]:
+    """Returns the materialized views in SCHEMA, code_decode first, since others may join against it"""
+    cur.execute("SELECT matviewname FROM pg_matviews WHERE schemaname = %s ORDER BY matviewname".encode(), (schema,))
+    return sorted((row[0] for row in cur.fetchall()), key=lambda name: name != DECODE_VIEW)
+
+
+def _can_refresh_concurrently(cur, schema: str, view_name: str) -> bool:
+    """Returns whether the materialized view is populated and has a unique index
+    without predicate or expressions, as REFRESH ... CONCURRENTLY requires"""
+    cur.execute(
+        """SELECT m.ispopulated AND EXISTS (
+            SELECT 1 FROM pg_index i
+            WHERE i.indrelid = format('%%I.%%I', m.schemaname, m.matviewname)::regclass
+            AND i.indisunique AND i.indisvalid AND i.indpred IS NULL AND i.indexprs IS NULL)
+        FROM pg_matviews m WHERE m.schemaname = %s AND m.matviewname = %s""".encode(),
+        (schema, view_name),
+    )
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def refresh_bridge(con, schema: str) -> List[str]:
+    """Refreshes and analyzes the materialized views in the bridge SCHEMA in one
+    transaction and returns their names"""
+    try:
+        with con.cursor() as cur:
+            views = bridge_matviews(cur, schema)
+            if not views:
+                raise RuntimeError(f"Schema {schema} has no materialized views; create them with misc/_load.sql")
+            for view_name in views:
+                concurrently = "CONCURRENTLY " if _can_refresh_concurrently(cur, schema, view_name) else ""
+                cur.execute(f'REFRESH MATERIALIZED VIEW {concurrently}"{schema}"."{view_name}"'.encode())
+                cur.execute(f'ANALYZE "{schema}"."{view_name}"'.encode())
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    _logger.info(f"Refreshed {len(views)} materialized views in {schema}: {', '.join(views)}")
+    return views
@@ -11,21 +11,51 @@ export PGPASSWORD=PG#4Zz...
 """
 
 
-import csv
-from io import StringIO
 import logging
 from pathlib import Path
 import re
-from typing import Generator, List, Optional, Tuple
-from zipfile import ZipFile
+import sys
+from tempfile import TemporaryDirectory
+from typing import List, Optional, Tuple
 
 import click
-import polars as pl
 
-from .infer_schema import infer_schema, clean_for_sql_name
+from .bigquery_loader import DEFAULT_MAX_LOAD_JOBS, load_bigquery
+from .bridge import refresh_bridge
+from .export import DEFAULT_ROW_GROUP_SIZE, ExportOptions, export_parallel, load_duckdb
+from .indexes import (
+    DEFAULT_INDEX_POLICY,
+    DEFAULT_WORKLOAD_LIMIT,
+    IndexPolicy,
+    load_index_policy,
+    plan_indexes,
+    read_workload,
+    suggest_from_workload,
+)
+from .infer_schema import TIGHT_TYPES, ColumnSchema, infer_schema_from_csv
+from .loader import COPY_FORMATS, LoadOptions, copy_query, expected_fingerprint, load_member, load_parallel
+from .manifest import ensure_manifest, log_reload_plan, plan_reload, read_manifest
+from .metrics import STAGES, TableMetrics, report_metrics
+from .partitions import DEFAULT_PARTITIONS, PartitionPolicy, partition_count
+from .rejects import DEFAULT_COPY_BATCH_ROWS, DEFAULT_MAX_REJECTED
+from .repair import DEFAULT_MAX_QUARANTINED
+from .schema_cache import SchemaCache, cached_infer, inference_variant
+from .schemas import (
+    DEFAULT_ALIAS_SCHEMA,
+    create_freeze_schema,
+    freeze_schema_name,
+    repoint_alias,
+    set_search_path,
+)
+from .shards import SHARD_COMPRESSIONS, SHARD_MANIFEST, ShardOptions, replay_parallel, write_shards_parallel
+from .sources import (
+    CsvMember,
+    member_generator,
+    split_header,
+    spool_chunks,
+)
 from .utils import generate_sql_create_table_ddl, schema_as_table
-
-PPMI_CSV_ENCODING = "cp1252"
+from .visits import build_visit_matrix
 
 
 _logger = logging.getLogger()
@@ -49,130 +79,419 @@ def cli(verbose):
     click.get_current_context().obj = {'verbose': verbose}
 
 
+def metrics_options(f):
+    """Adds the --metrics-out, --profile and --profile-dir options to a command"""
+    f = click.option("--profile-dir", type=click.Path(file_okay=False, path_type=Path), default=Path("profiles"),
+                show_default=True, help="Directory for --profile output.")(f)
+    f = click.option("--profile", "profile_stage", type=click.Choice(STAGES), default=None,
+                help="Run STAGE under cProfile and write <table>.<stage>.prof for each table.")(f)
+    f = click.option("--metrics-out", type=click.Path(dir_okay=False, path_type=Path), default=None,
+                help="Write per-table, per-stage timings, sizes, row counts and peak RSS as JSON lines.")(f)
+    return f
+
+
+def want_metrics(metrics_out: Optional[Path], profile_stage: Optional[str]) -> bool:
+    """Metrics are reported with --metrics-out, --profile or -v"""
+    return bool(metrics_out or profile_stage or click.get_current_context().obj["verbose"])
+
+
+def index_policy_option(f):
+    """Adds the --index-policy option to a command"""
+    return click.option("--index-policy", type=click.Path(exists=True, dir_okay=False, path_type=Path), default=None,
+                help="TOML file that chooses the indexes to create (see misc/index_policy.toml); "
+                "default: (patno, event_id) composite and patno; BRIN only when the policy sets brin_types.")(f)
+
+
+def partition_options(f):
+    """Adds the --partition-rows and --partitions options to a command"""
+    f = click.option("--partitions", type=click.IntRange(min=2), default=DEFAULT_PARTITIONS, show_default=True,
+                help="With --partition-rows, number of hash partitions.")(f)
+    f = click.option("--partition-rows", type=click.IntRange(min=1), default=None,
+                help="Create tables with a patno column and at least N rows PARTITION BY HASH (patno).")(f)
+    return f
+
+
+def tight_types_option(f):
+    """Adds the --tight-types option to a command"""
+    return click.option("--tight-types", type=click.Choice(TIGHT_TYPES + ["all"]), multiple=True,
+                help="Detect tighter types (repeatable): dates (MM/YYYY and other date text as DATE or TIMESTAMP), "
+                "flags (0/1 integers as BOOLEAN), codes (low-cardinality text as enums), or all.")(f)
+
+
+def expand_tight_types(tight_types: Tuple[str, ...]) -> Tuple[str, ...]:
+    return tuple(TIGHT_TYPES) if "all" in tight_types else tuple(sorted(set(tight_types)))
+
+
+def read_index_policy(path: Optional[Path]) -> IndexPolicy:
+    try:
+        return load_index_policy(path) if path else DEFAULT_INDEX_POLICY
+    except (OSError, ValueError, TypeError) as e:
+        raise click.BadParameter(str(e), param_hint="--index-policy")
+
+
+def infer_member_schema(
+    member: CsvMember,
+    member_metrics: TableMetrics,
+    infer_sample: Optional[int],
+    schema_cache: Optional[SchemaCache],
+    tight_types: Tuple[str, ...] = (),
+) -> List[ColumnSchema]:
+    """Infers the schema of MEMBER from a spooled copy, using SCHEMA_CACHE if given"""
+
+    def infer() -> List[ColumnSchema]:
+        with TemporaryDirectory(prefix="ppmidb-") as spool_dir:
+            spool_path = Path(spool_dir) / f"{member.table_name}.csv"
+            with member_metrics.stage("spool"):
+                spool_chunks(member.iter_chunks(timings=member_metrics.stages), spool_path)
+            with member_metrics.stage("infer"):
+                return infer_schema_from_csv(spool_path, sample_size=infer_sample, tight_types=tight_types)
+
+    try:
+        with member_metrics.stage("cache"):
+            return cached_infer(schema_cache, member, infer, inference_variant(tight_types, infer_sample))
+    except Exception as e:
+        csv_path = member.csv_path
+        header = member.read_header()
+        debug_info = f"""
+        {csv_path=}
+        {len(header)=}"""
+        raise RuntimeError(f"Error reading CSV file '{csv_path}': {e}" + "\n" + debug_info)
+
+
 @cli.command("generate-ddl")
 @click.argument('file_paths', nargs=-1, type=str)
 @click.option('--zip-file', "-z", type=click.Path(exists=True), default=None,
                 help='Optional zip file containing additional data.')
-def generate_ddl(file_paths: list[str], zip_file: Optional[Path]):
+@click.option("--infer-sample", type=click.IntRange(min=1), default=None,
+                help="Detect column types from a random sample of about N rows, then verify them over all rows.")
+@click.option("--no-schema-cache", is_flag=True, help="Always infer schemas instead of using the on-disk schema cache.")
+@tight_types_option
+@index_policy_option
+@partition_options
+@metrics_options
+def generate_ddl(file_paths: list[str], zip_file: Optional[Path], infer_sample: Optional[int], no_schema_cache: bool,
+                 tight_types: Tuple[str, ...], index_policy: Optional[Path], partition_rows: Optional[int],
+                 partitions: int, metrics_out: Optional[Path], profile_stage: Optional[str], profile_dir: Path):
     """Infer schema from CSV data and output DDL (CREATE TABLE and selected indexes)
     
+    Members are spooled to a temporary file and inferred without being
+    materialized in memory.  Inferred schemas are cached on disk, keyed by
+    member name, CRC32 and header.
     """
-    for csv_path, csv_content in file_generator(file_paths=file_paths, zip_file=zip_file):
-        table_name = Path(csv_path).stem
-        table_name = clean_for_sql_name(table_name)
-        table_name = re.sub(r"_\d{8}$", r"", table_name)
-
-        try:
-            df = pl.read_csv(
-                StringIO(csv_content),
-                has_header=True,
-                separator=",",
-                infer_schema_length=None,
-            )
-        except Exception as e:
-            header = next(StringIO(csv_content)).strip()
-            debug_info = f"""
-            {csv_path=}
-            {len(header)=}"""
-            raise RuntimeError(f"Error reading CSV file '{csv_path}': {e}" + "\n" + debug_info)
-
-        schema = infer_schema(df)
-        table = schema_as_table(schema)
-        table = re.sub(r"^(?=.)", "-- ", table, flags=re.MULTILINE)
-
-        print(
-            f"-- Schema inferred from {csv_path}\n"
-            + table
-            + "\n"
-            + generate_sql_create_table_ddl(
-                schema,
-                table_name,
-            )
+    schema_cache = None if no_schema_cache else SchemaCache()
+    policy = read_index_policy(index_policy)
+    partition_policy = PartitionPolicy(min_rows=partition_rows, partitions=partitions)
+    metrics = []
+
+    for member in member_generator(file_paths=file_paths, zip_file=zip_file):
+        csv_path = member.csv_path
+        table_name = member.table_name
+        member_metrics = TableMetrics(
+            table_name, bytes_in=member.file_size, profile_stage=profile_stage, profile_dir=profile_dir
         )
+        metrics.append(member_metrics)
+
+        schema = infer_member_schema(member, member_metrics, infer_sample, schema_cache, expand_tight_types(tight_types))
+
+        with member_metrics.stage("ddl"):
+            table = schema_as_table(schema)
+            table = re.sub(r"^(?=.)", "-- ", table, flags=re.MULTILINE)
+            ddl = (
+                f"-- Schema inferred from {csv_path}\n"
+                + table
+                + "\n"
+                + generate_sql_create_table_ddl(
+                    schema,
+                    table_name,
+                    index_policy=policy,
+                    partitions=partition_count(schema, partition_policy),
+                )
+            )
+        print(ddl)
+        member_metrics.bytes_out = len(ddl)
+
+    if want_metrics(metrics_out, profile_stage):
+        report_metrics(metrics, metrics_out)
 
 
 @cli.command("generate-dml")
 @click.argument('file_paths', nargs=-1, type=str)
 @click.option('--zip-file', "-z", type=click.Path(exists=True), default=None,
                 help='Optional zip file containing additional data.')
-def generate_dml(file_paths: list[str], zip_file: Optional[Path]):
+@click.option("--out-dir", type=click.Path(file_okay=False, path_type=Path), default=None,
+                help="Write compressed COPY scripts (shards) and a manifest.jsonl to this directory instead of stdout; "
+                "replay them with `ppmidb replay`.")
+@click.option("--compression", type=click.Choice(SHARD_COMPRESSIONS), default="gzip", show_default=True,
+                help="With --out-dir, compression of the shards.")
+@click.option("--compression-level", type=click.IntRange(min=1, max=22), default=None,
+                help="With --out-dir, gzip (1-9) or zstd (1-22) compression level.")
+@click.option("--shard-mb", type=click.IntRange(min=1), default=None,
+                help="With --out-dir, split members into shards of about N MB of CSV text; default: one per member.")
+@click.option("--jobs", "-j", type=click.IntRange(min=1), default=1,
+                help="With --out-dir, number of worker processes that write shards.")
+@metrics_options
+def generate_dml(file_paths: list[str], zip_file: Optional[Path], out_dir: Optional[Path], compression: str,
+                 compression_level: Optional[int], shard_mb: Optional[int], jobs: int, metrics_out: Optional[Path],
+                 profile_stage: Optional[str], profile_dir: Path):
     """Generate DML as COPY with inline data to load database"""
-    for csv_path, csv_content in file_generator(file_paths=file_paths, zip_file=zip_file):
-        table_name = Path(csv_path).stem
-        table_name = clean_for_sql_name(table_name)
-        table_name = re.sub(r"_\d{8}$", r"", table_name)
+    metrics = []
+    if out_dir:
+        errors = []
+        options = ShardOptions(
+            compression=compression,
+            compression_level=compression_level,
+            shard_bytes=shard_mb * 1_000_000 if shard_mb else None,
+            profile_stage=profile_stage,
+            profile_dir=profile_dir,
+        )
+        members = member_generator(file_paths=file_paths, zip_file=zip_file)
+        shards = write_shards_parallel(members, out_dir, options, jobs=jobs, errors=errors, metrics=metrics)
+        _logger.warning(f"Wrote {len(shards)} shards and {SHARD_MANIFEST} to {out_dir}")
+        if want_metrics(metrics_out, profile_stage):
+            report_metrics(metrics, metrics_out)
+        if errors:
+            _logger.critical(f"{len(errors)} members failed: {', '.join(errors)}")
+            return 1
+        return
+
+    for member in member_generator(file_paths=file_paths, zip_file=zip_file):
+        member_metrics = TableMetrics(
+            member.table_name, bytes_in=member.file_size, profile_stage=profile_stage, profile_dir=profile_dir
+        )
+        metrics.append(member_metrics)
+        with member_metrics.stage("write"):
+            header, chunks = split_header(member.iter_chunks(timings=member_metrics.stages))
+            print(copy_query(member.table_name, header) + ";")
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+                member_metrics.bytes_out += len(chunk)
+            print()
+            print("\\.")
 
-        header = next(csv.reader(StringIO(csv_content)))
-        columns = ','.join(map(lambda s: f'"{clean_for_sql_name(s)}"', header))
-        print(f"COPY {table_name} ({columns}) from STDIN with (format csv, header true);")
-        print(csv_content)
-        print("\\.")
+    if want_metrics(metrics_out, profile_stage):
+        report_metrics(metrics, metrics_out)
+
+
+@cli.command("advise-indexes")
+@click.argument('file_paths', nargs=-1, type=str)
+@click.option('--zip-file', "-z", type=click.Path(exists=True), default=None,
+                help='Optional zip file containing additional data.')
+@click.option("--infer-sample", type=click.IntRange(min=1), default=None,
+                help="Detect column types from a random sample of about N rows, then verify them over all rows.")
+@click.option("--no-schema-cache", is_flag=True, help="Always infer schemas instead of using the on-disk schema cache.")
+@tight_types_option
+@index_policy_option
+@click.option("--uri", type=str, default=None,
+                help="PostgreSQL database whose pg_stat_statements is read to suggest indexes for observed queries.")
+@click.option("--workload-limit", type=click.IntRange(min=1), default=DEFAULT_WORKLOAD_LIMIT, show_default=True,
+                help="With --uri, number of statements read, most expensive first.")
+def advise_indexes(file_paths: list[str], zip_file: Optional[Path], infer_sample: Optional[int], no_schema_cache: bool,
+                   tight_types: Tuple[str, ...], index_policy: Optional[Path], uri: Optional[str], workload_limit: int):
+    """Output the indexes planned for each member under the index policy, with the
+    reason for each, and (with --uri) further indexes suggested by the workload"""
+    schema_cache = None if no_schema_cache else SchemaCache()
+    policy = read_index_policy(index_policy)
+    planned = {}
+    columns_by_table = {}
+
+    for member in member_generator(file_paths=file_paths, zip_file=zip_file):
+        table_name = member.table_name
+        schema = infer_member_schema(
+            member, TableMetrics(table_name), infer_sample, schema_cache, expand_tight_types(tight_types)
+        )
+        planned[table_name] = plan_indexes(schema, policy)
+        columns_by_table[table_name] = [col.sql_name for col in schema]
+        print(f"-- {table_name}")
+        for spec in planned[table_name]:
+            print(f"-- {spec.reason}\n{spec.ddl(table_name)}", end="")
+        print()
+
+    if uri:
+        import psycopg
+
+        with psycopg.connect(uri) as con:
+            workload = read_workload(con, limit=workload_limit)
+        suggestions = suggest_from_workload(workload, columns_by_table, planned)
+        print(f"-- {len(suggestions)} indexes suggested by {len(workload)} statements in pg_stat_statements")
+        for suggestion in suggestions:
+            print(f"-- {suggestion.spec.reason}\n{suggestion.spec.ddl(suggestion.table_name)}", end="")
 
 
 @cli.command("load")
 @click.option("--uri", type=str, required=True)
 @click.option("--create-table", "-t", is_flag=True)
+@click.option("--stream", is_flag=True,
+                help="With --create-table, spool members to disk and infer schemas without materializing them.")
+@click.option("--infer-sample", type=click.IntRange(min=1), default=None,
+                help="With --stream, detect column types from a random sample of about N rows, then verify them over all rows.")
+@click.option("--jobs", "-j", type=click.IntRange(min=1), default=1,
+                help="Number of worker processes and database connections used to load members in parallel.")
+@click.option("--copy-format", type=click.Choice(COPY_FORMATS), default="csv", show_default=True,
+                help="COPY format; binary sends typed rows using the inferred schema and requires --create-table.")
+@click.option("--no-schema-cache", is_flag=True, help="Always infer schemas instead of using the on-disk schema cache.")
+@click.option("--bulk", is_flag=True,
+                help="With --create-table, COPY into UNLOGGED staging tables without indexes, then build indexes, ANALYZE, "
+                "set LOGGED and swap each table into place.")
+@click.option("--maintenance-work-mem", type=str, default=None,
+                help="With --bulk, maintenance_work_mem for index builds (e.g., 1GB).")
+@click.option("--schema", type=str, default=None,
+                help="Load into this schema (PostgreSQL only), then point the --alias schema at it; "
+                "'auto' derives ppmi_YYYYMMDD from the zip file name.")
+@click.option("--alias", type=str, default=DEFAULT_ALIAS_SCHEMA, show_default=True,
+                help="With --schema, the stable schema of views that is repointed once loading succeeds; empty to skip.")
+@click.option("--row-group-size", type=click.IntRange(min=1), default=DEFAULT_ROW_GROUP_SIZE, show_default=True,
+                help="Rows per row group when writing Parquet (parquet:// and duckdb:// targets).")
+@click.option("--compression-level", type=click.IntRange(min=1, max=22), default=None,
+                help="zstd compression level when writing Parquet.")
+@click.option("--max-load-jobs", type=click.IntRange(min=1), default=DEFAULT_MAX_LOAD_JOBS, show_default=True,
+                help="Maximum number of concurrent BigQuery load jobs.")
+@click.option("--quarantine", is_flag=True,
+                help="Remove records with unbalanced quotes or the wrong number of fields and keep them in the "
+                "_ppmidb_quarantine table (PostgreSQL) or <table>.quarantine.csv files, instead of failing the member.")
+@click.option("--max-quarantined", type=click.IntRange(min=0), default=DEFAULT_MAX_QUARANTINED, show_default=True,
+                help="With --quarantine, fail a member with more malformed records than this.")
+@click.option("--quarantine-dir", type=click.Path(file_okay=False, path_type=Path), default=None,
+                help="With --quarantine, where quarantine files are written; default: the parquet:// directory, "
+                "otherwise the current directory.")
+@click.option("--reject-errors", is_flag=True,
+                help="COPY in batches within savepoints; rows that PostgreSQL rejects are isolated by bisecting the "
+                "failed batch and stored with the error in the _ppmidb_rejects table, instead of failing the member.")
+@click.option("--copy-batch-rows", type=click.IntRange(min=1), default=DEFAULT_COPY_BATCH_ROWS, show_default=True,
+                help="With --reject-errors, rows per COPY batch.")
+@click.option("--copy-batch-bytes", type=click.IntRange(min=1), default=None,
+                help="With --reject-errors, also cut text batches at this many bytes.")
+@click.option("--max-rejected", type=click.IntRange(min=0), default=DEFAULT_MAX_REJECTED, show_default=True,
+                help="With --reject-errors, fail a member with more rejected rows than this.")
+@tight_types_option
+@index_policy_option
+@partition_options
+@click.option("--refresh-bridge", "bridge_schema", type=str, default=None,
+                help="After a load without errors, refresh the materialized views (e.g., code_decode) in this bridge schema.")
+@metrics_options
+@click.option("--incremental", is_flag=True,
+                help="Skip members whose CRC32 and size match the manifest in the target database; reload changed members.")
+@click.option("--delta", is_flag=True,
+                help="Like --incremental, but MERGE only the inserted, updated and deleted rows of changed members into "
+                "their tables (matched on rec_id, else patno, event_id, pag_name); requires PostgreSQL 17.")
 @click.argument('file_paths', nargs=-1, type=str)
 @click.option('--zip-file', "-z", type=click.Path(exists=True), default=None,
                 help='Optional zip file containing additional data.')
-def load(uri: str, zip_file: str, file_paths: list, create_table: bool):
+def load(uri: str, zip_file: str, file_paths: list, create_table: bool, stream: bool, infer_sample: Optional[int],
+         jobs: int, copy_format: str, no_schema_cache: bool, bulk: bool, maintenance_work_mem: Optional[str],
+         schema: Optional[str], alias: str, row_group_size: int, compression_level: Optional[int], max_load_jobs: int,
+         quarantine: bool, max_quarantined: int, quarantine_dir: Optional[Path],
+         reject_errors: bool, copy_batch_rows: int, copy_batch_bytes: Optional[int], max_rejected: int,
+         tight_types: Tuple[str, ...], index_policy: Optional[Path], partition_rows: Optional[int], partitions: int,
+         bridge_schema: Optional[str],
+         metrics_out: Optional[Path], profile_stage: Optional[str], profile_dir: Path, incremental: bool,
+         delta: bool):
     """Load zipfile specified by ZIPFILE_PATH into database specified by --uri.  By default, all *.csv files
     in the zipfile are loaded. FILES, if specified,
-    is used to filter data to be loaded."""
+    is used to filter data to be loaded.
+
+    --uri may also be parquet://DIRECTORY, to write one typed, zstd-compressed
+    Parquet file per member, or duckdb://FILE.db, to load the Parquet files
+    into a DuckDB database."""
     errors = []
+    metrics = []
+
+    if copy_format == "binary" and not create_table:
+        raise click.UsageError("--copy-format binary requires --create-table")
+    if bulk and not create_table:
+        raise click.UsageError("--bulk requires --create-table")
+    if bulk and delta:
+        raise click.UsageError("--bulk and --delta are mutually exclusive")
+    incremental = incremental or delta
+    if schema == "auto":
+        schema = freeze_schema_name(zip_file) if zip_file else None
+        if schema is None:
+            raise click.UsageError("--schema auto requires a zip file with the freeze date (YYYYMMDD) in its name")
+    options = LoadOptions(
+        create_table=create_table,
+        copy_format=copy_format,
+        incremental=incremental,
+        stream=stream,
+        infer_sample=infer_sample,
+        schema_cache=None if no_schema_cache else SchemaCache(),
+        bulk=bulk,
+        maintenance_work_mem=maintenance_work_mem,
+        profile_stage=profile_stage,
+        profile_dir=profile_dir,
+        quarantine=quarantine,
+        max_quarantined=max_quarantined,
+        reject_errors=reject_errors,
+        copy_batch_rows=copy_batch_rows,
+        copy_batch_bytes=copy_batch_bytes,
+        max_rejected=max_rejected,
+        index_policy=read_index_policy(index_policy),
+        tight_types=expand_tight_types(tight_types),
+        delta=delta,
+        partition_policy=PartitionPolicy(min_rows=partition_rows, partitions=partitions),
+    )
+
+    export_options = ExportOptions(
+        row_group_size=row_group_size,
+        compression_level=compression_level,
+        infer_sample=infer_sample,
+        tight_types=options.tight_types,
+        schema_cache=options.schema_cache,
+        profile_stage=profile_stage,
+        profile_dir=profile_dir,
+        quarantine=quarantine,
+        max_quarantined=max_quarantined,
+        quarantine_dir=quarantine_dir or (None if uri.startswith("parquet://") else Path(".")),
+    )
 
     if uri.startswith("postgresql://"):
         import psycopg
+
+        members = member_generator(file_paths=file_paths, zip_file=zip_file)
         con = psycopg.connect(uri)
+        if schema:
+            try:
+                create_freeze_schema(con, schema, allow_existing=incremental)
+            except RuntimeError as e:
+                _logger.critical(str(e))
+                con.close()
+                return 1
+            set_search_path(con, schema)
+            _logger.info(f"Loading into schema {schema}")
+        ensure_manifest(con)
+        con.commit()
+        if incremental:
+            plan = plan_reload(
+                members,
+                read_manifest(con),
+                complete=bool(zip_file) and not file_paths,
+                fingerprint=lambda member: expected_fingerprint(member, options),
+            )
+            log_reload_plan(plan)
+            members = plan.to_load
 
-        for csv_path, csv_content in file_generator(file_paths=file_paths, zip_file=zip_file):
-            table_name = Path(csv_path).stem
-            table_name = clean_for_sql_name(table_name)
-            table_name = re.sub(r"_\d{8}$", r"", table_name)
-
-            if create_table:
-                try:
-                    df = pl.read_csv(
-                        StringIO(csv_content),
-                        has_header=True,
-                        separator=",",
-                        infer_schema_length=None,
-                    )
-                except Exception as e:
-                    header = next(StringIO(csv_content)).strip()
-                    debug_info = f"""
-                    {csv_path=}
-                    {len(header)=}"""
-                    _logger.warning(f"Error reading CSV file '{csv_path}': {e}" + "\n" + debug_info)
-                    errors.append(table_name + " (" + str(e) + ")")
-                    continue
-                schema = infer_schema(df)
-                schema_ddl = generate_sql_create_table_ddl(schema, table_name)
-                with con.cursor() as cur:
-                    cur.execute(schema_ddl.encode())
-                    con.commit()
-
-            csv_rdr = csv.reader(StringIO(csv_content))
-            header = next(csv_rdr)
-            columns = ','.join(map(lambda s: f'"{clean_for_sql_name(s)}"', header))
-            query = f"COPY {table_name} ({columns.lower()}) from STDIN"
-            query += " WITH (FORMAT CSV, HEADER)"
+        if jobs > 1:
+            con.close()
+            load_parallel(uri, members, options=options, jobs=jobs, errors=errors, schema=schema, metrics=metrics)
+            con = psycopg.connect(uri)
+        else:
+            for member in members:
+                load_member(con, member, options=options, errors=errors, metrics=metrics)
 
-            try:
-                with con.cursor().copy(query.encode()) as copy:
-                    copy.write(csv_content)
-                con.commit()
-                _logger.info(f"{table_name}: Loaded and committed")
-            except Exception as e:
-                con.cancel()
-                header = next(StringIO(csv_content)).strip()
-                debug_info = f"""
-                {csv_path=}
-                {len(header)=}"""
-                if len(header) == 1024:
-                    debug_info += "\nThe header appears to be truncated and the file is likely corrupt"
-                _logger.error(f"Error loading '{csv_path}': {e}" + "\n" + debug_info)
-                errors.append(table_name + " (" + str(e) + ")")
+        try:
+            if schema and alias:
+                if errors:
+                    _logger.error(f"Alias schema {alias} was not repointed because {schema} has errors")
+                else:
+                    repoint_alias(con, alias, schema)
+            if bridge_schema:
+                if errors:
+                    _logger.error(f"Bridge schema {bridge_schema} was not refreshed because the load has errors")
+                else:
+                    refresh_bridge(con, bridge_schema)
+        except RuntimeError as e:
+            _logger.critical(str(e))
+            return 1
+        finally:
+            con.close()
     elif uri.startswith("bigquery://"):
         from google.cloud import bigquery
         # Extract project and dataset from the URI
@@ -186,95 +505,109 @@ def load(uri: str, zip_file: str, file_paths: list, create_table: bool):
             return 1
 
         client = bigquery.Client(project=project_id)
-        
-        for csv_path, csv_content in file_generator(file_paths=file_paths, zip_file=zip_file):
-            table_name = Path(csv_path).stem
-            table_name = clean_for_sql_name(table_name)
-            table_name = re.sub(r"_\d{8}$", r"", table_name)
-
-            table_id = f"{project_id}.{dataset_id}.{table_name}"
-            job_config = bigquery.LoadJobConfig(
-                source_format=bigquery.SourceFormat.CSV,
-                skip_leading_rows=1, # Assuming header is always present
-                autodetect=True, # Autodetect schema
-            )
+        load_bigquery(
+            client,
+            f"{project_id}.{dataset_id}",
+            member_generator(file_paths=file_paths, zip_file=zip_file),
+            options=export_options,
+            jobs=jobs,
+            errors=errors,
+            max_load_jobs=max_load_jobs,
+            bigquery=bigquery,
+            metrics=metrics,
+        )
 
-            try:
-                # BigQuery client expects bytes-like object or a file-like object
-                # We need to re-read the string content as bytes for the load job
-                csv_file_obj = StringIO(csv_content)
-                job = client.load_table_from_file(csv_file_obj, table_id, job_config=job_config)
-                job.result() # Waits for the job to complete
-                _logger.info(f"{table_name}: Loaded into BigQuery table {table_id}")
-            except Exception as e:
-                _logger.error(f"Error loading '{csv_path}' into BigQuery: {e}")
-                errors.append(table_name + " (" + str(e) + ")")
+    elif uri.startswith("parquet://") or uri.startswith("duckdb://"):
+        members = member_generator(file_paths=file_paths, zip_file=zip_file)
+        if uri.startswith("parquet://"):
+            export_parallel(
+                members, Path(uri[len("parquet://"):]), export_options, jobs=jobs, errors=errors, metrics=metrics
+            )
+        else:
+            db_path = Path(uri[len("duckdb://"):])
+            with TemporaryDirectory(prefix="ppmidb-", dir=db_path.parent) as parquet_dir:
+                exported = export_parallel(
+                    members, Path(parquet_dir), export_options, jobs=jobs, errors=errors, metrics=metrics
+                )
+                load_duckdb(str(db_path), exported, errors)
 
     else:
         _logger.critical(f"Unsupported database URI scheme: {uri}")
         return 1
-        
+
+    if want_metrics(metrics_out, profile_stage):
+        report_metrics(metrics, metrics_out)
     if errors:
         _logger.critical("\n. ".join([f"{len(errors)} errors:"] + errors))
         return 1
 
 
-def file_generator(file_paths: List[str], zip_file: Optional[Path]) -> Generator[Tuple[str, str]]:
-    if zip_file:
-        yield from zip_file_generator(zipfile_path=zip_file, file_paths=file_paths)
-    else:
-        yield from local_file_generator(file_paths)
+@cli.command("set-alias")
+@click.option("--uri", type=str, required=True)
+@click.option("--alias", type=str, default=DEFAULT_ALIAS_SCHEMA, show_default=True)
+@click.argument("schema", type=str)
+def set_alias(uri: str, alias: str, schema: str):
+    """Point the alias schema at the freeze SCHEMA, e.g., to roll back to a previous freeze"""
+    import psycopg
 
-def local_file_generator(file_paths: List[str]) -> Generator[Tuple[str, str]]:
-    """
-    Yields (path, content) tuples for each file in FILE_PATHS.  The content is
-    decoded and processed to fix known bugs in the CSV files
+    with psycopg.connect(uri) as con:
+        try:
+            repoint_alias(con, alias, schema)
+        except RuntimeError as e:
+            _logger.critical(str(e))
+            return 1
 
-    Args:
-        file_paths: A list of string paths to the files to read.
 
-    Yields:
-        A tuple where the first element is the file path (str) and the second
-        element is the content of the file (str).
-    """
+@cli.command("refresh-bridge")
+@click.option("--uri", type=str, required=True)
+@click.argument("schema", type=str)
+def refresh_bridge_command(uri: str, schema: str):
+    """Refresh the decode table and other materialized views in the bridge SCHEMA
+    after loading a freeze or editing the overlays"""
+    import psycopg
 
-    for csv_path in file_paths:
-        csv_content = open(csv_path, encoding=PPMI_CSV_ENCODING).read()
-        csv_content = fix_csv_content(csv_path=csv_path, csv_content=csv_content)
-        yield (csv_path, csv_content)
+    with psycopg.connect(uri) as con:
+        try:
+            refresh_bridge(con, schema)
+        except RuntimeError as e:
+            _logger.critical(str(e))
+            return 1
 
-def zip_file_generator(zipfile_path: str, file_paths: List[str]) -> Generator[Tuple[str, str]]:
-    """
-    Yields (path, content) tuples for each file in the archive ZIPFILE_PATH.
-    The content is decoded and processed to fix known bugs in the CSV files.  By default, all files
-    are extracted; if FILE_PATHS is not empty, only the named files are extracted.
 
-    Args:
-        zipfile_path: The string path to a zipfile.
-        file_paths: A list of string paths to the files to read.
+@cli.command("replay")
+@click.option("--uri", type=str, required=True)
+@click.option("--schema", type=str, default=None, help="Schema of the tables; default: the search path of --uri.")
+@click.option("--jobs", "-j", type=click.IntRange(min=1), default=1,
+                help="Number of database connections that replay shards in parallel.")
+@click.argument("out_dir", type=click.Path(exists=True, file_okay=False, path_type=Path))
+def replay_command(uri: str, schema: Optional[str], jobs: int, out_dir: Path):
+    """Replay the shards written by generate-dml --out-dir OUT_DIR into existing tables,
+    skipping shards that were already replayed"""
+    errors = []
+    n_rows = replay_parallel(uri, out_dir, jobs=jobs, errors=errors, schema=schema)
+    _logger.warning(f"Replayed {n_rows} rows from {out_dir}")
+    if errors:
+        _logger.critical(f"{len(errors)} shards failed: {', '.join(errors)}")
+        return 1
 
-    Yields:
-        A tuple where the first element is the file path (str) and the second
-        element is the content of the file (str).
-    """
 
-    file_set = set(file_paths)
-
-    zf = ZipFile(zipfile_path)
-    for zi in zf.filelist:
-        csv_path = zi.filename
-        if file_set and csv_path not in file_set:
-            _logger.debug(f"{csv_path}: Not in requested files")
-            continue
-        csv_content = fix_csv_content(csv_path, zf.read(zi).decode(PPMI_CSV_ENCODING))
-        yield (csv_path, csv_content)
-
-def fix_csv_content(csv_path: str, csv_content: str) -> str:
-    csv_content = csv_content.replace('\\"', '""').strip()
-    if "Primary_Clinical_Diagnosis_" in csv_path:
-        # In Primary_Clinical_Diagnosis_20250401.csv at least, the CSV is invalid
-        csv_content = csv_content.replace('no tremors today. \\"",,"3",', 'no tremors today.",,"3",')
-    return csv_content
+@cli.command("build-visit-matrix")
+@click.option("--uri", type=str, required=True)
+@click.option("--schema", type=str, default=None,
+                help="Schema of the freeze tables (e.g., ppmi_20250401); default: the search path of --uri.")
+@click.option("--table", "tables", type=str, multiple=True,
+                help="Source table to include (repeatable); default: all tables with patno and event_id columns.")
+@click.option("--jobs", "-j", type=click.IntRange(min=1), default=1,
+                help="Number of database connections used to build the per-table visit tables in parallel.")
+@click.option("--full", is_flag=True, help="Rebuild the matrix instead of refreshing the patients whose rows changed.")
+def build_visit_matrix_command(uri: str, schema: Optional[str], tables: Tuple[str, ...], jobs: int, full: bool):
+    """Build or refresh patient_visit, one indexed row per (patno, event_id) with the
+    columns of all source tables, prefixed with their table names"""
+    try:
+        build_visit_matrix(uri, schema=schema, tables=tables or None, jobs=jobs, full=full)
+    except (RuntimeError, ValueError) as e:
+        _logger.critical(str(e))
+        return 1
 
 
 if __name__ == "__main__":
@@ -0,0 +1,203 @@
+"""Row-level delta loads between freezes
+
+Even within a member that changed, most rows of a new freeze match the
+previous one.  In delta mode, a member whose table was loaded before with
+the same schema is copied into a temporary table like the live table,
+and a single MERGE applies only the differences to the live table:
+
+* rows whose key is not in the live table are inserted
+* matched rows whose values differ are updated
+* live rows whose key is not in the member are deleted
+
+Rows are matched on the first of DELTA_KEYS whose columns exist and are
+unique and non-null in both tables.  If there is no such key, the live
+table is truncated and refilled from the temporary table, in the same
+transaction.  Either way, the live table keeps its indexes and the views
+that depend on it.
+
+MERGE with WHEN NOT MATCHED BY SOURCE and RETURNING (here, in a WITH query that
+counts the actions) requires PostgreSQL 17.
+Change counts are stored in the _ppmidb_deltas table of the target
+database, in the member's transaction.
+"""
+
+from dataclasses import dataclass
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+_logger = logging.getLogger()
+
+DELTAS_TABLE = "_ppmidb_deltas"
+
+# Appended to table names for the temporary tables that members are copied into
+DELTA_SUFFIX = "__delta"
+
+# Candidate row keys, in order of preference
+DELTA_KEYS = [("rec_id",), ("patno", "event_id", "pag_name")]
+
+DELTAS_DDL = f"""CREATE TABLE IF NOT EXISTS "{DELTAS_TABLE}" (
+    "table_name" TEXT NOT NULL,
+    "member_name" TEXT NOT NULL,
+    "row_key" TEXT NULL,
+    "inserted" BIGINT NOT NULL,
+    "updated" BIGINT NOT NULL,
+    "deleted" BIGINT NOT NULL,
+    "applied_at" TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+);
+"""
+
+
+@dataclass
+class DeltaCounts:
+    inserted: int = 0
+    updated: int = 0
+    deleted: int = 0
+    key: Optional[Tuple[str, ...]] = None  # None if the table was replaced
+
+    def __str__(self) -> str:
+        return f"{self.inserted} inserted, {self.updated} updated, {self.deleted} deleted"
+
+
+def create_delta_table(cur, table_name: str) -> str:
+    """Creates an empty temporary table like TABLE_NAME, without indexes, that is
+    dropped at the end of the transaction, and returns its name"""
+    delta_name = table_name + DELTA_SUFFIX
+    cur.execute(f'DROP TABLE IF EXISTS pg_temp."{delta_name}"'.encode())
+    cur.execute(f'CREATE TEMPORARY TABLE "{delta_name}" (LIKE "{table_name}") ON COMMIT DROP'.encode())
+    return delta_name
+
+
+def table_columns(cur, table_name: str) -> List[str]:
+    """Returns the column names of TABLE_NAME in order"""
+    cur.execute(
+        """SELECT attname FROM pg_attribute
+        WHERE attrelid = to_regclass(%s) AND attnum > 0 AND NOT attisdropped
+        ORDER BY attnum""".encode(),
+        (f'"{table_name}"',),
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+def _quoted(columns: Sequence[str], alias: str = "") -> str:
+    prefix = f"{alias}." if alias else ""
+    return ", ".join(f'{prefix}"{col}"' for col in columns)
+
+
+def _unique_keys(cur, table_name: str, keys: Sequence[Tuple[str, ...]]) -> List[Tuple[str, ...]]:
+    """Returns the KEYS that are unique and non-null in TABLE_NAME, in one scan"""
+    checks = []
+    for key in keys:
+        not_null = " AND ".join(f'"{col}" IS NOT NULL' for col in key)
+        checks.append(f"count(*) = count(DISTINCT ROW({_quoted(key)})) AND coalesce(bool_and({not_null}), true)")
+    cur.execute(f'SELECT {", ".join(checks)} FROM "{table_name}"'.encode())
+    row = cur.fetchone()
+    return [key for key, unique in zip(keys, row) if unique]
+
+
+def _indexed_unique_keys(cur, table_name: str, keys: Sequence[Tuple[str, ...]]) -> List[Tuple[str, ...]]:
+    """Returns the KEYS that a unique index of TABLE_NAME on non-null columns (a subset
+    of the key's) guarantees to be unique, without scanning the table"""
+    cur.execute(
+        """SELECT array_agg(a.attname) FROM pg_index i
+        CROSS JOIN LATERAL unnest(i.indkey) WITH ORDINALITY AS k(attnum, n)
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+        WHERE i.indrelid = to_regclass(%s) AND i.indisunique AND i.indisvalid AND i.indpred IS NULL
+        AND k.n <= i.indnkeyatts
+        GROUP BY i.indexrelid
+        HAVING bool_and(a.attnotnull)""".encode(),
+        (f'"{table_name}"',),
+    )
+    indexed = [set(row[0]) for row in cur.fetchall()]
+    return [key for key in keys if any(columns <= set(key) for columns in indexed)]
+
+
+def choose_key(cur, table_name: str, delta_name: str, columns: Sequence[str]) -> Optional[Tuple[str, ...]]:
+    """Returns the first of DELTA_KEYS that exists in COLUMNS and is unique and
+    non-null in both TABLE_NAME and DELTA_NAME, or None.  DELTA_NAME is scanned
+    once; TABLE_NAME is scanned once only if its unique indexes do not
+    guarantee any of the keys."""
+    keys = [key for key in DELTA_KEYS if all(col in columns for col in key)]
+    if keys:
+        keys = _unique_keys(cur, delta_name, keys)
+    if not keys:
+        return None
+    live_keys = _indexed_unique_keys(cur, table_name, keys)
+    if not live_keys:
+        live_keys = _unique_keys(cur, table_name, keys)
+    return next((key for key in keys if key in live_keys), None)
+
+
+def merge_delta(cur, table_name: str, delta_name: str, columns: Sequence[str], key: Sequence[str]) -> DeltaCounts:
+    """Applies the differences between DELTA_NAME and TABLE_NAME, matched on KEY, to
+    TABLE_NAME in one MERGE and returns the change counts"""
+    on = " AND ".join(f't."{col}" = d."{col}"' for col in key)
+    values = [col for col in columns if col not in key]
+    set_values = ", ".join(f'"{col}" = d."{col}"' for col in values)
+    when_matched = (
+        f"WHEN MATCHED AND ROW({_quoted(values, 't')}) IS DISTINCT FROM ROW({_quoted(values, 'd')}) "
+        f"THEN UPDATE SET {set_values}"
+        if values
+        else ""
+    )
+    # the actions are counted by the server rather than returned row by row
+    cur.execute(
+        f"""WITH m AS (
+            MERGE INTO "{table_name}" AS t USING "{delta_name}" AS d ON {on}
+            {when_matched}
+            WHEN NOT MATCHED BY TARGET THEN INSERT ({_quoted(columns)}) VALUES ({_quoted(columns, 'd')})
+            WHEN NOT MATCHED BY SOURCE THEN DELETE
+            RETURNING merge_action() AS action
+        )
+        SELECT action, count(*) FROM m GROUP BY action""".encode()
+    )
+    actions = dict(cur.fetchall())
+    return DeltaCounts(actions.get("INSERT", 0), actions.get("UPDATE", 0), actions.get("DELETE", 0), tuple(key))
+
+
+def replace_from_delta(cur, table_name: str, delta_name: str, columns: Sequence[str]) -> DeltaCounts:
+    """Replaces the rows of TABLE_NAME with those of DELTA_NAME and returns the change counts"""
+    cur.execute(f'SELECT count(*) FROM "{table_name}"'.encode())
+    deleted = cur.fetchone()[0]
+    cur.execute(f'TRUNCATE "{table_name}"'.encode())
+    cur.execute(
+        f'INSERT INTO "{table_name}" ({_quoted(columns)}) SELECT {_quoted(columns)} FROM "{delta_name}"'.encode()
+    )
+    return DeltaCounts(inserted=cur.rowcount, deleted=deleted)
+
+
+def apply_delta(cur, table_name: str, delta_name: str) -> DeltaCounts:
+    """Applies the rows copied into DELTA_NAME to TABLE_NAME (see module
+    docstring) and returns the change counts.  The caller commits."""
+    columns = table_columns(cur, table_name)
+    cur.execute(f'ANALYZE "{delta_name}"'.encode())
+    key = choose_key(cur, table_name, delta_name, columns)
+    if key is None:
+        keys = " or ".join("(" + ", ".join(key) + ")" for key in DELTA_KEYS)
+        _logger.warning(f"{table_name}: No unique row key {keys}; replacing all rows")
+        return replace_from_delta(cur, table_name, delta_name, columns)
+    return merge_delta(cur, table_name, delta_name, columns, key)
+
+
+def ensure_deltas_table(con) -> None:
+    with con.cursor() as cur:
+        cur.execute(DELTAS_DDL.encode())
+
+
+def record_delta(con, table_name: str, member_name: str, counts: DeltaCounts) -> None:
+    """Appends the change counts of a delta load of TABLE_NAME to the deltas table.
+    The caller commits, so that the counts are written in the same transaction as the data."""
+    ensure_deltas_table(con)
+    _logger.info(f"{table_name}: Delta applied ({counts})")
+    with con.cursor() as cur:
+        cur.execute(
+            f'INSERT INTO "{DELTAS_TABLE}" (table_name, member_name, row_key, inserted, updated, deleted) '
+            f"VALUES (%s, %s, %s, %s, %s, %s)".encode(),
+            (
+                table_name,
+                member_name,
+                ",".join(counts.key) if counts.key else None,
+                counts.inserted,
+                counts.updated,
+                counts.deleted,
+            ),
+        )
@@ -0,0 +1,198 @@
+"""Export members to Parquet files or a DuckDB database
+
+Each member is spooled to a temporary file, its schema is inferred
+without materializing it, and the spooled text is scanned with the
+inferred types and streamed into a zstd-compressed Parquet file.  Columns
+are renamed to their SQL names and cast to the narrowest type chosen by
+get_optimal_sql_type (e.g., Int16 for SMALLINT), so memory use is bounded
+by the streaming engine rather than by the size of the member.
+
+Members are exported in parallel worker processes.  A DuckDB database is
+built from the exported files with CREATE TABLE ... AS SELECT, which
+DuckDB also streams.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+import logging
+from multiprocessing import get_context
+from pathlib import Path
+import re
+from tempfile import TemporaryDirectory
+from typing import Iterable, List, Optional, Tuple
+
+import polars as pl
+
+from .infer_schema import ColumnSchema, convert_column, infer_schema_from_csv, read_overrides
+from .metrics import TableMetrics
+from .repair import DEFAULT_MAX_QUARANTINED, RecordValidator, iter_valid_chunks, log_quarantined, write_quarantine_file
+from .schema_cache import SchemaCache, cached_infer, inference_variant
+from .sources import CsvMember, spool_chunks
+
+_logger = logging.getLogger()
+
+PARQUET_COMPRESSION = "zstd"
+DEFAULT_ROW_GROUP_SIZE = 100_000
+
+# Polars types written for the base SQL types chosen by get_optimal_sql_type
+PARQUET_TYPES = {
+    "SMALLINT": pl.Int16,
+    "INTEGER": pl.Int32,
+    "BIGINT": pl.Int64,
+    "REAL": pl.Float32,
+    "DOUBLE PRECISION": pl.Float64,
+    "BOOLEAN": pl.Boolean,
+    "DATE": pl.Date,
+    "TIME": pl.Time,
+    "TEXT": pl.String,
+}
+
+
+@dataclass
+class ExportedMember:
+    """A member written to a Parquet file"""
+
+    table_name: str
+    path: Path
+    n_rows: int
+    schema: List[ColumnSchema]
+    metrics: Optional[TableMetrics] = None
+
+
+@dataclass(frozen=True)
+class ExportOptions:
+    """Options that control how members are written to Parquet"""
+
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE  # rows per Parquet row group
+    compression_level: Optional[int] = None  # zstd level; None for the Polars default
+    infer_sample: Optional[int] = None  # rows sampled for type detection; None for all
+    tight_types: Tuple[str, ...] = ()  # see infer_schema.TIGHT_TYPES
+    schema_cache: Optional[SchemaCache] = None  # consulted before inferring schemas
+    profile_stage: Optional[str] = None  # stage to run under cProfile (see metrics.STAGES)
+    profile_dir: Optional[Path] = None
+    quarantine: bool = False  # remove malformed records and write them to a quarantine file
+    max_quarantined: int = DEFAULT_MAX_QUARANTINED  # a member with more malformed records fails
+    quarantine_dir: Optional[Path] = None  # where <table_name>.quarantine.csv is written; default: OUT_DIR
+
+
+def parquet_type(col: ColumnSchema) -> pl.DataType:
+    """Returns the Polars type used to write COL, falling back to its inferred type"""
+    base_type = re.sub(r"\s+(NOT\s+)?NULL$", "", col.sql_type)
+    return PARQUET_TYPES.get(base_type, col.polars_type)
+
+
+def export_member(member: CsvMember, out_dir: Path, options: ExportOptions) -> ExportedMember:
+    """Writes MEMBER to OUT_DIR/<table_name>.parquet.  The file is written
+    under a temporary name and renamed when complete, so a failed export
+    never leaves a partial file behind.  With options.quarantine, malformed
+    records are removed and written to <table_name>.quarantine.csv.
+
+    This function is run in worker processes.
+    """
+    table_name = member.table_name
+    out_path = Path(out_dir) / f"{table_name}.parquet"
+    tmp_path = out_path.with_suffix(".parquet.tmp")
+    metrics = TableMetrics(
+        table_name=table_name,
+        bytes_in=member.file_size,
+        profile_stage=options.profile_stage,
+        profile_dir=options.profile_dir,
+    )
+
+    with TemporaryDirectory(prefix="ppmidb-") as spool_dir:
+        spool_path = Path(spool_dir) / f"{table_name}.csv"
+        with metrics.stage("spool"):
+            chunks = member.iter_chunks(timings=metrics.stages)
+            if options.quarantine:
+                validator = RecordValidator(options.max_quarantined)
+                chunks = iter_valid_chunks(chunks, validator, timings=metrics.stages)
+            spool_chunks(chunks, spool_path)
+        if options.quarantine and validator.quarantined:
+            log_quarantined(table_name, validator.quarantined)
+            quarantine_path = Path(options.quarantine_dir or out_dir) / f"{table_name}.quarantine.csv"
+            write_quarantine_file(quarantine_path, validator.quarantined)
+
+        def infer() -> List[ColumnSchema]:
+            with metrics.stage("infer"):
+                return infer_schema_from_csv(
+                    spool_path, sample_size=options.infer_sample, tight_types=options.tight_types
+                )
+
+        with metrics.stage("cache"):
+            schema = cached_infer(
+                options.schema_cache, member, infer, inference_variant(options.tight_types, options.infer_sample)
+            )
+        lf = pl.scan_csv(spool_path, schema_overrides=read_overrides(schema))
+        lf = lf.select([convert_column(col).cast(parquet_type(col)).alias(col.sql_name) for col in schema])
+        try:
+            with metrics.stage("write"):
+                lf.sink_parquet(
+                    tmp_path,
+                    compression=PARQUET_COMPRESSION,
+                    compression_level=options.compression_level,
+                    row_group_size=options.row_group_size,
+                )
+        except Exception:
+            tmp_path.unlink(missing_ok=True)
+            raise
+    tmp_path.replace(out_path)
+
+    metrics.rows = pl.scan_parquet(out_path).select(pl.len()).collect().item()
+    metrics.bytes_out = out_path.stat().st_size
+    return ExportedMember(table_name=table_name, path=out_path, n_rows=metrics.rows, schema=schema, metrics=metrics)
+
+
+def export_parallel(
+    members: Iterable[CsvMember],
+    out_dir: Path,
+    options: ExportOptions,
+    jobs: int,
+    errors: List[str],
+    metrics: Optional[List[TableMetrics]] = None,
+) -> List[ExportedMember]:
+    """Exports MEMBERS to Parquet files in OUT_DIR using JOBS worker processes,
+    largest first, and returns the exported members.  Failures are logged and
+    appended to ERRORS, and member metrics to METRICS, if given."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    members = sorted(members, key=lambda m: m.file_size, reverse=True)
+    exported = []
+
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=get_context("spawn")) as pool:
+        futures = {pool.submit(export_member, member, out_dir, options): member for member in members}
+        for future in as_completed(futures):
+            member = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                _logger.error(f"Error exporting '{member.csv_path}': {e}")
+                errors.append(member.table_name + " (" + str(e) + ")")
+                continue
+            _logger.info(f"{result.table_name}: Wrote {result.path} ({result.n_rows} rows)")
+            exported.append(result)
+            if metrics is not None:
+                metrics.append(result.metrics)
+    return exported
+
+
+def load_duckdb(db_path: str, exported: List[ExportedMember], errors: List[str]) -> None:
+    """Creates or replaces a table in the DuckDB database DB_PATH from each
+    exported Parquet file.  Failures are logged and appended to ERRORS."""
+    import duckdb
+
+    con = duckdb.connect(db_path)
+    try:
+        for exported_member in exported:
+            table_name, path = exported_member.table_name, exported_member.path
+            parquet_path = str(path).replace("'", "''")
+            try:
+                with exported_member.metrics.stage("upload"):
+                    con.execute(
+                        f"""CREATE OR REPLACE TABLE "{table_name}" AS SELECT * FROM read_parquet('{parquet_path}')"""
+                    )
+                _logger.info(f"{table_name}: Loaded into {db_path}")
+            except Exception as e:
+                _logger.error(f"Error loading '{path}' into DuckDB: {e}")
+                errors.append(table_name + " (" + str(e) + ")")
+    finally:
+        con.close()
@@ -0,0 +1,207 @@
+"""Index planning from inferred schemas, a policy, and observed workload
+
+plan_indexes chooses the indexes of a table from its inferred schema and
+an IndexPolicy:
+
+* a btree index on each composite column list of the policy (e.g.,
+  (patno, event_id)) whose columns all exist
+* a btree index on each single column of the policy (e.g., patno), unless
+  a composite index already starts with it; on a nullable column the
+  index is partial (WHERE col IS NOT NULL), since equality filters never
+  match NULLs
+* a BRIN index on each column of the policy's BRIN types or columns
+  (none by default).  BRIN indexes only help when the physical row order
+  follows the column's values, and PPMI members are ordered by patno,
+  not by date, so only add them for tables whose pg_stats.correlation
+  for the column is close to 1 or -1 after ANALYZE
+
+Columns that are known to have fewer than min_distinct values are not
+btree-indexed.  Inference does not count distinct values, so this is an
+upper bound from the type (2 for booleans) or the inferred integer range.
+
+Policies are read from TOML files (see misc/index_policy.toml).  With a
+database that has pg_stat_statements, suggest_from_workload proposes
+further btree indexes for the column combinations that observed queries
+filter on.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass, fields
+import logging
+from pathlib import Path
+import re
+import tomllib
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import polars as pl
+
+from .infer_schema import ColumnSchema
+
+_logger = logging.getLogger()
+
+DEFAULT_WORKLOAD_LIMIT = 500  # statements read from pg_stat_statements, by total time
+
+
+@dataclass(frozen=True)
+class IndexPolicy:
+    """Which indexes plan_indexes creates; see misc/index_policy.toml"""
+
+    columns: Tuple[str, ...] = ("patno",)  # btree on each, unless a composite index starts with it
+    composite: Tuple[Tuple[str, ...], ...] = (("patno", "event_id"),)  # btree where all columns exist
+    brin_types: Tuple[str, ...] = ()  # BRIN on every column of these base SQL types
+    brin_columns: Tuple[str, ...] = ()  # BRIN on these columns regardless of type
+    partial_nullable: bool = True  # single-column btree indexes on nullable columns skip NULLs
+    min_distinct: int = 2  # no btree index on columns known to have fewer distinct values
+
+
+DEFAULT_INDEX_POLICY = IndexPolicy()
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    columns: Tuple[str, ...]  # sql_names
+    method: str = "btree"  # or "brin"
+    where: Optional[str] = None  # predicate of a partial index
+    reason: str = ""
+
+    def name(self, table_name: str) -> str:
+        suffix = "_brin" if self.method == "brin" else ""
+        return f"idx_{table_name}_{'_'.join(self.columns)}{suffix}"
+
+    def ddl(self, table_name: str) -> str:
+        using = " USING BRIN" if self.method == "brin" else ""
+        columns = ", ".join(f'"{col}"' for col in self.columns)
+        where = f" WHERE {self.where}" if self.where else ""
+        return f'CREATE INDEX IF NOT EXISTS "{self.name(table_name)}" ON "{table_name}"{using} ({columns}){where};\n'
+
+
+@dataclass
+class WorkloadSuggestion:
+    table_name: str
+    spec: IndexSpec
+    calls: int
+    total_ms: float
+
+
+def load_index_policy(path: Union[str, Path]) -> IndexPolicy:
+    """Reads an IndexPolicy from the [indexes] table of the TOML file PATH; missing
+    keys keep their defaults"""
+    with open(path, "rb") as fh:
+        settings = tomllib.load(fh).get("indexes", {})
+    known = {f.name for f in fields(IndexPolicy)}
+    if unknown := set(settings) - known:
+        raise ValueError(f"{path}: Unknown index policy settings: {', '.join(sorted(unknown))}")
+    if "composite" in settings:
+        settings["composite"] = tuple(tuple(cols) for cols in settings["composite"])
+    for key in ("columns", "brin_types", "brin_columns"):
+        if key in settings:
+            settings[key] = tuple(settings[key])
+    return IndexPolicy(**settings)
+
+
+def _base_type(col: ColumnSchema) -> str:
+    return re.sub(r"\s+(NOT\s+)?NULL$", "", col.sql_type)
+
+
+def max_distinct(col: ColumnSchema) -> Optional[int]:
+    """Returns an upper bound on the number of distinct non-null values of COL, if known"""
+    if col.polars_type == pl.Boolean:
+        return 2
+    if col.polars_type.is_integer() and col.value_range:
+        return int(col.value_range[1]) - int(col.value_range[0]) + 1
+    return None
+
+
+def plan_indexes(schema: List[ColumnSchema], policy: Optional[IndexPolicy] = None) -> List[IndexSpec]:
+    """Returns the indexes for a table with SCHEMA under POLICY (default: DEFAULT_INDEX_POLICY)"""
+    policy = policy or DEFAULT_INDEX_POLICY
+    by_name = {col.sql_name: col for col in schema}
+
+    def selective(name: str) -> bool:
+        n = max_distinct(by_name[name])
+        return n is None or n >= policy.min_distinct
+
+    specs: List[IndexSpec] = []
+    for columns in policy.composite:
+        if all(name in by_name for name in columns) and any(selective(name) for name in columns):
+            specs.append(IndexSpec(tuple(columns), reason="composite columns in policy"))
+
+    leading = {spec.columns[0] for spec in specs}
+    for name in policy.columns:
+        if name in by_name and name not in leading and selective(name):
+            where = f'"{name}" IS NOT NULL' if policy.partial_nullable and by_name[name].is_nullable else None
+            specs.append(IndexSpec((name,), where=where, reason="column in policy"))
+
+    for col in schema:
+        if _base_type(col) in policy.brin_types or col.sql_name in policy.brin_columns:
+            specs.append(IndexSpec((col.sql_name,), method="brin", reason=f"BRIN on {_base_type(col)} column"))
+
+    return specs
+
+
+def read_workload(con, limit: int = DEFAULT_WORKLOAD_LIMIT) -> List[Tuple[str, int, float]]:
+    """Returns (query, calls, total milliseconds) of the LIMIT most expensive statements
+    of the current database from pg_stat_statements"""
+    with con.cursor() as cur:
+        cur.execute("SELECT to_regclass('pg_stat_statements')".encode())
+        if cur.fetchone()[0] is None:
+            raise RuntimeError("pg_stat_statements is not available; CREATE EXTENSION pg_stat_statements")
+        cur.execute(
+            """SELECT query, calls, total_exec_time FROM pg_stat_statements
+            WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+            ORDER BY total_exec_time DESC LIMIT %s""".encode(),
+            (limit,),
+        )
+        return [(query, int(calls), float(total_ms)) for query, calls, total_ms in cur.fetchall()]
+
+
+_TABLE_RE = re.compile(r'\b(?:from|join)\s+(?:"?\w+"?\.)?"?(\w+)"?', re.IGNORECASE)
+_FILTER_RE = re.compile(
+    r'"?(\w+)"?\s*(=|<=|>=|<>|!=|<|>|\bbetween\b|\bin\b|\blike\b|\bis\s+not\s+null\b)', re.IGNORECASE
+)
+_EQUALITY_OPS = {"=", "in"}
+
+
+def filter_columns(query: str, columns_by_table: Dict[str, Iterable[str]]) -> Dict[str, Tuple[List[str], List[str]]]:
+    """Returns (equality columns, range columns) filtered on in QUERY for each table of
+    COLUMNS_BY_TABLE that QUERY reads.  This is a heuristic: a column name is assigned
+    to every table read by the query that has a column by that name."""
+    tables = {name.lower() for name in _TABLE_RE.findall(query)} & set(columns_by_table)
+    clause = re.split(r"\bwhere\b", query, maxsplit=1, flags=re.IGNORECASE)
+    if not tables or len(clause) < 2:
+        return {}
+    comparisons = [(column.lower(), op.lower()) for column, op in _FILTER_RE.findall(clause[1])]
+    result = {}
+    for table_name in tables:
+        columns = set(columns_by_table[table_name])
+        equality = sorted({c for c, op in comparisons if c in columns and op in _EQUALITY_OPS})
+        ranges = sorted({c for c, op in comparisons if c in columns and op not in _EQUALITY_OPS} - set(equality))
+        if equality or ranges:
+            result[table_name] = (equality, ranges)
+    return result
+
+
+def suggest_from_workload(
+    workload: List[Tuple[str, int, float]],
+    columns_by_table: Dict[str, Iterable[str]],
+    planned: Dict[str, List[IndexSpec]],
+) -> List[WorkloadSuggestion]:
+    """Suggests a btree index (equality columns, then one range column) for each
+    table and column combination that statements in WORKLOAD filter on and that no
+    PLANNED btree index covers as a prefix.  Suggestions are ordered by the total
+    time of the statements that would use them."""
+    totals: Dict[Tuple[str, Tuple[str, ...]], List[float]] = defaultdict(lambda: [0, 0.0])
+    for query, calls, total_ms in workload:
+        for table_name, (equality, ranges) in filter_columns(query, columns_by_table).items():
+            columns = tuple(equality + ranges[:1])
+            totals[(table_name, columns)][0] += calls
+            totals[(table_name, columns)][1] += total_ms
+
+    suggestions = []
+    for (table_name, columns), (calls, total_ms) in totals.items():
+        btree = [spec.columns for spec in planned.get(table_name, []) if spec.method == "btree"]
+        if any(set(existing[: len(columns)]) == set(columns) for existing in btree):
+            continue
+        spec = IndexSpec(columns, reason=f"filtered on by {calls} calls ({total_ms:.0f} ms) in pg_stat_statements")
+        suggestions.append(WorkloadSuggestion(table_name, spec, calls, total_ms))
+    return sorted(suggestions, key=lambda s: s.total_ms, reverse=True)
@@ -1,12 +1,35 @@
 from dataclasses import dataclass, field
+import hashlib
+from io import BytesIO
 import logging
+from pathlib import Path
 import re
-from typing import Optional, Tuple, List, Union
+from typing import Dict, Iterable, Optional, Tuple, List, Union
 
 import polars as pl
 
 _logger = logging.getLogger()
 
+# Optional, tighter type detection (see tighten_schema)
+TIGHT_TYPES = ["dates", "flags", "codes"]
+
+# (strptime format, type) of date and timestamp text in PPMI freezes, tried in order
+DATE_FORMATS = [
+    ("%m/%Y", pl.Date),  # e.g., INFODT, ORIG_ENTRY; stored as the first of the month
+    ("%m/%d/%Y", pl.Date),
+    ("%Y-%m-%d", pl.Date),
+    ("%Y-%m-%d %H:%M:%S%.f", pl.Datetime("us")),  # e.g., LAST_UPDATE
+]
+
+# Text columns with at most this many distinct values, each at most
+# MAX_ENUM_LABEL_BYTES long (the PostgreSQL limit), are stored as enums
+# when their values average more than MIN_ENUM_MEAN_BYTES (an enum value
+# takes 4 bytes) and repeat on average at least MIN_ENUM_REPEATS times.
+MAX_ENUM_LABELS = 100
+MAX_ENUM_LABEL_BYTES = 63
+MIN_ENUM_MEAN_BYTES = 4
+MIN_ENUM_REPEATS = 2
+
 
 @dataclass
 class ColumnSchema:
@@ -22,6 +45,9 @@ class ColumnSchema:
         None  # (min_value, max_value) for numeric types
     )
     sql_type: str = ""  # Inferred optimal SQL type (will be populated after creation)
+    csv_type: Optional[pl.DataType] = None  # type read from the CSV, if converted to polars_type
+    source_format: Optional[str] = None  # strptime format of converted date and timestamp text
+    n_rows: Optional[int] = None  # rows of the table when the schema was inferred
 
 
 def clean_for_sql_name(csv_name: str) -> str:
@@ -122,34 +148,280 @@ def get_optimal_sql_type(column_schema: ColumnSchema) -> str:
     return f"{sql_type_base} {null_constraint}"
 
 
-def infer_schema(df: pl.DataFrame) -> List[ColumnSchema]:
+def _column_schema(
+    csv_col_name: str,
+    polars_dtype: pl.DataType,
+    is_nullable: bool,
+    min_val: Optional[Union[int, float]] = None,
+    max_val: Optional[Union[int, float]] = None,
+) -> ColumnSchema:
+    value_range: Optional[Tuple[Union[int, float], Union[int, float]]] = None
+    if min_val is not None and max_val is not None:
+        value_range = (min_val, max_val)
+
+    temp_col_schema = ColumnSchema(
+        csv_name=csv_col_name,
+        sql_name=clean_for_sql_name(csv_col_name),
+        polars_type=polars_dtype,
+        is_nullable=bool(is_nullable),
+        value_range=value_range,
+    )
+
+    # Now, infer the optimal SQL type using the helper function
+    temp_col_schema.sql_type = get_optimal_sql_type(temp_col_schema)
+    return temp_col_schema
+
+
+def infer_schema(frame: Union[pl.DataFrame, pl.LazyFrame], tight_types: Iterable[str] = ()) -> List[ColumnSchema]:
     """
-    Infers schema from polars dataframe
+    Infers schema from polars dataframe (or lazy frame)
     including CSV name, SQL name, Polars type, nullability, range, and optimal SQL type.
-    """
 
-    inferred_schema: List[ColumnSchema] = []
+    Null flags and numeric ranges for all columns, and the row count, are
+    computed in one aggregation, so a lazy frame (e.g., from scan_csv) is
+    scanned once in streaming mode without being materialized.  TIGHT_TYPES are applied
+    with tighten_schema; FRAME itself is not converted (see convert_frame).
+    """
+    lf = frame.lazy()
+    schema = lf.collect_schema()
 
-    for csv_col_name, polars_dtype in df.schema.items():
-        is_nullable = df[csv_col_name].is_null().any()
-        value_range: Optional[Tuple[Union[int, float], Union[int, float]]] = None
+    exprs = [pl.len().alias("n_rows")]
+    for i, (csv_col_name, polars_dtype) in enumerate(schema.items()):
+        col = pl.col(csv_col_name)
+        exprs.append(col.is_null().any().alias(f"null_{i}"))
         if polars_dtype.is_numeric():
-            min_val = df[csv_col_name].min()
-            max_val = df[csv_col_name].max()
-            if min_val is not None and max_val is not None:
-                value_range = (min_val, max_val)
-
-        temp_col_schema = ColumnSchema(
-            csv_name=csv_col_name,
-            sql_name=clean_for_sql_name(csv_col_name),
-            polars_type=polars_dtype,
-            is_nullable=is_nullable,
-            value_range=value_range,
+            exprs += [col.min().alias(f"min_{i}"), col.max().alias(f"max_{i}")]
+    stats = lf.select(exprs).collect(engine="streaming").row(0, named=True)
+
+    inferred_schema = [
+        _column_schema(
+            csv_col_name,
+            polars_dtype,
+            is_nullable=stats[f"null_{i}"],
+            min_val=stats.get(f"min_{i}"),
+            max_val=stats.get(f"max_{i}"),
         )
+        for i, (csv_col_name, polars_dtype) in enumerate(schema.items())
+    ]
+    for col in inferred_schema:
+        col.n_rows = stats["n_rows"]
+    if tight_types:
+        return tighten_schema(lf, inferred_schema, tight_types)
+    return inferred_schema
 
-        # Now, infer the optimal SQL type using the helper function
-        temp_col_schema.sql_type = get_optimal_sql_type(temp_col_schema)
 
-        inferred_schema.append(temp_col_schema)
+def infer_schema_from_csv(
+    path: Union[str, Path], sample_size: Optional[int] = None, tight_types: Iterable[str] = ()
+) -> List[ColumnSchema]:
+    """
+    Infers schema from the CSV file at PATH without materializing it.
+
+    If SAMPLE_SIZE is None, Polars infers column types from all rows while
+    scanning and infer_schema computes nullability and ranges in a second,
+    streaming pass.
+
+    Otherwise, types are detected from a random sample of about SAMPLE_SIZE
+    rows and then verified, together with nullability and ranges, in one
+    streaming pass over all rows as text.  Integer columns that fail
+    verification are widened to Float64, and Float64 or Boolean columns that
+    fail are widened to String.
+
+    TIGHT_TYPES are applied with tighten_schema in a further streaming pass.
+    """
+    if sample_size is None:
+        return infer_schema(pl.scan_csv(path, infer_schema_length=None), tight_types)
+
+    raw = pl.scan_csv(path, infer_schema=False)
+    n_rows = raw.select(pl.len()).collect(engine="streaming").item()
+    if n_rows <= sample_size:
+        return infer_schema(pl.scan_csv(path, infer_schema_length=None), tight_types)
+
+    # Bernoulli sample with p = sample_size / n_rows, selected by a row hash so
+    # that it can be computed while streaming
+    sample = (
+        raw.with_row_index("__row")
+        .filter(pl.col("__row").hash(seed=0) % n_rows < sample_size)
+        .drop("__row")
+        .collect(engine="streaming")
+    )
+    sample_schema = pl.read_csv(BytesIO(sample.write_csv().encode()), infer_schema_length=None).schema
+
+    # columns with no values in the sample are checked as integer and float
+    unknown = {name for name, n_null in sample.null_count().row(0, named=True).items() if n_null == sample.height}
+
+    exprs = []
+    for i, (csv_col_name, sample_dtype) in enumerate(sample_schema.items()):
+        col = pl.col(csv_col_name)
+        exprs.append(col.is_null().any().alias(f"null_{i}"))
+        if csv_col_name in unknown:
+            exprs.append(col.is_not_null().any().alias(f"has_value_{i}"))
+        if sample_dtype.is_integer() or csv_col_name in unknown:
+            as_int = col.cast(pl.Int64, strict=False)
+            exprs += [
+                (col.is_not_null() & as_int.is_null()).any().alias(f"not_int_{i}"),
+                as_int.min().alias(f"min_int_{i}"),
+                as_int.max().alias(f"max_int_{i}"),
+            ]
+        if sample_dtype.is_numeric() or csv_col_name in unknown:
+            as_float = col.cast(pl.Float64, strict=False)
+            exprs += [
+                (col.is_not_null() & as_float.is_null()).any().alias(f"not_float_{i}"),
+                as_float.min().alias(f"min_float_{i}"),
+                as_float.max().alias(f"max_float_{i}"),
+            ]
+        elif sample_dtype == pl.Boolean:
+            exprs.append(
+                (col.is_not_null() & ~col.str.to_lowercase().is_in(["true", "false"])).any().alias(f"not_bool_{i}")
+            )
+    stats = raw.select(exprs).collect(engine="streaming").row(0, named=True)
+
+    inferred_schema: List[ColumnSchema] = []
+    for i, (csv_col_name, sample_dtype) in enumerate(sample_schema.items()):
+        is_nullable = stats[f"null_{i}"]
+        if csv_col_name in unknown:
+            if not stats[f"has_value_{i}"]:
+                sample_dtype = pl.String
+            elif not stats[f"not_int_{i}"]:
+                sample_dtype = pl.Int64
+            else:
+                sample_dtype = pl.Float64
+        if sample_dtype.is_integer() and not stats[f"not_int_{i}"]:
+            column_schema = _column_schema(
+                csv_col_name, pl.Int64, is_nullable, stats[f"min_int_{i}"], stats[f"max_int_{i}"]
+            )
+        elif sample_dtype.is_numeric() and not stats[f"not_float_{i}"]:
+            column_schema = _column_schema(
+                csv_col_name, pl.Float64, is_nullable, stats[f"min_float_{i}"], stats[f"max_float_{i}"]
+            )
+        elif sample_dtype == pl.Boolean and not stats[f"not_bool_{i}"]:
+            column_schema = _column_schema(csv_col_name, pl.Boolean, is_nullable)
+        else:
+            if sample_dtype != pl.String and csv_col_name not in unknown:
+                _logger.info(f"{csv_col_name}: Sampled type {sample_dtype} failed verification; using String")
+            column_schema = _column_schema(csv_col_name, pl.String, is_nullable)
+        column_schema.n_rows = n_rows
+        inferred_schema.append(column_schema)
 
+    if tight_types:
+        lf = pl.scan_csv(path, schema_overrides=read_overrides(inferred_schema))
+        return tighten_schema(lf, inferred_schema, tight_types)
     return inferred_schema
+
+
+def csv_read_type(col: ColumnSchema) -> pl.DataType:
+    """Returns the type that COL is read as from the CSV text"""
+    return col.csv_type if col.csv_type is not None else col.polars_type
+
+
+def read_overrides(schema: List[ColumnSchema]) -> Dict[str, pl.DataType]:
+    """Returns schema_overrides for reading a CSV file with SCHEMA (see convert_frame)"""
+    return {col.csv_name: csv_read_type(col) for col in schema}
+
+
+def _parse_dates(expr: pl.Expr, fmt: str, dtype: pl.DataType, strict: bool) -> pl.Expr:
+    if "%d" not in fmt and dtype == pl.Date:
+        # month-only dates are the first of the month
+        expr, fmt = pl.lit("01 ") + expr, "%d " + fmt
+    return expr.str.strptime(dtype, fmt, strict=strict)
+
+
+def convert_column(col: ColumnSchema) -> pl.Expr:
+    """Returns an expression that converts COL, as read with csv_read_type, to its polars_type"""
+    expr = pl.col(col.csv_name)
+    if col.csv_type is None:
+        return expr
+    if col.source_format:
+        return _parse_dates(expr, col.source_format, col.polars_type, strict=True).alias(col.csv_name)
+    return expr.cast(col.polars_type)
+
+
+def convert_frame(frame: Union[pl.DataFrame, pl.LazyFrame], schema: List[ColumnSchema]):
+    """Converts the columns of FRAME, read with read_overrides(SCHEMA), to the types of SCHEMA"""
+    converted = [convert_column(col) for col in schema if col.csv_type is not None]
+    return frame.with_columns(converted) if converted else frame
+
+
+def tighten_schema(
+    frame: Union[pl.DataFrame, pl.LazyFrame], schema: List[ColumnSchema], tight_types: Iterable[str]
+) -> List[ColumnSchema]:
+    """Returns SCHEMA with tighter types for the columns of FRAME (read with SCHEMA)
+    whose values all allow them.  TIGHT_TYPES selects from:
+
+    * dates: text that parses with one of DATE_FORMATS becomes DATE or TIMESTAMP
+    * flags: integers that are all 0 or 1 become BOOLEAN
+    * codes: low-cardinality text becomes a PostgreSQL enum (see MAX_ENUM_LABELS)
+
+    The checks for all columns are computed in one streaming aggregation (plus
+    one to collect enum labels), so FRAME may be a lazy scan of a spooled file.
+    Converted columns have csv_type set; read them with read_overrides and
+    convert them with convert_frame.
+    """
+    tight_types = set(tight_types)
+    lf = frame.lazy()
+    exprs = []
+    for i, col in enumerate(schema):
+        c = pl.col(col.csv_name)
+        if col.polars_type == pl.String:
+            exprs.append(c.is_not_null().any().alias(f"has_value_{i}"))
+            if "dates" in tight_types:
+                for j, (fmt, dtype) in enumerate(DATE_FORMATS):
+                    parsed = _parse_dates(c, fmt, dtype, strict=False)
+                    exprs.append((c.is_null() | parsed.is_not_null()).all().alias(f"date_{i}_{j}"))
+            if "codes" in tight_types:
+                n_bytes = c.str.len_bytes()
+                exprs += [
+                    c.approx_n_unique().alias(f"n_unique_{i}"),
+                    c.count().alias(f"count_{i}"),
+                    n_bytes.mean().alias(f"mean_bytes_{i}"),
+                    n_bytes.max().alias(f"max_bytes_{i}"),
+                ]
+    stats = lf.select(exprs).collect(engine="streaming").row(0, named=True) if exprs else {}
+
+    tightened = []
+    enum_columns = []
+    for i, col in enumerate(schema):
+        new_col = col
+        if col.polars_type == pl.String and stats[f"has_value_{i}"]:
+            date_formats = [
+                (fmt, dtype) for j, (fmt, dtype) in enumerate(DATE_FORMATS) if stats.get(f"date_{i}_{j}")
+            ]
+            if date_formats:
+                fmt, dtype = date_formats[0]
+                new_col = _column_schema(col.csv_name, dtype, col.is_nullable)
+                new_col.csv_type, new_col.source_format = pl.String, fmt
+            elif (
+                "codes" in tight_types
+                and stats[f"n_unique_{i}"] <= MAX_ENUM_LABELS
+                and stats[f"max_bytes_{i}"] <= MAX_ENUM_LABEL_BYTES
+                and stats[f"mean_bytes_{i}"] > MIN_ENUM_MEAN_BYTES
+                and stats[f"count_{i}"] >= MIN_ENUM_REPEATS * stats[f"n_unique_{i}"]
+            ):
+                enum_columns.append(i)
+        elif "flags" in tight_types and col.polars_type.is_integer() and col.value_range:
+            if col.value_range[0] >= 0 and col.value_range[1] <= 1:
+                new_col = _column_schema(col.csv_name, pl.Boolean, col.is_nullable)
+                new_col.csv_type = col.polars_type
+        tightened.append(new_col)
+
+    if enum_columns:
+        labels = lf.select(
+            pl.col(schema[i].csv_name).drop_nulls().unique().implode().alias(f"labels_{i}") for i in enum_columns
+        ).collect(engine="streaming").row(0, named=True)
+        for i in enum_columns:
+            col = schema[i]
+            enum_type = pl.Enum(sorted(labels[f"labels_{i}"]))
+            new_col = ColumnSchema(col.csv_name, col.sql_name, enum_type, col.is_nullable, csv_type=pl.String)
+            new_col.sql_type = f'"{enum_type_name(enum_type)}" ' + ("NULL" if col.is_nullable else "NOT NULL")
+            tightened[i] = new_col
+
+    for new_col, col in zip(tightened, schema):
+        new_col.n_rows = col.n_rows
+    return tightened
+
+
+def enum_type_name(enum_type: pl.Enum) -> str:
+    """Returns the name of the PostgreSQL enum type for the labels of ENUM_TYPE.  Names
+    are derived from the labels, so columns with the same labels share a type and a
+    type never needs to be altered."""
+    labels = enum_type.categories.to_list()
+    return "ppmidb_enum_" + hashlib.sha1("\n".join(labels).encode()).hexdigest()[:12]
@@ -0,0 +1,729 @@
+"""Load CSV members into PostgreSQL, serially or in parallel
+
+Loading a member has two phases:
+
+* prepare: decode and fix the member, optionally spooling the fixed text
+  to a temporary file and inferring the schema.  This is CPU-bound and is
+  run in a process pool when loading in parallel.
+* copy: create the table (if requested) and COPY the fixed text into it.
+  This is run over pooled connections when loading in parallel.
+
+When the schema is inferred, the CSV text is parsed once, by Polars, and
+the parsed frame (not the text) is the source for COPY.  In worker
+processes the frame is handed to the copy phase as an Arrow IPC file,
+which is memory-mapped rather than parsed again.  When streaming, the
+schema is inferred from the spooled text without materializing it and
+the text is parsed in batches during COPY instead.
+
+With options.reject_errors, rows are copied in batches within savepoints,
+and rows that the server rejects are isolated by bisecting the failed
+batch and stored in the rejects table (see rejects) instead of failing
+the member.
+
+In bulk mode, each member is copied into an UNLOGGED staging table
+without indexes; indexes are built, the table is analyzed and set LOGGED
+after COPY, and the staging table then replaces the target table.  All of
+this happens in the member's transaction, so readers see the previous
+table until the swap commits.  When loading in parallel, index builds for
+different tables run concurrently on their own connections.
+
+In delta mode, a changed member is copied into a temporary table and
+only the rows that differ are merged into the existing table (see delta).
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import csv
+from dataclasses import dataclass, field
+from io import StringIO
+import logging
+from multiprocessing import get_context
+from pathlib import Path
+import re
+from tempfile import TemporaryDirectory
+from typing import Iterable, List, Optional, Tuple, Union
+
+import polars as pl
+
+from .delta import apply_delta, create_delta_table, record_delta
+from .indexes import DEFAULT_INDEX_POLICY, IndexPolicy
+from .partitions import DEFAULT_PARTITION_POLICY, PartitionPolicy, partition_count, partition_names
+from .infer_schema import (
+    ColumnSchema,
+    clean_for_sql_name,
+    convert_frame,
+    infer_schema,
+    infer_schema_from_csv,
+    read_overrides,
+)
+from .manifest import ManifestEntry, ensure_manifest, get_manifest_entry, record_load, schema_fingerprint
+from .metrics import TableMetrics
+from .repair import (
+    DEFAULT_MAX_QUARANTINED,
+    QuarantinedRecord,
+    RecordValidator,
+    iter_valid_chunks,
+    log_quarantined,
+    record_quarantined,
+)
+from .rejects import (
+    DEFAULT_COPY_BATCH_ROWS,
+    DEFAULT_MAX_REJECTED,
+    RejectingCopy,
+    iter_records,
+    log_rejected,
+    record_rejected,
+)
+from .schema_cache import SchemaCache, cached_infer, inference_variant, schema_cache_key
+from .schemas import dependent_views, set_search_path
+from .sources import CsvMember, iter_csv_batches, iter_file_chunks, split_header, spool_chunks
+from .utils import generate_sql_create_index_ddl, generate_sql_create_table_ddl, index_names
+
+_logger = logging.getLogger()
+
+FRAME_BATCH_ROWS = 100_000
+
+COPY_FORMATS = ["csv", "binary"]
+
+# Appended to table names for the UNLOGGED staging tables used in bulk mode
+STAGING_SUFFIX = "__staging"
+
+# PostgreSQL type names passed to psycopg's Copy.set_types() for binary COPY, keyed
+# by the base SQL types chosen by get_optimal_sql_type
+BINARY_COPY_TYPES = {
+    "SMALLINT": "int2",
+    "INTEGER": "int4",
+    "BIGINT": "int8",
+    "REAL": "float4",
+    "DOUBLE PRECISION": "float8",
+    "BOOLEAN": "bool",
+    "DATE": "date",
+    "TIMESTAMP WITHOUT TIME ZONE": "timestamp",
+    "TEXT": "text",
+}
+
+
+@dataclass(frozen=True)
+class LoadOptions:
+    """Options that control how members are loaded into PostgreSQL"""
+
+    create_table: bool = False
+    copy_format: str = "csv"  # one of COPY_FORMATS; binary applies only to inferred frames
+    incremental: bool = False  # replace tables that are already in the manifest
+    stream: bool = False  # spool members and infer schemas without materializing them
+    infer_sample: Optional[int] = None  # rows sampled for type detection when streaming; None for all
+    schema_cache: Optional[SchemaCache] = None  # consulted before inferring schemas
+    bulk: bool = False  # COPY into UNLOGGED staging tables and build indexes afterwards; requires create_table
+    maintenance_work_mem: Optional[str] = None  # e.g., "1GB"; set for index builds in bulk mode
+    profile_stage: Optional[str] = None  # stage to run under cProfile (see metrics.STAGES)
+    profile_dir: Optional[Path] = None
+    quarantine: bool = False  # remove malformed records and store them in the quarantine table
+    max_quarantined: int = DEFAULT_MAX_QUARANTINED  # a member with more malformed records fails
+    reject_errors: bool = False  # COPY in batches within savepoints and reject the rows that fail
+    copy_batch_rows: int = DEFAULT_COPY_BATCH_ROWS  # with reject_errors
+    copy_batch_bytes: Optional[int] = None  # with reject_errors, text batches are also cut at this size
+    max_rejected: int = DEFAULT_MAX_REJECTED  # a member with more rejected rows fails
+    index_policy: IndexPolicy = DEFAULT_INDEX_POLICY  # indexes created with create_table
+    tight_types: Tuple[str, ...] = ()  # see infer_schema.TIGHT_TYPES
+    delta: bool = False  # with incremental, MERGE changed members into their tables (see delta); not with bulk
+    partition_policy: PartitionPolicy = DEFAULT_PARTITION_POLICY  # large tables created with create_table
+
+
+@dataclass
+class PreparedMember:
+    """A member that is ready to be copied into the database"""
+
+    member: CsvMember
+    spool_path: Optional[Path] = None  # if None, the member is streamed from its source
+    schema_ddl: Optional[str] = None  # if set, executed before COPY
+    schema: Optional[List[ColumnSchema]] = None
+    partitions: Optional[int] = None  # number of hash partitions, if the table is partitioned
+    frame: Optional[pl.DataFrame] = None  # parsed member, used instead of the text when set
+    frame_path: Optional[Path] = None  # Arrow IPC file of the parsed member (from worker processes)
+    error: Optional[str] = None  # if set, preparation failed and the member is not loaded
+    metrics: Optional[TableMetrics] = None
+    quarantined: List[QuarantinedRecord] = field(default_factory=list)  # with options.quarantine
+
+    def load_frame(self) -> Optional[Union[pl.DataFrame, Iterable[pl.DataFrame]]]:
+        """Returns the parsed member as a frame or an iterable of frames, or None
+        if the member is to be copied as text"""
+        if self.frame is not None:
+            return self.frame
+        if self.frame_path is not None:
+            return pl.read_ipc(self.frame_path)  # memory-mapped by default
+        if self.schema is not None and self.spool_path is not None:
+            batches = iter_csv_batches(self.spool_path, read_overrides(self.schema), FRAME_BATCH_ROWS)
+            return (convert_frame(batch, self.schema) for batch in batches)
+        return None
+
+    def cleanup(self) -> None:
+        self.frame = None
+        for path in (self.spool_path, self.frame_path):
+            if path:
+                path.unlink(missing_ok=True)
+
+
+def copy_query(table_name: str, header: str, with_header: bool = True) -> str:
+    """Returns a COPY ... FROM STDIN statement (without trailing semicolon) for a CSV
+    stream whose first line is HEADER (or, if not WITH_HEADER, for the rows after it)"""
+    header_fields = next(csv.reader(StringIO(header)))
+    columns = ','.join(map(lambda s: f'"{clean_for_sql_name(s)}"', header_fields))
+    if not with_header:
+        return f"COPY {table_name} ({columns}) from STDIN WITH (FORMAT CSV)"
+    return f"COPY {table_name} ({columns}) from STDIN WITH (FORMAT CSV, HEADER)"
+
+
+def binary_copy_types(schema: List[ColumnSchema]) -> Optional[List[str]]:
+    """Returns the PostgreSQL type names for a binary COPY of SCHEMA, or None if
+    any column has a type that is not supported in binary COPY"""
+    types = []
+    for col in schema:
+        base_type = re.sub(r"\s+(NOT\s+)?NULL$", "", col.sql_type)
+        if base_type not in BINARY_COPY_TYPES:
+            return None
+        types.append(BINARY_COPY_TYPES[base_type])
+    return types
+
+
+def _iter_batches(frames: Union[pl.DataFrame, Iterable[pl.DataFrame]]) -> Iterable[pl.DataFrame]:
+    if isinstance(frames, pl.DataFrame):
+        for offset in range(0, frames.height, FRAME_BATCH_ROWS):
+            yield frames.slice(offset, FRAME_BATCH_ROWS)
+    else:
+        yield from frames
+
+
+def copy_dataframe(
+    con,
+    table_name: str,
+    frames: Union[pl.DataFrame, Iterable[pl.DataFrame]],
+    schema: List[ColumnSchema],
+    copy_format: str = "csv",
+    metrics: Optional[TableMetrics] = None,
+    rejecting: Optional[RejectingCopy] = None,
+) -> int:
+    """COPYs the parsed frame (or iterable of frames) FRAMES into TABLE_NAME in
+    batches of FRAME_BATCH_ROWS rows and returns the number of rows written.
+    The caller commits.
+
+    With COPY_FORMAT "binary", rows are sent in PostgreSQL binary format with
+    the column types from SCHEMA, so the server does no text parsing or type
+    coercion.  Tables with types that binary COPY does not support (e.g.,
+    NUMERIC) fall back to CSV.  The size of CSV batches is added to
+    metrics.bytes_out if METRICS is given.  With REJECTING, rows are copied
+    with REJECTING.copy() and numbered as lines of the member, from 2 (for
+    binary COPY, one line per row).
+    """
+    columns = ",".join(f'"{col.sql_name}"' for col in schema)
+
+    if copy_format == "binary":
+        types = binary_copy_types(schema)
+        if types is None:
+            _logger.info(f"{table_name}: Unsupported column types for binary COPY; using CSV")
+        else:
+            query = f"COPY {table_name} ({columns}) from STDIN WITH (FORMAT BINARY)"
+            if rejecting is not None:
+                rows = (row for batch in _iter_batches(frames) for row in batch.iter_rows())
+                return rejecting.copy(con, query, enumerate(rows, start=2), types=types)
+            n_rows = 0
+            with con.cursor().copy(query.encode()) as copy:
+                copy.set_types(types)
+                for batch in _iter_batches(frames):
+                    for row in batch.iter_rows():
+                        copy.write_row(row)
+                    n_rows += batch.height
+            return n_rows
+
+    query = f"COPY {table_name} ({columns}) from STDIN WITH (FORMAT CSV)"
+    if rejecting is not None:
+        chunks = (batch.write_csv(include_header=False) for batch in _iter_batches(frames))
+        return rejecting.copy(con, query, iter_records(chunks, first_line=2), metrics=metrics)
+    n_rows = 0
+    with con.cursor().copy(query.encode()) as copy:
+        for batch in _iter_batches(frames):
+            data = batch.write_csv(include_header=False)
+            copy.write(data)
+            n_rows += batch.height
+            if metrics is not None:
+                metrics.bytes_out += len(data)
+    return n_rows
+
+
+def copy_error_debug_info(csv_path: str, header: str) -> str:
+    debug_info = f"""
+    {csv_path=}
+    {len(header)=}"""
+    if len(header) == 1024:
+        debug_info += "\nThe header appears to be truncated and the file is likely corrupt"
+    return debug_info
+
+
+def new_metrics(member: CsvMember, options: LoadOptions) -> TableMetrics:
+    return TableMetrics(
+        table_name=member.table_name,
+        bytes_in=member.file_size,
+        profile_stage=options.profile_stage,
+        profile_dir=options.profile_dir,
+    )
+
+
+def member_chunks(prepared: PreparedMember, options: LoadOptions, metrics: TableMetrics) -> Iterable[str]:
+    """Returns the fixed text chunks of the prepared member.  With options.quarantine,
+    malformed records are removed and appended to prepared.quarantined."""
+    chunks = prepared.member.iter_chunks(timings=metrics.stages)
+    if options.quarantine:
+        validator = RecordValidator(options.max_quarantined, quarantined=prepared.quarantined)
+        chunks = iter_valid_chunks(chunks, validator, timings=metrics.stages)
+    return chunks
+
+
+def _table_ddl(schema: List[ColumnSchema], table_name: str, options: LoadOptions) -> Tuple[Optional[int], str]:
+    """Returns (number of partitions or None, CREATE TABLE DDL) for TABLE_NAME"""
+    partitions = partition_count(schema, options.partition_policy)
+    ddl = generate_sql_create_table_ddl(schema, table_name, index_policy=options.index_policy, partitions=partitions)
+    return partitions, ddl
+
+
+def _schema_variant(options: LoadOptions) -> str:
+    # only the streaming path infers from a sample
+    return inference_variant(options.tight_types, options.infer_sample if options.stream else None)
+
+
+def expected_fingerprint(member: CsvMember, options: LoadOptions) -> Optional[str]:
+    """Returns the schema fingerprint that loading MEMBER with OPTIONS would record in
+    the manifest, or None if OPTIONS do not create tables.  The schema is taken
+    from, or inferred into, options.schema_cache, so that the load that follows
+    uses the same schema without inferring it again."""
+    if not options.create_table:
+        return None
+    table_name = member.table_name
+
+    def infer() -> List[ColumnSchema]:
+        with TemporaryDirectory(prefix="ppmidb-") as spool_dir:
+            spool_path = Path(spool_dir) / f"{table_name}.csv"
+            spool_chunks(member.iter_chunks(), spool_path)
+            sample_size = options.infer_sample if options.stream else None
+            return infer_schema_from_csv(spool_path, sample_size=sample_size, tight_types=options.tight_types)
+
+    schema = cached_infer(options.schema_cache, member, infer, _schema_variant(options))
+    _, ddl = _table_ddl(schema, table_name, options)
+    return schema_fingerprint(schema, ddl)
+
+
+def prepare_member(
+    member: CsvMember, options: LoadOptions, spool_dir: Optional[str], keep_frame: bool = False
+) -> PreparedMember:
+    """Prepares MEMBER for copying
+
+    If SPOOL_DIR is given, the fixed text is spooled to a file in SPOOL_DIR;
+    otherwise, the member is streamed from its source during COPY.  If
+    options.create_table is set, the schema is inferred:
+
+    * with options.stream, from the spooled file without materializing it;
+      the spooled text is parsed in batches with the inferred types during COPY
+    * otherwise, from the spooled file (or, without SPOOL_DIR, the text read
+      into memory) parsed into a frame, which replaces the text as the COPY
+      source: it is kept in memory if KEEP_FRAME, otherwise written to an
+      Arrow IPC file in SPOOL_DIR
+
+    Stage timings are recorded in the returned member's metrics.
+
+    This function is run in worker processes and must not touch the database.
+    """
+    metrics = new_metrics(member, options)
+    if spool_dir is None and not options.create_table:
+        return PreparedMember(member=member, metrics=metrics)
+
+    csv_path = member.csv_path
+    table_name = member.table_name
+    prepared = PreparedMember(member=member, metrics=metrics)
+    try:
+        with metrics.stage("spool"):
+            if spool_dir is not None:
+                prepared.spool_path = Path(spool_dir) / f"{table_name}.csv"
+                spool_chunks(member_chunks(prepared, options, metrics), prepared.spool_path)
+            if options.create_table:
+                source = prepared.spool_path or StringIO("".join(member_chunks(prepared, options, metrics)))
+    except Exception as e:
+        _logger.warning(f"Error reading CSV file '{csv_path}': {e}")
+        prepared.cleanup()
+        return PreparedMember(member=member, error=table_name + " (" + str(e) + ")", metrics=metrics)
+
+    if options.create_table:
+        with metrics.stage("cache"):
+            cache_key = schema_cache_key(member, _schema_variant(options)) if options.schema_cache else None
+            cached_schema = options.schema_cache.get(cache_key) if cache_key else None
+        if cached_schema:
+            _logger.info(f"{table_name}: Using cached schema")
+        try:
+            with metrics.stage("infer"):
+                if options.stream and prepared.spool_path:
+                    df = None
+                    schema = cached_schema or infer_schema_from_csv(
+                        prepared.spool_path, sample_size=options.infer_sample, tight_types=options.tight_types
+                    )
+                elif cached_schema:
+                    df = pl.read_csv(
+                        source,
+                        has_header=True,
+                        separator=",",
+                        infer_schema=False,
+                        schema_overrides=read_overrides(cached_schema),
+                    )
+                    schema = cached_schema
+                    df = convert_frame(df, schema)
+                else:
+                    df = pl.read_csv(
+                        source,
+                        has_header=True,
+                        separator=",",
+                        infer_schema_length=None,
+                    )
+                    schema = infer_schema(df, options.tight_types)
+                    df = convert_frame(df, schema)
+        except Exception as e:
+            header = member.read_header()
+            debug_info = f"""
+            {csv_path=}
+            {len(header)=}"""
+            _logger.warning(f"Error reading CSV file '{csv_path}': {e}" + "\n" + debug_info)
+            prepared.cleanup()
+            return PreparedMember(member=member, error=table_name + " (" + str(e) + ")", metrics=metrics)
+        del source
+        if cache_key and not cached_schema:
+            with metrics.stage("cache"):
+                options.schema_cache.put(cache_key, schema)
+        prepared.schema = schema
+        prepared.partitions, prepared.schema_ddl = _table_ddl(schema, table_name, options)
+        if df is not None:
+            if keep_frame or spool_dir is None:
+                prepared.frame = df
+            else:
+                prepared.frame_path = Path(spool_dir) / f"{table_name}.arrow"
+                with metrics.stage("write"):
+                    df.write_ipc(prepared.frame_path)
+            if prepared.spool_path:
+                prepared.spool_path.unlink()
+                prepared.spool_path = None
+
+    return prepared
+
+
+def _check_no_dependent_views(cur, table_name: str, reason: str) -> None:
+    """Raises RuntimeError if views depend on TABLE_NAME, which must be dropped because
+    of REASON.  Such views (e.g., the views of an alias schema that points to this
+    schema, or bridge views) would make the drop fail, or would be lost with CASCADE."""
+    if views := dependent_views(cur, table_name):
+        raise RuntimeError(
+            f"{table_name} must be dropped ({reason}), but views depend on it: {', '.join(views)}; "
+            "load the freeze into a new schema (--schema), or drop the views first"
+        )
+
+
+def _replace_existing_table(cur, table_name: str, previous: ManifestEntry, fingerprint: Optional[str]) -> None:
+    """Clears a previously loaded table before it is reloaded.  If the inferred
+    schema changed, the table is dropped so that it is recreated; otherwise it is
+    truncated, which keeps dependent views and indexes in place."""
+    cur.execute("SELECT to_regclass(%s)".encode(), (f'"{table_name}"',))
+    if cur.fetchone()[0] is None:
+        return
+    if fingerprint is not None and fingerprint != previous.schema_fingerprint:
+        _check_no_dependent_views(cur, table_name, "its schema changed")
+        _logger.info(f"{table_name}: Schema or table DDL changed; dropping table")
+        cur.execute(f'DROP TABLE "{table_name}"'.encode())
+    else:
+        cur.execute(f'TRUNCATE "{table_name}"'.encode())
+
+
+def _delta_applies(cur, table_name: str, previous: ManifestEntry, fingerprint: Optional[str]) -> bool:
+    """Returns whether a delta can be applied to the previously loaded table, i.e.,
+    whether it exists and its inferred schema is unchanged"""
+    cur.execute("SELECT to_regclass(%s)".encode(), (f'"{table_name}"',))
+    if cur.fetchone()[0] is None:
+        return False
+    if fingerprint is not None and fingerprint != previous.schema_fingerprint:
+        _logger.info(f"{table_name}: Schema or table DDL changed; reloading table")
+        return False
+    return True
+
+
+def _create_staging_table(cur, table_name: str, schema: List[ColumnSchema], partitions: Optional[int]) -> str:
+    """Creates an empty UNLOGGED staging table (or a table with UNLOGGED PARTITIONS)
+    without indexes for TABLE_NAME and returns its name"""
+    staging_name = table_name + STAGING_SUFFIX
+    cur.execute(f'DROP TABLE IF EXISTS "{staging_name}"'.encode())
+    cur.execute(
+        generate_sql_create_table_ddl(
+            schema, staging_name, unlogged=True, include_indexes=False, partitions=partitions
+        ).encode()
+    )
+    return staging_name
+
+
+def _swap_in_staging_table(
+    cur,
+    table_name: str,
+    staging_name: str,
+    schema: List[ColumnSchema],
+    maintenance_work_mem: Optional[str],
+    index_policy: IndexPolicy,
+    partitions: Optional[int] = None,
+) -> None:
+    """Builds indexes on the loaded staging table, analyzes it, sets it (or its
+    PARTITIONS) LOGGED, and replaces TABLE_NAME with it.  The target table is
+    locked only for the final drop and renames, and must not have dependent
+    views (see _check_no_dependent_views)."""
+    if maintenance_work_mem:
+        cur.execute("SELECT set_config('maintenance_work_mem', %s, true)".encode(), (maintenance_work_mem,))
+    if index_ddl := generate_sql_create_index_ddl(schema, staging_name, index_policy):
+        cur.execute(index_ddl.encode())
+    cur.execute(f'ANALYZE "{staging_name}"'.encode())
+    staging_partitions = partition_names(staging_name, partitions) if partitions else []
+    for name in staging_partitions or [staging_name]:
+        cur.execute(f'ALTER TABLE "{name}" SET LOGGED'.encode())
+    cur.execute(f'DROP TABLE IF EXISTS "{table_name}"'.encode())
+    cur.execute(f'ALTER TABLE "{staging_name}" RENAME TO "{table_name}"'.encode())
+    for staging_partition, name in zip(staging_partitions, partition_names(table_name, partitions or 0)):
+        cur.execute(f'ALTER TABLE "{staging_partition}" RENAME TO "{name}"'.encode())
+    for (staging_index, _), (index_name, _) in zip(
+        index_names(schema, staging_name, index_policy), index_names(schema, table_name, index_policy)
+    ):
+        cur.execute(f'ALTER INDEX "{staging_index}" RENAME TO "{index_name}"'.encode())
+
+
+def copy_prepared_member(
+    con,
+    prepared: PreparedMember,
+    options: LoadOptions,
+    errors: List[str],
+    metrics: Optional[List[TableMetrics]] = None,
+) -> None:
+    """Creates the table (if requested), copies PREPARED over connection CON in
+    bounded-size blocks, and records the load in the manifest
+
+    Everything is done in one transaction, so a failed member leaves no
+    partial table behind.  With options.incremental, a table that is
+    already in the manifest is cleared first, or, with options.delta,
+    copied into a temporary table and merged into the table (see
+    delta.apply_delta).  With options.bulk, the
+    member is copied into a staging table that replaces the target table
+    once indexes are built.  With options.reject_errors, rows that fail are
+    rejected rather than failing the member.  Failures are logged and
+    appended to ERRORS.
+    The member's metrics are appended to METRICS, if given.
+    """
+    csv_path = prepared.member.csv_path
+    member_metrics = prepared.metrics or new_metrics(prepared.member, options)
+    table_name = prepared.member.table_name
+    fingerprint = schema_fingerprint(prepared.schema, prepared.schema_ddl) if prepared.schema else None
+    bulk = options.bulk and prepared.schema is not None
+    copy_table = table_name
+    delta = False
+    delta_counts = None
+    header = ""
+    rejecting = (
+        RejectingCopy(table_name, options.copy_batch_rows, options.copy_batch_bytes, options.max_rejected)
+        if options.reject_errors
+        else None
+    )
+
+    try:
+        with con.cursor() as cur:
+            with member_metrics.stage("ddl"):
+                previous = get_manifest_entry(con, table_name) if options.incremental or options.delta else None
+                if bulk:
+                    _check_no_dependent_views(cur, table_name, "--bulk replaces it with a staging table")
+                    copy_table = _create_staging_table(cur, table_name, prepared.schema, prepared.partitions)
+                elif options.delta and previous and _delta_applies(cur, table_name, previous, fingerprint):
+                    delta = True
+                    copy_table = create_delta_table(cur, table_name)
+                else:
+                    if previous:
+                        _replace_existing_table(cur, table_name, previous, fingerprint)
+                    if prepared.schema_ddl:
+                        cur.execute(prepared.schema_ddl.encode())
+
+            with member_metrics.stage("copy"):
+                frames = prepared.load_frame()
+                if frames is not None:
+                    header = ",".join(col.csv_name for col in prepared.schema)
+                    row_count = copy_dataframe(
+                        con,
+                        copy_table,
+                        frames,
+                        prepared.schema,
+                        copy_format=options.copy_format,
+                        metrics=member_metrics,
+                        rejecting=rejecting,
+                    )
+                else:
+                    if prepared.spool_path:
+                        chunks = iter_file_chunks(prepared.spool_path)
+                    else:
+                        chunks = member_chunks(prepared, options, member_metrics)
+                    header, chunks = split_header(chunks)
+                    if rejecting is not None:
+                        records = iter_records(chunks)
+                        next(records, None)  # the header
+                        row_count = rejecting.copy(
+                            con, copy_query(copy_table, header, with_header=False), records, metrics=member_metrics
+                        )
+                    else:
+                        with cur.copy(copy_query(copy_table, header).encode()) as copy:
+                            for chunk in chunks:
+                                copy.write(chunk)
+                                member_metrics.bytes_out += len(chunk)
+                        row_count = cur.rowcount
+            member_metrics.rows = row_count
+
+            if delta:
+                with member_metrics.stage("merge"):
+                    delta_counts = apply_delta(cur, table_name, copy_table)
+
+            if bulk:
+                with member_metrics.stage("index"):
+                    _swap_in_staging_table(
+                        cur,
+                        table_name,
+                        copy_table,
+                        prepared.schema,
+                        options.maintenance_work_mem,
+                        options.index_policy,
+                        prepared.partitions,
+                    )
+
+        with member_metrics.stage("commit"):
+            if options.quarantine:
+                log_quarantined(table_name, prepared.quarantined)
+                record_quarantined(con, table_name, prepared.quarantined)
+            if rejecting is not None:
+                log_rejected(table_name, rejecting.rejected)
+                record_rejected(con, table_name, rejecting.rejected)
+            if delta_counts is not None:
+                record_delta(con, table_name, csv_path, delta_counts)
+            record_load(
+                con,
+                ManifestEntry(
+                    table_name=table_name,
+                    member_name=csv_path,
+                    crc32=prepared.member.content_crc(),
+                    file_size=prepared.member.file_size,
+                    schema_fingerprint=fingerprint,
+                    row_count=row_count,
+                ),
+            )
+            con.commit()
+        _logger.info(f"{table_name}: Loaded and committed ({row_count} rows)")
+    except Exception as e:
+        con.cancel()
+        con.rollback()
+        _logger.error(f"Error loading '{csv_path}': {e}" + "\n" + copy_error_debug_info(csv_path, header))
+        errors.append(table_name + " (" + str(e) + ")")
+    finally:
+        frames = None
+        prepared.cleanup()
+        if metrics is not None:
+            metrics.append(member_metrics)
+
+
+def load_member(
+    con,
+    member: CsvMember,
+    options: LoadOptions,
+    errors: List[str],
+    metrics: Optional[List[TableMetrics]] = None,
+) -> None:
+    """Loads one member into PostgreSQL over connection CON
+
+    The member is decoded and fixed incrementally and written to COPY in
+    bounded-size blocks.  When options.create_table is set, the schema is
+    inferred before the COPY starts and parsed frames are copied instead
+    of the text; with options.stream, the fixed text is spooled to a
+    temporary file so that neither the text nor the frame is held in
+    memory.  Failures are logged and appended to ERRORS, and the member's
+    metrics to METRICS, if given.  The manifest table is created if it does
+    not exist.
+    """
+    ensure_manifest(con)
+    con.commit()
+    with TemporaryDirectory(prefix="ppmidb-") as spool_dir:
+        prepared = prepare_member(
+            member, options, spool_dir=spool_dir if options.stream and options.create_table else None, keep_frame=True
+        )
+        if prepared.error:
+            errors.append(prepared.error)
+            if metrics is not None:
+                metrics.append(prepared.metrics)
+            return
+        copy_prepared_member(con, prepared, options, errors, metrics)
+
+
+def _copy_with_pool(
+    pool, prepared: PreparedMember, options: LoadOptions, errors: List[str], metrics: Optional[List[TableMetrics]]
+) -> None:
+    with pool.connection() as con:
+        copy_prepared_member(con, prepared, options, errors, metrics)
+
+
+def load_parallel(
+    uri: str,
+    members: Iterable[CsvMember],
+    options: LoadOptions,
+    jobs: int,
+    errors: List[str],
+    schema: Optional[str] = None,
+    metrics: Optional[List[TableMetrics]] = None,
+) -> None:
+    """Loads MEMBERS into the PostgreSQL database at URI using JOBS worker
+    processes for preparation and a pool of JOBS connections for COPY.
+    If SCHEMA is given, it is the search path of the pooled connections.
+
+    Members are processed largest first so that the longest loads start
+    early and do not dominate the tail.  At most 2 * JOBS members are in
+    flight (prepared or being copied) at once, which bounds the spool
+    space on disk.  Failures are appended to ERRORS, and member metrics to
+    METRICS, if given.
+    """
+    from psycopg_pool import ConnectionPool
+
+    members = sorted(members, key=lambda m: m.file_size, reverse=True)
+    member_iter = iter(members)
+    max_in_flight = 2 * jobs
+
+    with (
+        TemporaryDirectory(prefix="ppmidb-") as spool_dir,
+        ProcessPoolExecutor(max_workers=jobs, mp_context=get_context("spawn")) as prepare_pool,
+        ThreadPoolExecutor(max_workers=jobs) as copy_pool,
+        ConnectionPool(
+            uri,
+            min_size=jobs,
+            max_size=jobs,
+            configure=(lambda con: set_search_path(con, schema)) if schema else None,
+        ) as pool,
+    ):
+        with pool.connection() as con:
+            ensure_manifest(con)
+
+        in_flight = {}  # future -> member
+        while True:
+            while len(in_flight) < max_in_flight and (member := next(member_iter, None)):
+                future = prepare_pool.submit(prepare_member, member, options, spool_dir)
+                in_flight[future] = member
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                member = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    _logger.error(f"Error processing '{member.csv_path}': {e}")
+                    errors.append(member.table_name + " (" + str(e) + ")")
+                    continue
+                if isinstance(result, PreparedMember):  # copy futures return None
+                    if result.error:
+                        errors.append(result.error)
+                        if metrics is not None:
+                            metrics.append(result.metrics)
+                        continue
+                    in_flight[copy_pool.submit(_copy_with_pool, pool, result, options, errors, metrics)] = member
@@ -0,0 +1,167 @@
+"""Manifest of loaded members, stored in the target database
+
+Each successful load of a member records the member name, its CRC32 and
+size, a fingerprint of the inferred schema, and the number of rows loaded.
+Incremental loads compare a new freeze against the manifest and reload
+only the members that changed.  Tables are keyed by their table name,
+which does not include the freeze date suffix.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+import hashlib
+import logging
+from typing import Callable, Dict, Iterable, List, Optional
+
+from .infer_schema import ColumnSchema
+from .sources import CsvMember
+
+_logger = logging.getLogger()
+
+MANIFEST_TABLE = "_ppmidb_manifest"
+
+MANIFEST_DDL = f"""CREATE TABLE IF NOT EXISTS "{MANIFEST_TABLE}" (
+    "table_name" TEXT NOT NULL PRIMARY KEY,
+    "member_name" TEXT NOT NULL,
+    "crc32" BIGINT NULL,
+    "file_size" BIGINT NOT NULL,
+    "schema_fingerprint" TEXT NULL,
+    "row_count" BIGINT NULL,
+    "loaded_at" TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+);
+"""
+
+
+@dataclass
+class ManifestEntry:
+    table_name: str
+    member_name: str
+    crc32: Optional[int]
+    file_size: int
+    schema_fingerprint: Optional[str] = None
+    row_count: Optional[int] = None
+    loaded_at: Optional[datetime] = None
+
+
+@dataclass
+class ReloadPlan:
+    """Members to load and the changes relative to the manifest"""
+
+    to_load: List[CsvMember] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)  # table names
+    changed: List[str] = field(default_factory=list)
+    reconfigured: List[str] = field(default_factory=list)  # unchanged members whose load options changed
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+
+
+def schema_fingerprint(schema: List[ColumnSchema], ddl: str = "") -> str:
+    """Returns a short, stable hash of the column names and SQL types in SCHEMA and
+    of the DDL that creates the table, which reflects the options that change the
+    table but not the columns (e.g., indexes and partitions)"""
+    text = "\n".join(f"{col.sql_name} {col.sql_type}" for col in schema) + "\n" + ddl
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def ensure_manifest(con) -> None:
+    with con.cursor() as cur:
+        cur.execute(MANIFEST_DDL.encode())
+
+
+def read_manifest(con) -> Dict[str, ManifestEntry]:
+    """Returns manifest entries by table name (empty if there is no manifest yet)"""
+    ensure_manifest(con)
+    with con.cursor() as cur:
+        cur.execute(
+            f'SELECT table_name, member_name, crc32, file_size, schema_fingerprint, row_count, loaded_at FROM "{MANIFEST_TABLE}"'.encode()
+        )
+        entries = {row[0]: ManifestEntry(*row) for row in cur.fetchall()}
+    con.commit()
+    return entries
+
+
+def get_manifest_entry(con, table_name: str) -> Optional[ManifestEntry]:
+    with con.cursor() as cur:
+        cur.execute(
+            f'SELECT table_name, member_name, crc32, file_size, schema_fingerprint, row_count, loaded_at FROM "{MANIFEST_TABLE}" WHERE table_name = %s'.encode(),
+            (table_name,),
+        )
+        row = cur.fetchone()
+    return ManifestEntry(*row) if row else None
+
+
+def record_load(con, entry: ManifestEntry) -> None:
+    """Inserts or replaces the manifest entry for entry.table_name.  The caller commits,
+    so that the entry is written in the same transaction as the data."""
+    with con.cursor() as cur:
+        cur.execute(
+            f"""INSERT INTO "{MANIFEST_TABLE}" (table_name, member_name, crc32, file_size, schema_fingerprint, row_count, loaded_at)
+            VALUES (%s, %s, %s, %s, %s, %s, now())
+            ON CONFLICT (table_name) DO UPDATE SET
+                member_name = excluded.member_name,
+                crc32 = excluded.crc32,
+                file_size = excluded.file_size,
+                schema_fingerprint = excluded.schema_fingerprint,
+                row_count = excluded.row_count,
+                loaded_at = excluded.loaded_at""".encode(),
+            (entry.table_name, entry.member_name, entry.crc32, entry.file_size, entry.schema_fingerprint, entry.row_count),
+        )
+
+
+def plan_reload(
+    members: Iterable[CsvMember],
+    manifest: Dict[str, ManifestEntry],
+    complete: bool,
+    fingerprint: Optional[Callable[[CsvMember], Optional[str]]] = None,
+) -> ReloadPlan:
+    """Compares MEMBERS with MANIFEST and returns the members that must be loaded
+
+    A member is unchanged if the manifest has an entry for its table with
+    the same CRC32 and size and, if FINGERPRINT is given, the same schema
+    fingerprint as FINGERPRINT returns for the member under the current load
+    options (None if the load does not create tables).  Tables in the
+    manifest that are not among the members are reported as removed only
+    if COMPLETE, i.e., if MEMBERS is the whole freeze rather than a
+    selection.
+    """
+    plan = ReloadPlan()
+    seen = set()
+    for member in members:
+        table_name = member.table_name
+        seen.add(table_name)
+        entry = manifest.get(table_name)
+        if entry is None:
+            plan.added.append(table_name)
+            plan.to_load.append(member)
+        elif entry.crc32 == member.content_crc() and entry.file_size == member.file_size:
+            expected = fingerprint(member) if fingerprint else None
+            if expected is not None and expected != entry.schema_fingerprint:
+                plan.reconfigured.append(table_name)
+                plan.to_load.append(member)
+            else:
+                plan.unchanged.append(table_name)
+        else:
+            plan.changed.append(table_name)
+            plan.to_load.append(member)
+    if complete:
+        plan.removed = sorted(set(manifest) - seen)
+    return plan
+
+
+def log_reload_plan(plan: ReloadPlan) -> None:
+    _logger.warning(
+        f"Incremental load: {len(plan.unchanged)} unchanged, {len(plan.changed)} changed, "
+        f"{len(plan.reconfigured)} with changed load options, {len(plan.added)} added, {len(plan.removed)} removed"
+    )
+    for label, tables in (
+        ("Changed", plan.changed),
+        ("Load options changed", plan.reconfigured),
+        ("Added", plan.added),
+        ("Removed", plan.removed),
+    ):
+        for table_name in tables:
+            _logger.info(f"{label}: {table_name}")
+    if plan.removed:
+        _logger.warning(
+            "Tables that are no longer in the freeze are not dropped: " + ", ".join(plan.removed)
+        )
@@ -0,0 +1,127 @@
+"""Per-table, per-stage load metrics
+
+A TableMetrics records, for one member, the seconds spent in each stage
+(see STAGES), bytes in and out, row count, and the peak RSS of the
+process that did the work.  Stage times
+are exclusive: time recorded for a stage that runs inside another (e.g.,
+decoding while spooling) is not counted again in the outer stage.
+
+TableMetrics are created where the work happens (including in worker
+processes, from which they are returned with the result) and collected
+in a list by the caller, in the same way as errors.
+"""
+
+import cProfile
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+import json
+import logging
+from pathlib import Path
+import sys
+import time
+from typing import Dict, Generator, Iterable, List, Optional
+
+from .utils import format_text_table
+
+_logger = logging.getLogger()
+
+# Stages in the order in which they are reported
+STAGES = ["read", "decode", "fix", "validate", "spool", "cache", "infer", "write", "ddl", "copy", "merge", "index", "commit", "upload", "load"]
+
+
+def peak_rss() -> int:
+    """Returns the peak resident set size of this process in bytes, or 0 if unavailable"""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+@dataclass
+class TableMetrics:
+    table_name: str
+    stages: Dict[str, float] = field(default_factory=dict)  # exclusive seconds by stage
+    bytes_in: int = 0  # uncompressed member size
+    bytes_out: int = 0  # bytes written to the target, where known
+    rows: Optional[int] = None
+    peak_rss: int = 0  # bytes
+    profile_stage: Optional[str] = None  # stage to run under cProfile
+    profile_dir: Optional[Path] = None  # where <table_name>.<stage>.prof files are written
+
+    @contextmanager
+    def stage(self, name: str) -> Generator[None, None, None]:
+        """Times the enclosed block as stage NAME, excluding time that nested
+        stages (or iter_chunks timings) record meanwhile"""
+        profiler = cProfile.Profile() if name == self.profile_stage else None
+        nested_before = sum(self.stages.values())
+        t0 = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+                self.dump_profile(profiler, name)
+            elapsed = time.perf_counter() - t0
+            nested = sum(self.stages.values()) - nested_before
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed - nested
+            self.peak_rss = max(self.peak_rss, peak_rss())
+
+    def dump_profile(self, profiler: cProfile.Profile, name: str) -> None:
+        profile_dir = Path(self.profile_dir or ".")
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        path = profile_dir / f"{self.table_name}.{name}.prof"
+        profiler.dump_stats(path)
+        _logger.info(f"{self.table_name}: Wrote {name} profile to {path}")
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(self.stages.values())
+
+    def as_record(self) -> dict:
+        record = asdict(self)
+        del record["profile_stage"], record["profile_dir"]
+        record["total_seconds"] = self.total_seconds
+        return record
+
+
+def write_metrics_jsonl(path: Path, metrics: Iterable[TableMetrics]) -> None:
+    """Writes one JSON record per table to PATH"""
+    with open(path, "w") as fh:
+        for m in metrics:
+            fh.write(json.dumps(m.as_record()) + "\n")
+
+
+def metrics_as_table(metrics: List[TableMetrics]) -> str:
+    """Formats METRICS as a text table with one row per table and a total row"""
+    if not metrics:
+        return "No metrics to display."
+
+    used = set().union(*(m.stages for m in metrics))
+    stages = [s for s in STAGES if s in used] + sorted(used - set(STAGES))
+    headers = ["Table", "Rows", "MB In", "MB Out"] + [f"{s} s" for s in stages] + ["Total s", "MB/s", "Peak RSS MB"]
+
+    def row(label: str, ms: List[TableMetrics]) -> List[str]:
+        bytes_in = sum(m.bytes_in for m in ms)
+        total = sum(m.total_seconds for m in ms)
+        rows = [m.rows for m in ms if m.rows is not None]
+        return (
+            [label, str(sum(rows)) if rows else "", f"{bytes_in / 1e6:.1f}", f"{sum(m.bytes_out for m in ms) / 1e6:.1f}"]
+            + [f"{sum(m.stages.get(s, 0.0) for m in ms):.2f}" for s in stages]
+            + [f"{total:.2f}", f"{bytes_in / 1e6 / total:.1f}" if total else "", f"{max(m.peak_rss for m in ms) / 1e6:.0f}"]
+        )
+
+    rows = [row(m.table_name, [m]) for m in sorted(metrics, key=lambda m: m.total_seconds, reverse=True)]
+    rows.append(row("(total)", metrics))
+    return format_text_table(headers, rows)
+
+
+def report_metrics(metrics: List[TableMetrics], metrics_out: Optional[Path]) -> None:
+    """Writes METRICS to METRICS_OUT (if given) and prints the summary table to stderr"""
+    if metrics_out:
+        write_metrics_jsonl(metrics_out, metrics)
+        _logger.info(f"Wrote metrics for {len(metrics)} tables to {metrics_out}")
+    print(metrics_as_table(metrics), file=sys.stderr)
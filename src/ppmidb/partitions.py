@@ -0,0 +1,60 @@
+"""Hash partitioning of large tables on patno
+
+Tables with at least PartitionPolicy.min_rows rows (as counted when the
+schema was inferred) and a patno column are created PARTITION BY HASH
+(patno) with PartitionPolicy.partitions partitions, named
+<table>_p<n>.  Rows are routed to partitions by the server during COPY,
+and indexes created on the table are built on each partition, so that
+loads, VACUUM and ANALYZE work on partitions of bounded size, and
+per-patient queries scan a single partition.
+
+A partitioned table cannot be UNLOGGED, so in bulk mode only the
+partitions of a staging table are UNLOGGED.
+"""
+
+from dataclasses import dataclass
+from typing import List, Optional
+
+from .infer_schema import ColumnSchema
+
+PARTITION_KEY = "patno"
+DEFAULT_PARTITIONS = 8
+
+
+@dataclass(frozen=True)
+class PartitionPolicy:
+    """Which tables are hash-partitioned on patno"""
+
+    min_rows: Optional[int] = None  # partition tables with at least this many rows; None to never partition
+    partitions: int = DEFAULT_PARTITIONS
+
+
+DEFAULT_PARTITION_POLICY = PartitionPolicy()
+
+
+def partition_count(schema: List[ColumnSchema], policy: Optional[PartitionPolicy] = None) -> Optional[int]:
+    """Returns the number of hash partitions of a table with SCHEMA under POLICY, or
+    None if it is not partitioned"""
+    policy = policy or DEFAULT_PARTITION_POLICY
+    if policy.min_rows is None or policy.partitions < 2:
+        return None
+    if not any(col.sql_name == PARTITION_KEY for col in schema):
+        return None
+    n_rows = schema[0].n_rows
+    if n_rows is None or n_rows < policy.min_rows:
+        return None
+    return policy.partitions
+
+
+def partition_names(table_name: str, partitions: int) -> List[str]:
+    return [f"{table_name}_p{i}" for i in range(partitions)]
+
+
+def generate_sql_create_partitions_ddl(table_name: str, partitions: int, unlogged: bool = False) -> str:
+    """Returns CREATE TABLE statements for the PARTITIONS hash partitions of TABLE_NAME"""
+    unlogged_sql = "UNLOGGED " if unlogged else ""
+    return "".join(
+        f'CREATE {unlogged_sql}TABLE IF NOT EXISTS "{name}" PARTITION OF "{table_name}" '
+        f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {i});\n"
+        for i, name in enumerate(partition_names(table_name, partitions))
+    )
@@ -0,0 +1,195 @@
+"""COPY in batches with savepoints, rejecting the rows that fail
+
+Normally a member is copied with a single COPY, and one row that the
+server rejects (e.g., text in an integer column) fails the whole member.
+A RejectingCopy instead splits the rows into batches of at most
+batch_rows rows (and, for text, batch_bytes bytes) and copies each batch
+within a savepoint.  A batch that fails is rolled back to its savepoint
+and bisected until the offending rows are isolated; those rows are
+rejected with the server's error message, and the rest of the batch is
+copied.  Good batches stay in the member's transaction, so one bad line
+costs a few extra COPYs rather than a reload of the member.
+
+Rejected rows are stored in the _ppmidb_rejects table of the target
+database, in the member's transaction.
+"""
+
+import csv
+from dataclasses import dataclass, field
+from io import StringIO
+import logging
+from typing import Generator, Iterable, List, Optional, Sequence, Tuple, Union
+
+from .metrics import TableMetrics
+from .repair import MAX_RECORD_LINES
+
+_logger = logging.getLogger()
+
+REJECTS_TABLE = "_ppmidb_rejects"
+DEFAULT_COPY_BATCH_ROWS = 10_000
+DEFAULT_MAX_REJECTED = 1000
+SAVEPOINT = "ppmidb_copy_batch"
+
+REJECTS_DDL = f"""CREATE TABLE IF NOT EXISTS "{REJECTS_TABLE}" (
+    "table_name" TEXT NOT NULL,
+    "line_number" BIGINT NOT NULL,
+    "sqlstate" TEXT,
+    "error" TEXT NOT NULL,
+    "record" TEXT NOT NULL,
+    "rejected_at" TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+);
+"""
+
+# A record is (line number, CSV text including its newline) or, for binary
+# COPY, (line number, row tuple)
+Record = Tuple[int, Union[str, tuple]]
+
+
+@dataclass
+class RejectedRecord:
+    line_number: int  # first line of the record, 1-based, counting the header
+    sqlstate: Optional[str]
+    error: str
+    record: str
+
+
+def iter_records(chunks: Iterable[str], first_line: int = 1) -> Generator[Tuple[int, str], None, None]:
+    """Yields (line number, text) for each CSV record in the text CHUNKS, where text
+    includes the terminating newline.  Records may span lines (quoted newlines); a
+    record that is still open after MAX_RECORD_LINES lines is yielded as is, and will
+    be rejected (use quarantine to remove such records before COPY)."""
+    partial = ""
+    lines: List[str] = []
+    quotes = 0
+    line_number = first_line
+    for chunk in chunks:
+        split = (partial + chunk).split("\n")
+        partial = split.pop()
+        for line in split:
+            lines.append(line + "\n")
+            quotes += line.count('"')
+            if quotes % 2 == 0 or len(lines) > MAX_RECORD_LINES:
+                yield line_number, "".join(lines)
+                line_number += len(lines)
+                lines, quotes = [], 0
+    if partial:
+        lines.append(partial)
+    if lines:
+        yield line_number, "".join(lines)
+
+
+def record_text(record: Union[str, tuple]) -> str:
+    """Returns RECORD as a line of CSV text without newline"""
+    if isinstance(record, str):
+        return record.rstrip("\r\n")
+    out = StringIO()
+    csv.writer(out, lineterminator="").writerow(["" if v is None else v for v in record])
+    return out.getvalue()
+
+
+@dataclass
+class RejectingCopy:
+    """Copies records in batches within savepoints and collects the rejected records"""
+
+    table_name: str
+    batch_rows: int = DEFAULT_COPY_BATCH_ROWS
+    batch_bytes: Optional[int] = None  # text batches are also cut at this size
+    max_rejected: int = DEFAULT_MAX_REJECTED  # more rejected records fail the member
+    rejected: List[RejectedRecord] = field(default_factory=list)
+
+    def iter_batches(self, records: Iterable[Record]) -> Generator[List[Record], None, None]:
+        batch: List[Record] = []
+        n_bytes = 0
+        for record in records:
+            batch.append(record)
+            if self.batch_bytes and isinstance(record[1], str):
+                n_bytes += len(record[1])
+            if len(batch) >= self.batch_rows or (self.batch_bytes and n_bytes >= self.batch_bytes):
+                yield batch
+                batch, n_bytes = [], 0
+        if batch:
+            yield batch
+
+    def copy(
+        self,
+        con,
+        query: str,
+        records: Iterable[Record],
+        types: Optional[List[str]] = None,
+        metrics: Optional[TableMetrics] = None,
+    ) -> int:
+        """COPYs RECORDS with QUERY (a COPY ... FROM STDIN without HEADER) over
+        connection CON and returns the number of rows copied.  TYPES are passed
+        to set_types() for binary COPY.  The caller commits."""
+        n_rows = 0
+        with con.cursor() as cur:
+            for batch in self.iter_batches(records):
+                n_rows += self._copy_batch(cur, query, batch, types, metrics)
+        return n_rows
+
+    def _copy_batch(
+        self, cur, query: str, batch: Sequence[Record], types: Optional[List[str]], metrics: Optional[TableMetrics]
+    ) -> int:
+        """Copies BATCH within a savepoint; on failure, bisects it and rejects the single records that fail"""
+        import psycopg
+
+        cur.execute(f"SAVEPOINT {SAVEPOINT}".encode())
+        try:
+            with cur.copy(query.encode()) as copy:
+                if types:
+                    copy.set_types(types)
+                    for _, row in batch:
+                        copy.write_row(row)
+                else:
+                    data = "".join(text for _, text in batch)
+                    copy.write(data)
+                    if metrics is not None:
+                        metrics.bytes_out += len(data)
+        except (psycopg.DataError, psycopg.IntegrityError) as e:
+            # release the failed savepoint too, so that bisection does not stack up subtransactions
+            cur.execute(f"ROLLBACK TO SAVEPOINT {SAVEPOINT}".encode())
+            cur.execute(f"RELEASE SAVEPOINT {SAVEPOINT}".encode())
+            if len(batch) == 1:
+                self._reject(batch[0], e)
+                return 0
+            mid = len(batch) // 2
+            return self._copy_batch(cur, query, batch[:mid], types, metrics) + self._copy_batch(
+                cur, query, batch[mid:], types, metrics
+            )
+        cur.execute(f"RELEASE SAVEPOINT {SAVEPOINT}".encode())
+        return len(batch)
+
+    def _reject(self, record: Record, e: Exception) -> None:
+        diag = getattr(e, "diag", None)
+        message = (diag.message_primary if diag else None) or str(e)
+        line_number, data = record
+        self.rejected.append(RejectedRecord(line_number, getattr(e, "sqlstate", None), message, record_text(data)))
+        if len(self.rejected) > self.max_rejected:
+            raise ValueError(f"More than {self.max_rejected} rows rejected (last: line {line_number}, {message})")
+
+
+def log_rejected(table_name: str, rejected: List[RejectedRecord]) -> None:
+    if rejected:
+        _logger.warning(
+            f"{table_name}: Rejected {len(rejected)} rows "
+            f"(first: line {rejected[0].line_number}, {rejected[0].error})"
+        )
+
+
+def ensure_rejects_table(con) -> None:
+    with con.cursor() as cur:
+        cur.execute(REJECTS_DDL.encode())
+
+
+def record_rejected(con, table_name: str, rejected: List[RejectedRecord]) -> None:
+    """Replaces the rejected records of TABLE_NAME in the rejects table.  The
+    caller commits, so that the records are written in the same transaction as the data."""
+    ensure_rejects_table(con)
+    with con.cursor() as cur:
+        cur.execute(f'DELETE FROM "{REJECTS_TABLE}" WHERE table_name = %s'.encode(), (table_name,))
+        if rejected:
+            cur.executemany(
+                f'INSERT INTO "{REJECTS_TABLE}" (table_name, line_number, sqlstate, error, record) '
+                f"VALUES (%s, %s, %s, %s, %s)".encode(),
+                [(table_name, r.line_number, r.sqlstate, r.error, r.record) for r in rejected],
+            )
@@ -0,0 +1,187 @@
+"""Record validation and quarantine of malformed records
+
+After the REPAIR_RULES (see sources) are applied, RecordValidator checks
+each record of the fixed text as it streams past: quotes must balance
+and the number of fields must match the header.  Records that fail are
+removed from the stream and kept as QuarantinedRecords, so that the rest
+of the member loads in one pass instead of failing COPY.  Records may
+span lines (quoted newlines); a record that is still open after
+MAX_RECORD_LINES lines is taken to have an unbalanced quote, and only its
+first line is quarantined.
+
+Quarantined records are stored in the _ppmidb_quarantine table of the
+target database, or written to a CSV side file.
+"""
+
+from collections import deque
+import csv
+from dataclasses import dataclass
+import logging
+from pathlib import Path
+import time
+from typing import Dict, Generator, Iterable, List, Optional, Tuple
+
+_logger = logging.getLogger()
+
+QUARANTINE_TABLE = "_ppmidb_quarantine"
+DEFAULT_MAX_QUARANTINED = 1000
+MAX_RECORD_LINES = 1000
+
+QUARANTINE_DDL = f"""CREATE TABLE IF NOT EXISTS "{QUARANTINE_TABLE}" (
+    "table_name" TEXT NOT NULL,
+    "line_number" BIGINT NOT NULL,
+    "reason" TEXT NOT NULL,
+    "record" TEXT NOT NULL,
+    "quarantined_at" TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+);
+"""
+
+
+@dataclass
+class QuarantinedRecord:
+    line_number: int  # first line of the record, 1-based, counting the header
+    reason: str
+    record: str
+
+
+class RecordValidator:
+    """Checks quote balance and field counts of CSV text that arrives in chunks
+
+    feed() returns the text of the valid records (and the header) in the
+    chunk; invalid records are appended to self.quarantined.  If more than
+    max_quarantined records are quarantined, ValueError is raised: the
+    member is likely corrupt (e.g., its header is truncated) and should
+    not be loaded.
+    """
+
+    def __init__(
+        self, max_quarantined: int = DEFAULT_MAX_QUARANTINED, quarantined: Optional[List[QuarantinedRecord]] = None
+    ):
+        self.max_quarantined = max_quarantined
+        self.quarantined: List[QuarantinedRecord] = quarantined if quarantined is not None else []
+        self.header: Optional[str] = None
+        self.n_fields: Optional[int] = None
+        self._partial = ""  # text after the last newline
+        self._open_lines: List[Tuple[str, bool]] = []  # (line, terminated) of a record with an open quote
+        self._open_quotes = 0
+        self._line_number = 0
+
+    def feed(self, text: str) -> str:
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        return self._run([(line, True) for line in lines])
+
+    def flush(self) -> str:
+        out = []
+        if self._partial:
+            out.append(self._run([(self._partial, False)]))
+            self._partial = ""
+        while self._open_lines:
+            out.append(self._run(self._restart()))
+        return "".join(out)
+
+    def _run(self, lines: List[Tuple[str, bool]]) -> str:
+        """Processes (line, terminated by newline) pairs and returns the valid text"""
+        out = []
+        queue = deque(lines)
+        while queue:
+            line, terminated = queue.popleft()
+            self._line_number += 1
+            quotes = line.count('"')
+            if not self._open_lines and quotes % 2 == 0:
+                if self._check(line, self._line_number):
+                    out.append(line + "\n" if terminated else line)
+                continue
+
+            self._open_lines.append((line, terminated))
+            self._open_quotes += quotes
+            if self._open_quotes % 2 == 0:
+                first_line = self._line_number - len(self._open_lines) + 1
+                record = "".join(text + "\n" if term else text for text, term in self._open_lines)
+                self._open_lines, self._open_quotes = [], 0
+                if self._check(record.rstrip("\n"), first_line):
+                    out.append(record)
+            elif len(self._open_lines) > MAX_RECORD_LINES:
+                queue.extendleft(reversed(self._restart()))
+        return "".join(out)
+
+    def _restart(self) -> List[Tuple[str, bool]]:
+        """Quarantines the first line of the open record and returns the rest, to be processed again"""
+        lines, self._open_lines, self._open_quotes = self._open_lines, [], 0
+        self._line_number -= len(lines) - 1
+        self._quarantine(self._line_number, "unbalanced quotes", [lines[0][0]])
+        return lines[1:]
+
+    def _check(self, record: str, line_number: int) -> bool:
+        if '"' in record:
+            n_fields = sum(part.count(",") for part in record.split('"')[::2]) + 1
+        else:
+            n_fields = record.count(",") + 1
+        if self.n_fields is None:
+            self.header, self.n_fields = record.rstrip("\r"), n_fields
+            return True
+        if n_fields != self.n_fields:
+            self._quarantine(line_number, f"expected {self.n_fields} fields, found {n_fields}", [record])
+            return False
+        return True
+
+    def _quarantine(self, line_number: int, reason: str, lines: List[str]) -> None:
+        self.quarantined.append(QuarantinedRecord(line_number, reason, "".join(lines).rstrip("\r\n")))
+        if len(self.quarantined) > self.max_quarantined:
+            message = f"More than {self.max_quarantined} malformed records (last: line {line_number}, {reason})"
+            if self.header is not None and len(self.header) == 1024:
+                message += "; the header appears to be truncated and the file is likely corrupt"
+            raise ValueError(message)
+
+
+def iter_valid_chunks(
+    chunks: Iterable[str], validator: RecordValidator, timings: Optional[Dict[str, float]] = None
+) -> Generator[str, None, None]:
+    """Yields the valid records of the text CHUNKS, in chunks; see RecordValidator.
+    If TIMINGS is given, the seconds spent validating are added to its "validate" entry."""
+    if timings is not None:
+        timings.setdefault("validate", 0.0)
+    for chunk in chunks:
+        t0 = time.perf_counter()
+        text = validator.feed(chunk)
+        if timings is not None:
+            timings["validate"] += time.perf_counter() - t0
+        if text:
+            yield text
+    if tail := validator.flush():
+        yield tail
+
+
+def log_quarantined(table_name: str, quarantined: List[QuarantinedRecord]) -> None:
+    if quarantined:
+        _logger.warning(
+            f"{table_name}: Quarantined {len(quarantined)} malformed records "
+            f"(first: line {quarantined[0].line_number}, {quarantined[0].reason})"
+        )
+
+
+def ensure_quarantine_table(con) -> None:
+    with con.cursor() as cur:
+        cur.execute(QUARANTINE_DDL.encode())
+
+
+def record_quarantined(con, table_name: str, quarantined: List[QuarantinedRecord]) -> None:
+    """Replaces the quarantined records of TABLE_NAME in the quarantine table.  The
+    caller commits, so that the records are written in the same transaction as the data."""
+    ensure_quarantine_table(con)
+    with con.cursor() as cur:
+        cur.execute(f'DELETE FROM "{QUARANTINE_TABLE}" WHERE table_name = %s'.encode(), (table_name,))
+        if quarantined:
+            cur.executemany(
+                f'INSERT INTO "{QUARANTINE_TABLE}" (table_name, line_number, reason, record) VALUES (%s, %s, %s, %s)'.encode(),
+                [(table_name, q.line_number, q.reason, q.record) for q in quarantined],
+            )
+
+
+def write_quarantine_file(path: Path, quarantined: List[QuarantinedRecord]) -> None:
+    """Writes QUARANTINED to the CSV file PATH"""
+    with open(path, "w", encoding="utf-8", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(["line_number", "reason", "record"])
+        for q in quarantined:
+            writer.writerow([q.line_number, q.reason, q.record])
@@ -0,0 +1,205 @@
+"""Persistent on-disk cache of inferred schemas
+
+Schema inference is the most CPU-expensive step of generating DDL or
+loading with --create-table, and a freeze rarely changes between runs.
+Inferred schemas are stored in a small SQLite database keyed by member
+name, CRC32 of the raw member, and a hash of its header line.  The least
+recently used entries are evicted when the cache exceeds its size limit.
+"""
+
+from dataclasses import asdict, dataclass
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import sqlite3
+import time
+from typing import Callable, Iterable, List, Optional, Union
+
+import polars as pl
+
+from .infer_schema import ColumnSchema
+from .sources import CsvMember
+
+_logger = logging.getLogger()
+
+# Bump when inference changes in a way that invalidates cached schemas
+CACHE_VERSION = 3
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Polars types that can be stored in the cache, by their string representation
+_POLARS_TYPES = {
+    str(t): t
+    for t in [
+        pl.Int8, pl.Int16, pl.Int32, pl.Int64,
+        pl.UInt8, pl.UInt16, pl.UInt32, pl.UInt64,
+        pl.Float32, pl.Float64,
+        pl.String, pl.Boolean, pl.Date, pl.Time, pl.Null,
+        pl.Datetime("us"), pl.Datetime("ns"), pl.Datetime("ms"),
+    ]
+}
+
+
+def default_cache_path() -> Path:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "ppmidb" / "schema_cache.sqlite"
+
+
+@dataclass(frozen=True)
+class SchemaCacheKey:
+    member_name: str
+    crc32: int
+    header_hash: str
+    variant: str = ""  # distinguishes inference options that change the result
+
+
+def schema_cache_key(member: CsvMember, variant: str = "") -> SchemaCacheKey:
+    header = member.read_header()
+    return SchemaCacheKey(
+        member_name=member.csv_path,
+        crc32=member.content_crc(),
+        header_hash=hashlib.sha1(header.encode()).hexdigest(),
+        variant=f"v{CACHE_VERSION}:{variant}",
+    )
+
+
+def inference_variant(tight_types: Iterable[str] = (), sample_size: Optional[int] = None) -> str:
+    """Returns the cache key variant for schemas inferred with TIGHT_TYPES from a
+    sample of SAMPLE_SIZE rows (None for all rows)"""
+    parts = []
+    if tight_types:
+        parts.append("tight=" + ",".join(sorted(tight_types)))
+    if sample_size is not None:
+        parts.append(f"sample={sample_size}")
+    return ";".join(parts)
+
+
+def _serialize(schema: List[ColumnSchema]) -> Optional[str]:
+    records = []
+    for col in schema:
+        record = asdict(col)
+        if isinstance(col.polars_type, pl.Enum):
+            record["polars_type"] = "Enum"
+            record["enum_labels"] = col.polars_type.categories.to_list()
+        elif str(col.polars_type) in _POLARS_TYPES:
+            record["polars_type"] = str(col.polars_type)
+        else:
+            return None
+        if col.csv_type is not None:
+            if str(col.csv_type) not in _POLARS_TYPES:
+                return None
+            record["csv_type"] = str(col.csv_type)
+        records.append(record)
+    return json.dumps(records)
+
+
+def _deserialize(text: str) -> List[ColumnSchema]:
+    schema = []
+    for record in json.loads(text):
+        if record["polars_type"] == "Enum":
+            record["polars_type"] = pl.Enum(record.pop("enum_labels"))
+        else:
+            record["polars_type"] = _POLARS_TYPES[record["polars_type"]]
+        if record.get("csv_type") is not None:
+            record["csv_type"] = _POLARS_TYPES[record["csv_type"]]
+        if record["value_range"] is not None:
+            record["value_range"] = tuple(record["value_range"])
+        schema.append(ColumnSchema(**record))
+    return schema
+
+
+class SchemaCache:
+    """SQLite-backed cache of inferred schemas with LRU size eviction
+
+    The connection is opened lazily and is not pickled, so a SchemaCache
+    can be passed to worker processes.
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = Path(path) if path else default_cache_path()
+        self.max_bytes = max_bytes
+        self._con: Optional[sqlite3.Connection] = None
+
+    def __getstate__(self):
+        return {"path": self.path, "max_bytes": self.max_bytes, "_con": None}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._con is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._con = sqlite3.connect(self.path, timeout=30)
+            self._con.execute("PRAGMA journal_mode=WAL")
+            self._con.execute(
+                """CREATE TABLE IF NOT EXISTS schema_cache (
+                    member_name TEXT NOT NULL,
+                    crc32 INTEGER NOT NULL,
+                    header_hash TEXT NOT NULL,
+                    variant TEXT NOT NULL,
+                    schema_json TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (member_name, crc32, header_hash, variant)
+                )"""
+            )
+            self._con.commit()
+        return self._con
+
+    def get(self, key: SchemaCacheKey) -> Optional[List[ColumnSchema]]:
+        con = self._connect()
+        row = con.execute(
+            "SELECT schema_json FROM schema_cache WHERE member_name=? AND crc32=? AND header_hash=? AND variant=?",
+            (key.member_name, key.crc32, key.header_hash, key.variant),
+        ).fetchone()
+        if row is None:
+            return None
+        con.execute(
+            "UPDATE schema_cache SET last_used=? WHERE member_name=? AND crc32=? AND header_hash=? AND variant=?",
+            (time.time(), key.member_name, key.crc32, key.header_hash, key.variant),
+        )
+        con.commit()
+        return _deserialize(row[0])
+
+    def put(self, key: SchemaCacheKey, schema: List[ColumnSchema]) -> None:
+        schema_json = _serialize(schema)
+        if schema_json is None:
+            _logger.debug(f"{key.member_name}: Schema has types that cannot be cached")
+            return
+        con = self._connect()
+        con.execute(
+            "INSERT OR REPLACE INTO schema_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key.member_name, key.crc32, key.header_hash, key.variant, schema_json, len(schema_json), time.time()),
+        )
+        self._evict(con)
+        con.commit()
+
+    def _evict(self, con: sqlite3.Connection) -> None:
+        """Deletes least recently used entries until the cache fits in max_bytes"""
+        total = con.execute("SELECT coalesce(sum(size_bytes), 0) FROM schema_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = con.execute("SELECT rowid, size_bytes FROM schema_cache ORDER BY last_used").fetchall()
+        evicted = []
+        for rowid, size_bytes in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((rowid,))
+            total -= size_bytes
+        con.executemany("DELETE FROM schema_cache WHERE rowid=?", evicted)
+        _logger.debug(f"Evicted {len(evicted)} schemas from {self.path}")
+
+
+def cached_infer(
+    cache: Optional[SchemaCache], member: CsvMember, infer: Callable[[], List[ColumnSchema]], variant: str = ""
+) -> List[ColumnSchema]:
+    """Returns the cached schema for MEMBER, or calls INFER and caches its result.
+    If CACHE is None, INFER is always called."""
+    if cache is None:
+        return infer()
+    key = schema_cache_key(member, variant)
+    schema = cache.get(key)
+    if schema is not None:
+        _logger.info(f"{member.table_name}: Using cached schema")
+        return schema
+    schema = infer()
+    cache.put(key, schema)
+    return schema
@@ -0,0 +1,116 @@
+"""Versioned freeze schemas and a stable alias schema
+
+Each freeze is loaded into its own schema (e.g., ppmi_20250401).  Once a
+freeze has loaded without errors, the alias schema (e.g., ppmi) is
+repointed to it: in one transaction, the views in the alias schema are
+dropped and recreated as SELECT * from the tables of the freeze schema.
+Queries against the alias therefore never see a partially loaded freeze,
+and the previous freeze schema remains in place so that the alias can be
+pointed back at it.
+"""
+
+import logging
+import re
+from pathlib import Path
+from typing import List, Optional
+
+_logger = logging.getLogger()
+
+DEFAULT_ALIAS_SCHEMA = "ppmi"
+
+# Tables in freeze schemas that are not exposed through the alias schema
+_INTERNAL_TABLE_PREFIX = "_ppmidb_"
+
+
+def freeze_schema_name(zip_file: str) -> Optional[str]:
+    """Returns ppmi_YYYYMMDD for the freeze date in the name of ZIP_FILE, or None
+    if the name does not contain a date"""
+    m = re.search(r"(\d{8})", Path(zip_file).name)
+    return f"ppmi_{m.group(1)}" if m else None
+
+
+def set_search_path(con, schema: str) -> None:
+    """Makes SCHEMA the default schema for unqualified names on connection CON"""
+    with con.cursor() as cur:
+        cur.execute("SELECT set_config('search_path', %s, false)".encode(), (f'"{schema}", public',))
+    con.commit()
+
+
+def schema_tables(cur, schema: str) -> List[str]:
+    """Returns the tables in SCHEMA, excluding partitions (see partitions)"""
+    cur.execute(
+        """SELECT c.relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relkind IN ('r', 'p') AND NOT c.relispartition
+        ORDER BY c.relname""".encode(),
+        (schema,),
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+def dependent_views(cur, table_name: str) -> List[str]:
+    """Returns the (schema-qualified) views and materialized views that select from
+    TABLE_NAME, which is resolved on the search path"""
+    cur.execute(
+        """SELECT DISTINCT v.oid::regclass::text FROM pg_depend d
+        JOIN pg_rewrite r ON r.oid = d.objid
+        JOIN pg_class v ON v.oid = r.ev_class
+        WHERE d.classid = 'pg_rewrite'::regclass AND d.refclassid = 'pg_class'::regclass
+        AND d.refobjid = to_regclass(%s) AND v.oid <> d.refobjid
+        ORDER BY 1""".encode(),
+        (f'"{table_name}"',),
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+def create_freeze_schema(con, schema: str, allow_existing: bool = False) -> None:
+    """Creates SCHEMA for loading a freeze.  Unless ALLOW_EXISTING (e.g., for an
+    incremental load), an existing schema that already has tables is an error,
+    so that a freeze is never loaded on top of another."""
+    with con.cursor() as cur:
+        tables = [t for t in schema_tables(cur, schema) if not t.startswith(_INTERNAL_TABLE_PREFIX)]
+        if tables and not allow_existing:
+            raise RuntimeError(f"Schema {schema} already has {len(tables)} tables; drop it or load with --incremental")
+        cur.execute(f'CREATE SCHEMA IF NOT EXISTS "{schema}"'.encode())
+    con.commit()
+
+
+def alias_target(con, alias: str) -> Optional[str]:
+    """Returns the freeze schema that ALIAS points to, or None"""
+    with con.cursor() as cur:
+        cur.execute(
+            "SELECT obj_description(oid, 'pg_namespace') FROM pg_namespace WHERE nspname = %s".encode(),
+            (alias,),
+        )
+        row = cur.fetchone()
+    con.commit()
+    if row and row[0] and (m := re.match(r"ppmidb alias for (\S+)$", row[0])):
+        return m.group(1)
+    return None
+
+
+def repoint_alias(con, alias: str, schema: str) -> None:
+    """Atomically replaces the views in ALIAS with views of the tables in SCHEMA
+
+    Views are dropped without CASCADE: if other objects depend on the alias
+    views, the transaction fails and the alias is left unchanged.
+    """
+    previous = alias_target(con, alias)
+    try:
+        with con.cursor() as cur:
+            tables = [t for t in schema_tables(cur, schema) if not t.startswith(_INTERNAL_TABLE_PREFIX)]
+            if not tables:
+                raise RuntimeError(f"Schema {schema} has no tables")
+            cur.execute(f'CREATE SCHEMA IF NOT EXISTS "{alias}"'.encode())
+            cur.execute("SELECT viewname FROM pg_views WHERE schemaname = %s".encode(), (alias,))
+            for (view_name,) in cur.fetchall():
+                cur.execute(f'DROP VIEW "{alias}"."{view_name}"'.encode())
+            for table_name in tables:
+                cur.execute(
+                    f'CREATE VIEW "{alias}"."{table_name}" AS SELECT * FROM "{schema}"."{table_name}"'.encode()
+                )
+            cur.execute(f"COMMENT ON SCHEMA \"{alias}\" IS 'ppmidb alias for {schema}'".encode())
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    _logger.warning(f"Alias schema {alias} now points to {schema} ({len(tables)} tables; was {previous})")
@@ -0,0 +1,301 @@
+"""Sharded, compressed COPY scripts and their parallel replay
+
+generate-dml --out-dir writes each member as one or more shards: psql
+scripts with a COPY ... FROM STDIN statement and inline CSV data, each
+compressed with gzip or zstd.  With shard_bytes, members are split into
+shards of about that many bytes of (uncompressed) CSV text, cut at record
+boundaries, so that large tables can be replayed by several connections
+at once.  Shards are written by worker processes, largest members first,
+under temporary names that are renamed when complete.
+
+The shards are listed, largest first, in manifest.jsonl in the output
+directory, one JSON record per shard (see Shard).  Shards are
+independent, so they can be replayed in any order and in parallel,
+either with `ppmidb replay` or with psql, e.g.:
+
+    cd OUT_DIR && jq -r .path manifest.jsonl | xargs -P 8 -I{} sh -c 'gzip -dc {} | psql -q "$URI"'
+
+Tables must exist before shards are replayed (see generate-ddl).  replay
+records each replayed shard in the _ppmidb_replayed table in the shard's
+transaction and skips shards that are already recorded, so an
+interrupted replay can be restarted.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+import gzip
+import json
+import logging
+from multiprocessing import get_context
+from pathlib import Path
+from typing import IO, Generator, Iterable, List, Optional, Tuple
+
+from .loader import copy_query
+from .metrics import TableMetrics
+from .rejects import iter_records
+from .schemas import set_search_path
+from .sources import CsvMember, split_header
+
+_logger = logging.getLogger()
+
+SHARD_COMPRESSIONS = ["gzip", "zstd", "none"]
+SHARD_SUFFIXES = {"gzip": ".sql.gz", "zstd": ".sql.zst", "none": ".sql"}
+SHARD_MANIFEST = "manifest.jsonl"
+REPLAYED_TABLE = "_ppmidb_replayed"
+COPY_END = "\\.\n"
+READ_CHUNK_SIZE = 1 << 20
+
+REPLAYED_DDL = f"""CREATE TABLE IF NOT EXISTS "{REPLAYED_TABLE}" (
+    "member_name" TEXT NOT NULL,
+    "shard" INTEGER NOT NULL,
+    "table_name" TEXT NOT NULL,
+    "crc32" BIGINT NULL,
+    "row_count" BIGINT NULL,
+    "replayed_at" TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    PRIMARY KEY ("member_name", "shard")
+);
+"""
+
+
+@dataclass
+class Shard:
+    table_name: str
+    member_name: str
+    crc32: Optional[int]
+    shard: int  # 0-based index within the member
+    path: str  # relative to the output directory
+    compression: str  # one of SHARD_COMPRESSIONS
+    bytes: int  # CSV text, uncompressed
+    rows: Optional[int] = None  # known when members are split into shards
+
+
+@dataclass(frozen=True)
+class ShardOptions:
+    """Options that control how generate-dml writes shards"""
+
+    compression: str = "gzip"  # one of SHARD_COMPRESSIONS
+    compression_level: Optional[int] = None  # None for the library default
+    shard_bytes: Optional[int] = None  # split members into shards of about this many bytes; None for one per member
+    profile_stage: Optional[str] = None  # stage to run under cProfile (see metrics.STAGES)
+    profile_dir: Optional[Path] = None
+
+
+def open_shard(path: Path, mode: str, compression: str, level: Optional[int] = None) -> IO[str]:
+    """Opens the shard at PATH as text in MODE ("wt" or "rt") with COMPRESSION"""
+    if compression == "gzip":
+        return gzip.open(path, mode, compresslevel=level or 6, encoding="utf-8", newline="")
+    if compression == "zstd":
+        try:
+            from compression import zstd  # Python 3.14
+        except ImportError:
+            try:
+                import zstandard
+            except ImportError:
+                raise RuntimeError("zstd compression requires Python 3.14 or the zstandard package") from None
+            cctx = zstandard.ZstdCompressor(level=level or 3) if "w" in mode else None
+            return zstandard.open(path, mode, cctx=cctx, encoding="utf-8", newline="")
+        return zstd.open(path, mode, level=level if "w" in mode else None, encoding="utf-8", newline="")
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+def _iter_shard_texts(
+    chunks: Iterable[str], shard_bytes: Optional[int]
+) -> Generator[Tuple[Iterable[str], Optional[int], bool], None, None]:
+    """Yields (texts, number of records, whether texts start with the header) for
+    each shard of the CSV CHUNKS, which start with the header.  Without
+    SHARD_BYTES, there is a single shard of all chunks, and the number of
+    records is not counted."""
+    if shard_bytes is None:
+        yield chunks, None, True
+        return
+    records = iter_records(chunks)
+    next(records, None)  # the header
+    texts: List[str] = []
+    n_bytes = 0
+    for _, text in records:
+        texts.append(text)
+        n_bytes += len(text)
+        if n_bytes >= shard_bytes:
+            yield texts, len(texts), False
+            texts, n_bytes = [], 0
+    if texts:
+        yield texts, len(texts), False
+
+
+def write_member_shards(member: CsvMember, out_dir: Path, options: ShardOptions) -> Tuple[List[Shard], TableMetrics]:
+    """Writes MEMBER to shards <table_name>.<n>.sql.gz (or .zst) in OUT_DIR and returns them
+    with the member's metrics.  This function is run in worker processes."""
+    table_name = member.table_name
+    metrics = TableMetrics(
+        table_name, bytes_in=member.file_size, profile_stage=options.profile_stage, profile_dir=options.profile_dir
+    )
+    suffix = SHARD_SUFFIXES[options.compression]
+    crc32 = member.content_crc()  # reads the whole file if it is not a zip member
+    shards = []
+    with metrics.stage("write"):
+        header, chunks = split_header(member.iter_chunks(timings=metrics.stages))
+        for index, (texts, n_records, with_header) in enumerate(_iter_shard_texts(chunks, options.shard_bytes)):
+            query = copy_query(table_name, header, with_header=with_header)
+            path = Path(out_dir) / f"{table_name}.{index:04d}{suffix}"
+            tmp_path = path.with_name(path.name + ".tmp")
+            n_bytes = 0
+            last_text = "\n"
+            try:
+                with open_shard(tmp_path, "wt", options.compression, options.compression_level) as fh:
+                    fh.write("SET client_encoding = 'UTF8';\n")
+                    fh.write(query + ";\n")
+                    for text in texts:
+                        if text:
+                            fh.write(text)
+                            n_bytes += len(text)
+                            last_text = text
+                    if not last_text.endswith("\n"):
+                        fh.write("\n")  # the last record of a member may have no newline
+                    fh.write(COPY_END)
+            except Exception:
+                tmp_path.unlink(missing_ok=True)
+                raise
+            tmp_path.replace(path)
+            metrics.bytes_out += path.stat().st_size
+            shards.append(Shard(table_name, member.csv_path, crc32, index, path.name, options.compression, n_bytes, n_records))
+    if options.shard_bytes:
+        metrics.rows = sum(shard.rows for shard in shards)
+    return shards, metrics
+
+
+def write_shards_parallel(
+    members: Iterable[CsvMember],
+    out_dir: Path,
+    options: ShardOptions,
+    jobs: int,
+    errors: List[str],
+    metrics: Optional[List[TableMetrics]] = None,
+) -> List[Shard]:
+    """Writes the shards of MEMBERS to OUT_DIR using JOBS worker processes, largest
+    members first, then writes the shard manifest and returns the shards.
+    Failures are logged and appended to ERRORS, and member metrics to METRICS,
+    if given."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    members = sorted(members, key=lambda m: m.file_size, reverse=True)
+    shards = []
+
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=get_context("spawn")) as pool:
+        futures = {pool.submit(write_member_shards, member, out_dir, options): member for member in members}
+        for future in as_completed(futures):
+            member = futures[future]
+            try:
+                member_shards, member_metrics = future.result()
+            except Exception as e:
+                _logger.error(f"Error writing shards of '{member.csv_path}': {e}")
+                errors.append(member.table_name + " (" + str(e) + ")")
+                continue
+            _logger.info(f"{member.table_name}: Wrote {len(member_shards)} shards")
+            shards.extend(member_shards)
+            if metrics is not None:
+                metrics.append(member_metrics)
+
+    shards.sort(key=lambda s: s.bytes, reverse=True)
+    with open(out_dir / SHARD_MANIFEST, "w") as fh:
+        for shard in shards:
+            fh.write(json.dumps(asdict(shard)) + "\n")
+    return shards
+
+
+def read_shard_manifest(out_dir: Path) -> List[Shard]:
+    with open(Path(out_dir) / SHARD_MANIFEST) as fh:
+        return [Shard(**json.loads(line)) for line in fh if line.strip()]
+
+
+def iter_copy_data(fh: IO[str]) -> Generator[str, None, None]:
+    """Yields the COPY data of the shard FH, positioned after its COPY statement,
+    without the terminating COPY_END line"""
+    tail = ""
+    while chunk := fh.read(READ_CHUNK_SIZE):
+        data = tail + chunk
+        data, tail = data[: -len(COPY_END)], data[-len(COPY_END) :]
+        if data:
+            yield data
+    if tail != COPY_END:
+        raise ValueError(f"{getattr(fh, 'name', 'shard')}: Truncated shard (no end of COPY data)")
+
+
+def replay_shard(con, out_dir: Path, shard: Shard) -> Optional[int]:
+    """COPYs SHARD over connection CON and records it in the replayed table, in one
+    transaction, and returns the number of rows copied, or None if the shard
+    was replayed before"""
+    try:
+        with con.cursor() as cur:
+            cur.execute(
+                f'SELECT crc32 FROM "{REPLAYED_TABLE}" WHERE member_name = %s AND shard = %s'.encode(),
+                (shard.member_name, shard.shard),
+            )
+            if row := cur.fetchone():
+                if row[0] != shard.crc32:
+                    raise ValueError(f"{shard.path}: {shard.member_name} was replayed from a different file")
+                con.rollback()
+                return None
+            with open_shard(Path(out_dir) / shard.path, "rt", shard.compression) as fh:
+                query = ""
+                while not query.startswith("COPY "):
+                    if not (query := fh.readline()):
+                        raise ValueError(f"{shard.path}: No COPY statement")
+                with cur.copy(query.rstrip().rstrip(";").encode()) as copy:
+                    for data in iter_copy_data(fh):
+                        copy.write(data)
+            row_count = cur.rowcount
+            if shard.rows is not None and row_count != shard.rows:
+                raise ValueError(f"{shard.path}: Copied {row_count} rows; expected {shard.rows}")
+            cur.execute(
+                f'INSERT INTO "{REPLAYED_TABLE}" (member_name, shard, table_name, crc32, row_count) '
+                f"VALUES (%s, %s, %s, %s, %s)".encode(),
+                (shard.member_name, shard.shard, shard.table_name, shard.crc32, row_count),
+            )
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    return row_count
+
+
+def replay_parallel(uri: str, out_dir: Path, jobs: int, errors: List[str], schema: Optional[str] = None) -> int:
+    """Replays the shards in OUT_DIR (see read_shard_manifest) into the database at
+    URI over JOBS connections, largest first, and returns the number of rows
+    copied.  If SCHEMA is given, it is the search path of the connections.
+    Failures are logged and appended to ERRORS."""
+    from psycopg_pool import ConnectionPool
+
+    shards = read_shard_manifest(out_dir)
+    n_rows = 0
+    with (
+        ConnectionPool(
+            uri,
+            min_size=1,
+            max_size=jobs,
+            configure=(lambda con: set_search_path(con, schema)) if schema else None,
+        ) as pool,
+        ThreadPoolExecutor(max_workers=jobs) as executor,
+    ):
+        with pool.connection() as con:
+            with con.cursor() as cur:
+                cur.execute(REPLAYED_DDL.encode())
+
+        def replay(shard: Shard) -> Optional[int]:
+            with pool.connection() as con:
+                return replay_shard(con, out_dir, shard)
+
+        futures = {executor.submit(replay, shard): shard for shard in shards}
+        for future in as_completed(futures):
+            shard = futures[future]
+            try:
+                row_count = future.result()
+            except Exception as e:
+                _logger.error(f"Error replaying '{shard.path}': {e}")
+                errors.append(shard.table_name + " (" + str(e) + ")")
+                continue
+            if row_count is None:
+                _logger.info(f"{shard.path}: Already replayed; skipped")
+            else:
+                _logger.info(f"{shard.path}: Replayed ({row_count} rows)")
+                n_rows += row_count
+    return n_rows
@@ -0,0 +1,311 @@
+"""Streaming access to PPMI CSV files, either as members of a freeze zip
+file or as standalone files on disk.
+
+Members are decoded incrementally and the known CSV bugs are fixed
+chunk-by-chunk, so that memory use is bounded by the chunk size rather
+than by the size of the member.
+"""
+
+import codecs
+import fnmatch
+from contextlib import closing, contextmanager
+from dataclasses import dataclass
+import logging
+import os
+from pathlib import Path
+import re
+import time
+from typing import BinaryIO, Dict, Generator, Iterable, Iterator, List, Optional, Tuple
+from zipfile import ZipFile
+import zlib
+
+import polars as pl
+
+from .infer_schema import clean_for_sql_name
+
+PPMI_CSV_ENCODING = "cp1252"
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class RepairRule:
+    """Replaces OLD with NEW in members whose file name matches the glob
+    FILE_PATTERN (all members if None)"""
+
+    old: str
+    new: str
+    file_pattern: Optional[str] = None
+    description: str = ""
+
+    def applies_to(self, csv_path: str) -> bool:
+        return self.file_pattern is None or fnmatch.fnmatch(Path(csv_path).name, self.file_pattern)
+
+
+# Applied in order; see register_repair_rule
+REPAIR_RULES: List[RepairRule] = [
+    RepairRule('\\"', '""', description='Quotes in values are escaped as \\" instead of ""'),
+    RepairRule(
+        'no tremors today. \\"",,"3",',
+        'no tremors today.",,"3",',
+        file_pattern="Primary_Clinical_Diagnosis_*.csv",
+        description="In Primary_Clinical_Diagnosis_20250401.csv at least, the CSV is invalid",
+    ),
+]
+
+_logger = logging.getLogger()
+
+
+def register_repair_rule(rule: RepairRule) -> None:
+    """Adds RULE to the rules applied to matching members, after the existing rules"""
+    REPAIR_RULES.append(rule)
+
+
+def csv_fixes_for(csv_path: str) -> List[Tuple[str, str]]:
+    """Returns the (old, new) replacements that apply to CSV_PATH, in order"""
+    return [(rule.old, rule.new) for rule in REPAIR_RULES if rule.applies_to(csv_path)]
+
+
+def table_name_for(csv_path: str) -> str:
+    """Returns the SQL table name for CSV_PATH, without the freeze date suffix"""
+    table_name = clean_for_sql_name(Path(csv_path).stem)
+    return re.sub(r"_\d{8}$", r"", table_name)
+
+
+class StreamReplacer:
+    """Replaces OLD with NEW in text that arrives in chunks
+
+    The result is identical to str.replace on the concatenated text: the
+    tail of each chunk that could be the start of a match is held back
+    until the next chunk (or flush) arrives.
+    """
+
+    def __init__(self, old: str, new: str):
+        if not old:
+            raise ValueError("Replacement target must not be empty")
+        self.old = old
+        self.new = new
+        self._pending = ""
+
+    def feed(self, text: str) -> str:
+        buf = self._pending + text
+        # matches that start before limit are entirely within buf
+        limit = len(buf) - (len(self.old) - 1)
+        out = []
+        pos = 0
+        while True:
+            i = buf.find(self.old, pos)
+            if i < 0 or i >= limit:
+                break
+            out.append(buf[pos:i])
+            out.append(self.new)
+            pos = i + len(self.old)
+        cut = max(pos, limit)
+        out.append(buf[pos:cut])
+        self._pending = buf[cut:]
+        return "".join(out)
+
+    def flush(self) -> str:
+        rest, self._pending = self._pending, ""
+        return rest
+
+
+class StreamStripper:
+    """Strips leading and trailing whitespace from text that arrives in chunks"""
+
+    def __init__(self):
+        self._started = False
+        self._held = ""
+
+    def feed(self, text: str) -> str:
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+        text = self._held + text
+        stripped = text.rstrip()
+        self._held = text[len(stripped):]
+        return stripped
+
+    def flush(self) -> str:
+        self._held = ""
+        return ""
+
+
+def iter_fixed_chunks(
+    stream: BinaryIO,
+    csv_path: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    timings: Optional[Dict[str, float]] = None,
+) -> Generator[str, None, None]:
+    """
+    Yields decoded and fixed text chunks read from the binary STREAM.  The
+    concatenation of the chunks is identical to applying the replacements
+    of csv_fixes_for(CSV_PATH) in order with str.replace to the whole
+    decoded stream and stripping the result, but at most ~CHUNK_SIZE bytes
+    are held at once.
+
+    If TIMINGS is given, the seconds spent reading (including zip
+    decompression), decoding and fixing are added to its "read", "decode"
+    and "fix" entries.
+    """
+    decoder = codecs.getincrementaldecoder(PPMI_CSV_ENCODING)()
+    stages = [StreamReplacer(old, new) for old, new in csv_fixes_for(csv_path)]
+    stages.append(StreamStripper())
+
+    def run(text: str, start: int = 0) -> str:
+        for stage in stages[start:]:
+            if not text:
+                break
+            text = stage.feed(text)
+        return text
+
+    if timings is None:
+        while data := stream.read(chunk_size):
+            if text := run(decoder.decode(data)):
+                yield text
+    else:
+        for key in ("read", "decode", "fix"):
+            timings.setdefault(key, 0.0)
+        while True:
+            t0 = time.perf_counter()
+            data = stream.read(chunk_size)
+            t1 = time.perf_counter()
+            timings["read"] += t1 - t0
+            if not data:
+                break
+            text = decoder.decode(data)
+            t2 = time.perf_counter()
+            timings["decode"] += t2 - t1
+            text = run(text)
+            timings["fix"] += time.perf_counter() - t2
+            if text:
+                yield text
+
+    # flush each stage in turn, passing what it held back through the later stages
+    tail = run(decoder.decode(b"", final=True))
+    for i, stage in enumerate(stages):
+        tail += run(stage.flush(), i + 1)
+    if tail:
+        yield tail
+
+
+def split_header(chunks: Iterable[str]) -> Tuple[str, Iterator[str]]:
+    """
+    Returns (header line, chunks) where chunks still includes the header
+    line, so that the stream can be passed unchanged to COPY ... HEADER
+    """
+    it = iter(chunks)
+    buf = ""
+    for chunk in it:
+        buf += chunk
+        if "\n" in buf:
+            break
+    header = buf.split("\n", 1)[0].rstrip("\r")
+
+    def rejoined() -> Generator[str, None, None]:
+        if buf:
+            yield buf
+        yield from it
+
+    return header, rejoined()
+
+
+def spool_chunks(chunks: Iterable[str], path: Path) -> int:
+    """Writes CHUNKS to PATH as UTF-8 and returns the number of bytes written"""
+    n_bytes = 0
+    with open(path, "w", encoding="utf-8", newline="") as fh:
+        for chunk in chunks:
+            n_bytes += fh.write(chunk)
+    return n_bytes
+
+
+def iter_file_chunks(path: Path, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Generator[str, None, None]:
+    """Yields UTF-8 text chunks of at most CHUNK_SIZE characters from PATH (e.g., a spool file)"""
+    with open(path, encoding="utf-8", newline="") as fh:
+        while chunk := fh.read(chunk_size):
+            yield chunk
+
+
+def iter_csv_batches(
+    path: Path, schema_overrides: Dict[str, pl.DataType], batch_rows: int
+) -> Generator[pl.DataFrame, None, None]:
+    """Yields frames of about BATCH_ROWS rows parsed from the CSV file at PATH
+    (e.g., a spool file) with the given column types"""
+    lf = pl.scan_csv(path, schema_overrides=schema_overrides)
+    if hasattr(lf, "collect_batches"):
+        yield from lf.collect_batches(chunk_size=batch_rows)
+    else:
+        reader = pl.read_csv_batched(path, schema_overrides=schema_overrides, batch_size=batch_rows)
+        while batches := reader.next_batches(1):
+            yield from batches
+
+
+@dataclass(frozen=True)
+class CsvMember:
+    """
+    A CSV file to be loaded, either a member of the zip file ZIP_PATH or,
+    if ZIP_PATH is None, a standalone file at CSV_PATH
+    """
+
+    csv_path: str
+    file_size: int
+    crc: Optional[int] = None  # CRC32 from the zip directory, if available
+    zip_path: Optional[str] = None
+
+    @property
+    def table_name(self) -> str:
+        return table_name_for(self.csv_path)
+
+    @contextmanager
+    def open(self) -> Generator[BinaryIO, None, None]:
+        """Opens the raw (undecoded) member for reading"""
+        if self.zip_path is None:
+            with open(self.csv_path, "rb") as fh:
+                yield fh
+        else:
+            with ZipFile(self.zip_path) as zf, zf.open(self.csv_path) as fh:
+                yield fh
+
+    def content_crc(self) -> int:
+        """Returns the CRC32 of the raw member, from the zip directory if available"""
+        if self.crc is not None:
+            return self.crc
+        crc = 0
+        with self.open() as fh:
+            while data := fh.read(DEFAULT_CHUNK_SIZE):
+                crc = zlib.crc32(data, crc)
+        return crc
+
+    def iter_chunks(
+        self, chunk_size: int = DEFAULT_CHUNK_SIZE, timings: Optional[Dict[str, float]] = None
+    ) -> Generator[str, None, None]:
+        """Yields decoded and fixed text chunks of the member (see iter_fixed_chunks for TIMINGS)"""
+        with self.open() as fh:
+            yield from iter_fixed_chunks(fh, self.csv_path, chunk_size=chunk_size, timings=timings)
+
+    def read_header(self) -> str:
+        """Returns the fixed header line, closing the member before returning"""
+        with closing(self.iter_chunks()) as chunks:
+            header, _ = split_header(chunks)
+        return header
+
+
+def member_generator(file_paths: List[str], zip_file: Optional[str]) -> Generator[CsvMember, None, None]:
+    """
+    Yields a CsvMember for each file to be processed.  If ZIP_FILE is given,
+    all members are yielded, or only those named in FILE_PATHS if it is not
+    empty; otherwise, FILE_PATHS are standalone files.
+    """
+    if zip_file:
+        file_set = set(file_paths)
+        with ZipFile(zip_file) as zf:
+            infolist = zf.infolist()
+        for zi in infolist:
+            if file_set and zi.filename not in file_set:
+                _logger.debug(f"{zi.filename}: Not in requested files")
+                continue
+            yield CsvMember(csv_path=zi.filename, file_size=zi.file_size, crc=zi.CRC, zip_path=str(zip_file))
+    else:
+        for csv_path in file_paths:
+            yield CsvMember(csv_path=csv_path, file_size=os.path.getsize(csv_path))
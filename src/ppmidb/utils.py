@@ -1,13 +1,34 @@
 import logging
-from typing import Optional, List
+from typing import Optional, List, Tuple
 
-from .infer_schema import ColumnSchema
+import polars as pl
+
+from .indexes import IndexPolicy, IndexSpec, plan_indexes
+from .infer_schema import ColumnSchema, enum_type_name
+from .partitions import PARTITION_KEY, generate_sql_create_partitions_ddl
 
 _logger = logging.getLogger()
 
-indexed_columns = [
-    "patno"
-]
+
+def format_text_table(headers: List[str], rows: List[List[str]]) -> str:
+    """
+    Formats ROWS of strings as a text table with a header line and columns
+    sized to fit their widest value.
+    """
+    # Calculate column widths dynamically
+    col_widths = [len(header) for header in headers]
+    for row in rows:
+        col_widths = [max(width, len(value)) for width, value in zip(col_widths, row)]
+
+    # Print header
+    header_line = " | ".join(f"{header:<{width}}" for header, width in zip(headers, col_widths))
+    table_str = header_line + "\n"
+    table_str += "-" * len(header_line) + "\n"
+
+    # Print data rows
+    for row in rows:
+        table_str += " | ".join(f"{value:<{width}}" for value, width in zip(row, col_widths)) + "\n"
+    return table_str
 
 
 def schema_as_table(schema_records: List[ColumnSchema]) -> str:
@@ -21,8 +42,6 @@ def schema_as_table(schema_records: List[ColumnSchema]) -> str:
     if not schema_records:
         return "No schema records to display."
 
-    table_str = ""
-
     headers = [
         "CSV Name",
         "SQL Name",
@@ -32,65 +51,38 @@ def schema_as_table(schema_records: List[ColumnSchema]) -> str:
         "Optimal SQL Type",
     ]
 
-    # Calculate column widths dynamically
-    col_widths = {header: len(header) for header in headers}
-
-    for col_schema in schema_records:
-        polars_type_str = str(col_schema.polars_type)
-        is_nullable_str = "Yes" if col_schema.is_nullable else "No"
-        value_range_str = (
-            f"({col_schema.value_range[0]} to {col_schema.value_range[1]})"
-            if col_schema.value_range
-            else "N/A"
-        )
-
-        col_widths["CSV Name"] = max(col_widths["CSV Name"], len(col_schema.csv_name))
-        col_widths["SQL Name"] = max(col_widths["SQL Name"], len(col_schema.sql_name))
-        col_widths["Polars Type"] = max(col_widths["Polars Type"], len(polars_type_str))
-        col_widths["Nullable"] = max(col_widths["Nullable"], len(is_nullable_str))
-        col_widths["Value Range"] = max(col_widths["Value Range"], len(value_range_str))
-        col_widths["Optimal SQL Type"] = max(
-            col_widths["Optimal SQL Type"], len(col_schema.sql_type)
-        )
-
-    # Print header
-    header_line = (
-        f"{headers[0]:<{col_widths['CSV Name']}} | "
-        f"{headers[1]:<{col_widths['SQL Name']}} | "
-        f"{headers[2]:<{col_widths['Polars Type']}} | "
-        f"{headers[3]:<{col_widths['Nullable']}} | "
-        f"{headers[4]:<{col_widths['Value Range']}} | "
-        f"{headers[5]:<{col_widths['Optimal SQL Type']}}"
-    )
-    table_str += header_line + "\n"
-    table_str += "-" * len(header_line) + "\n"
-
-    # Print data rows
+    rows = []
     for col_schema in schema_records:
         polars_type_str = str(col_schema.polars_type)
+        if isinstance(col_schema.polars_type, pl.Enum):
+            polars_type_str = f"Enum({len(col_schema.polars_type.categories)} labels)"
         is_nullable_str = "Yes" if col_schema.is_nullable else "No"
         value_range_str = (
             f"({col_schema.value_range[0]} to {col_schema.value_range[1]})"
             if col_schema.value_range
             else "N/A"
         )
-
-        row_line = (
-            f"{col_schema.csv_name:<{col_widths['CSV Name']}} | "
-            f"{col_schema.sql_name:<{col_widths['SQL Name']}} | "
-            f"{polars_type_str:<{col_widths['Polars Type']}} | "
-            f"{is_nullable_str:<{col_widths['Nullable']}} | "
-            f"{value_range_str:<{col_widths['Value Range']}} | "
-            f"{col_schema.sql_type:<{col_widths['Optimal SQL Type']}}"
+        rows.append(
+            [
+                col_schema.csv_name,
+                col_schema.sql_name,
+                polars_type_str,
+                is_nullable_str,
+                value_range_str,
+                col_schema.sql_type,
+            ]
         )
-        table_str += row_line + "\n"
-    return table_str
+    return format_text_table(headers, rows)
 
 
 def generate_sql_create_table_ddl(
     schema_records: List[ColumnSchema],
     table_name: str,
     primary_key_sql_name: Optional[str] = None,
+    unlogged: bool = False,
+    include_indexes: bool = True,
+    index_policy: Optional[IndexPolicy] = None,
+    partitions: Optional[int] = None,
 ) -> str:
     """
     Generates a PostgreSQL CREATE TABLE DDL statement from a list of ColumnSchema records.
@@ -99,6 +91,12 @@ def generate_sql_create_table_ddl(
     table_name (str): The desired name for the SQL table.
         primary_key_sql_name (Optional[str]): The `sql_name` of the column to set as PRIMARY KEY.
     If None, no primary key constraint is added.
+        unlogged (bool): If True, the table is created UNLOGGED (e.g., for bulk loading).
+        include_indexes (bool): If False, indexes are omitted so that they can be built after loading
+            (see generate_sql_create_index_ddl).
+        index_policy (Optional[IndexPolicy]): The policy that chooses indexes (see indexes.plan_indexes).
+        partitions (Optional[int]): If given, the table is hash-partitioned on patno into this many
+            partitions (see partitions.partition_count); with unlogged, only the partitions are UNLOGGED.
 
     Returns:
         str: The complete PostgreSQL CREATE TABLE DDL statement.
@@ -112,20 +110,62 @@ def generate_sql_create_table_ddl(
         column_definitions.append(f'    "{col_schema.sql_name}" {col_schema.sql_type}')
 
     if primary_key_sql_name:
-        if primary_key_sql_name in existing_sql_names:
+        if partitions and primary_key_sql_name != PARTITION_KEY:
+            _logger.warning(
+                f"Primary key column '{primary_key_sql_name}' omitted; the primary key of a partitioned table must include {PARTITION_KEY}."
+            )
+        elif primary_key_sql_name in existing_sql_names:
             column_definitions.append(f'    PRIMARY KEY ("{primary_key_sql_name}")')
         else:
             _logger.warning(
                 f"Primary key column '{primary_key_sql_name}' not found in inferred SQL names."
             )
 
-    ddl_statement = f'CREATE TABLE IF NOT EXISTS "{table_name}" (\n'
+    unlogged_sql = "UNLOGGED " if unlogged and not partitions else ""
+    ddl_statement = generate_sql_create_enum_ddl(schema_records)
+    ddl_statement += f'CREATE {unlogged_sql}TABLE IF NOT EXISTS "{table_name}" (\n'
     ddl_statement += ",\n".join(column_definitions)
-    ddl_statement += "\n);\n\n"
+    if partitions:
+        ddl_statement += f'\n) PARTITION BY HASH ("{PARTITION_KEY}");\n'
+        ddl_statement += generate_sql_create_partitions_ddl(table_name, partitions, unlogged=unlogged) + "\n"
+    else:
+        ddl_statement += "\n);\n\n"
+
+    if include_indexes:
+        ddl_statement += generate_sql_create_index_ddl(schema_records, table_name, index_policy)
 
-    for col_name in existing_sql_names:
-        if col_name in indexed_columns:
-            index_name = f"idx_{table_name}_{col_name}"
-            ddl_statement += f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table_name}" ("{col_name}");\n'
+    return ddl_statement
 
+
+def generate_sql_create_enum_ddl(schema_records: List[ColumnSchema]) -> str:
+    """Returns statements that create the enum types of the enum columns in
+    SCHEMA_RECORDS (see infer_schema.tighten_schema), unless they exist"""
+    ddl_statement = ""
+    created = set()
+    for col in schema_records:
+        if not isinstance(col.polars_type, pl.Enum):
+            continue
+        type_name = enum_type_name(col.polars_type)
+        if type_name in created:
+            continue
+        created.add(type_name)
+        labels = ", ".join("'" + label.replace("'", "''") + "'" for label in col.polars_type.categories.to_list())
+        ddl_statement += (
+            f'DO $ppmidb$ BEGIN CREATE TYPE "{type_name}" AS ENUM ({labels}); '
+            "EXCEPTION WHEN duplicate_object THEN NULL; END $ppmidb$;\n"
+        )
     return ddl_statement
+
+
+def index_names(
+    schema_records: List[ColumnSchema], table_name: str, index_policy: Optional[IndexPolicy] = None
+) -> List[Tuple[str, IndexSpec]]:
+    """Returns (index name, index) for each index of TABLE_NAME planned under INDEX_POLICY"""
+    return [(spec.name(table_name), spec) for spec in plan_indexes(schema_records, index_policy)]
+
+
+def generate_sql_create_index_ddl(
+    schema_records: List[ColumnSchema], table_name: str, index_policy: Optional[IndexPolicy] = None
+) -> str:
+    """Returns CREATE INDEX statements for the indexes of TABLE_NAME planned under INDEX_POLICY"""
+    return "".join(spec.ddl(table_name) for spec in plan_indexes(schema_records, index_policy))
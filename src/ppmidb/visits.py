@@ -0,0 +1,355 @@
+"""A precomputed, wide patient-visit table across the freeze tables
+
+Most analyses join many freeze tables on (patno, event_id).  The visit
+matrix does those joins once: patient_visit has one row per (patno,
+event_id) found in any source table (a table with patno and event_id
+columns) and, for each source table, its columns prefixed with the table
+name (e.g., moca__mcatot) plus <table>__n_rows, the number of source rows
+for the visit.  Where a table has several rows for a visit, the one with
+the latest last_update (if the table has that column) is used.
+
+The matrix is built in two steps:
+
+* each source table is reduced to one row per visit in a visit table
+  (_ppmidb_visit__<table>); these are built in parallel, on one
+  connection each
+* patient_visit is the left join of the visit tables on the union of
+  their keys, with a primary key on (patno, event_id)
+
+A refresh rebuilds only the visit tables of sources whose CRC32 in the
+manifest changed since the last build (or that are not in the manifest),
+records the patients whose visit rows differ in _ppmidb_visit_changes,
+and then replaces only those patients' rows of patient_visit.  If the
+set of source tables or their columns changed, the matrix is rebuilt.
+
+PostgreSQL tables have at most 1600 columns; select source tables if the
+freeze has more columns than that.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import hashlib
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from .delta import table_columns
+from .manifest import read_manifest
+from .schemas import set_search_path
+
+_logger = logging.getLogger()
+
+VISIT_TABLE = "patient_visit"
+VISIT_KEYS = ("patno", "event_id")
+VISIT_TABLE_PREFIX = "_ppmidb_visit__"
+VISIT_SOURCES_TABLE = "_ppmidb_visit_sources"
+VISIT_CHANGES_TABLE = "_ppmidb_visit_changes"
+MAX_COLUMNS = 1600  # PostgreSQL limit
+MAX_IDENTIFIER_BYTES = 63  # PostgreSQL limit (NAMEDATALEN - 1)
+
+VISIT_STATE_DDL = f"""CREATE TABLE IF NOT EXISTS "{VISIT_SOURCES_TABLE}" (
+    "table_name" TEXT NOT NULL PRIMARY KEY,
+    "crc32" BIGINT NULL,
+    "fingerprint" TEXT NOT NULL,
+    "built_at" TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+);
+CREATE TABLE IF NOT EXISTS "{VISIT_CHANGES_TABLE}" (
+    "patno" BIGINT NOT NULL PRIMARY KEY
+);
+"""
+
+
+def identifier(name: str) -> str:
+    """Returns NAME, shortened with a hash suffix if it is too long for a PostgreSQL identifier"""
+    if len(name.encode()) <= MAX_IDENTIFIER_BYTES:
+        return name
+    suffix = "_" + hashlib.sha1(name.encode()).hexdigest()[:8]
+    return name.encode()[: MAX_IDENTIFIER_BYTES - len(suffix)].decode(errors="ignore") + suffix
+
+
+@dataclass
+class VisitSource:
+    table_name: str
+    columns: List[str]  # all columns, in table order
+    crc32: Optional[int] = None  # from the manifest
+    size: int = 0  # bytes, including indexes and TOAST
+
+    @property
+    def visit_table(self) -> str:
+        return identifier(VISIT_TABLE_PREFIX + self.table_name)
+
+    @property
+    def value_columns(self) -> List[str]:
+        return [col for col in self.columns if col not in VISIT_KEYS]
+
+    @property
+    def visit_columns(self) -> List[str]:
+        """Columns of the visit table (and of patient_visit) after the keys"""
+        return [identifier(f"{self.table_name}__{col}") for col in ["n_rows"] + self.value_columns]
+
+    @property
+    def fingerprint(self) -> str:
+        return hashlib.sha1("\n".join(self.columns).encode()).hexdigest()[:16]
+
+
+@dataclass
+class VisitMatrixResult:
+    full: bool = False  # whether the matrix was rebuilt
+    rebuilt: List[str] = field(default_factory=list)  # source tables whose visit tables were rebuilt
+    patients: Optional[int] = None  # patients whose rows were replaced, if refreshed
+
+
+def ensure_visit_state(con) -> None:
+    with con.cursor() as cur:
+        cur.execute(VISIT_STATE_DDL.encode())
+
+
+def visit_sources(con, tables: Optional[Iterable[str]] = None) -> List[VisitSource]:
+    """Returns the tables of the current schema that have patno and event_id columns,
+    with their manifest CRC32s, limited to TABLES if given"""
+    with con.cursor() as cur:
+        cur.execute(
+            """SELECT c.relname, pg_total_relation_size(c.oid), a.attname
+            FROM pg_class c JOIN pg_attribute a ON a.attrelid = c.oid
+            WHERE c.relnamespace = current_schema()::regnamespace AND c.relkind IN ('r', 'p') AND NOT c.relispartition
+                AND a.attnum > 0 AND NOT a.attisdropped
+            ORDER BY c.relname, a.attnum""".encode()
+        )
+        columns_by_table: Dict[str, List[str]] = {}
+        sizes: Dict[str, int] = {}
+        for table_name, size, column_name in cur.fetchall():
+            columns_by_table.setdefault(table_name, []).append(column_name)
+            sizes[table_name] = size
+    manifest = read_manifest(con)
+
+    selected = set(tables) if tables else None
+    sources = [
+        VisitSource(
+            table_name, columns, manifest[table_name].crc32 if table_name in manifest else None, sizes[table_name]
+        )
+        for table_name, columns in sorted(columns_by_table.items())
+        if all(key in columns for key in VISIT_KEYS)
+        and not table_name.startswith("_ppmidb_")
+        and table_name != VISIT_TABLE
+        and (selected is None or table_name in selected)
+    ]
+    if selected and (missing := selected - {source.table_name for source in sources}):
+        raise ValueError(f"Not source tables (with patno and event_id): {', '.join(sorted(missing))}")
+    n_columns = len(VISIT_KEYS) + sum(len(source.visit_columns) for source in sources)
+    if n_columns > MAX_COLUMNS:
+        raise ValueError(
+            f"{len(sources)} source tables have {n_columns} columns (more than {MAX_COLUMNS}); select fewer tables"
+        )
+    return sources
+
+
+def build_visit_table(con, source: VisitSource, diff: bool) -> None:
+    """Rebuilds the visit table of SOURCE and records it in the visit state.  With
+    DIFF, the patients whose visit rows changed are added to the changes table.
+    Commits."""
+    visit_table = source.visit_table
+    new_table = identifier(visit_table + "__new")
+    order = ['s."last_update" DESC NULLS LAST'] if "last_update" in source.columns else []
+    select = [
+        's."patno"::BIGINT AS "patno"',
+        's."event_id"::TEXT AS "event_id"',
+        f'count(*) OVER (PARTITION BY s."patno", s."event_id") AS "{source.visit_columns[0]}"',
+    ] + [f's."{col}" AS "{name}"' for col, name in zip(source.value_columns, source.visit_columns[1:])]
+    try:
+        with con.cursor() as cur:
+            cur.execute(f'DROP TABLE IF EXISTS "{new_table}"'.encode())
+            cur.execute(
+                f"""CREATE TABLE "{new_table}" AS
+                SELECT DISTINCT ON (s."patno", s."event_id") {", ".join(select)}
+                FROM "{source.table_name}" AS s
+                WHERE s."patno" IS NOT NULL AND s."event_id" IS NOT NULL
+                ORDER BY {", ".join(['s."patno"', 's."event_id"'] + order + ["s"])}""".encode()
+            )
+            cur.execute(f'ALTER TABLE "{new_table}" ADD PRIMARY KEY ("patno", "event_id")'.encode())
+            cur.execute("SELECT to_regclass(%s)".encode(), (f'"{visit_table}"',))
+            exists = cur.fetchone()[0] is not None
+            if diff and exists:
+                cur.execute(
+                    f"""INSERT INTO "{VISIT_CHANGES_TABLE}" ("patno")
+                    SELECT DISTINCT "patno" FROM (
+                        (SELECT * FROM "{new_table}" EXCEPT SELECT * FROM "{visit_table}")
+                        UNION ALL
+                        (SELECT * FROM "{visit_table}" EXCEPT SELECT * FROM "{new_table}")
+                    ) AS changed
+                    ON CONFLICT DO NOTHING""".encode()
+                )
+                _logger.info(f"{source.table_name}: {cur.rowcount} new changed patients")
+            elif diff:
+                cur.execute(
+                    f'INSERT INTO "{VISIT_CHANGES_TABLE}" ("patno") SELECT DISTINCT "patno" FROM "{new_table}" '
+                    "ON CONFLICT DO NOTHING".encode()
+                )
+            if exists:
+                cur.execute(f'DROP TABLE "{visit_table}"'.encode())
+            cur.execute(f'ALTER TABLE "{new_table}" RENAME TO "{visit_table}"'.encode())
+            cur.execute(f'ANALYZE "{visit_table}"'.encode())
+            cur.execute(
+                f"""INSERT INTO "{VISIT_SOURCES_TABLE}" (table_name, crc32, fingerprint, built_at)
+                VALUES (%s, %s, %s, now())
+                ON CONFLICT (table_name) DO UPDATE SET
+                    crc32 = excluded.crc32, fingerprint = excluded.fingerprint, built_at = excluded.built_at""".encode(),
+                (source.table_name, source.crc32, source.fingerprint),
+            )
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+
+
+def visit_matrix_query(sources: List[VisitSource], changed_only: bool = False) -> str:
+    """Returns a SELECT of the rows of patient_visit from the visit tables of SOURCES,
+    or, if CHANGED_ONLY, of the rows of the patients in the changes table"""
+    where = f' WHERE "patno" IN (SELECT "patno" FROM "{VISIT_CHANGES_TABLE}")' if changed_only else ""
+    keys = "\n        UNION ".join(f'SELECT "patno", "event_id" FROM "{source.visit_table}"{where}' for source in sources)
+    columns = ['k."patno"', 'k."event_id"']
+    joins = []
+    for i, source in enumerate(sources):
+        columns += [f'v{i}."{name}"' for name in source.visit_columns]
+        joins.append(
+            f'LEFT JOIN "{source.visit_table}" AS v{i} ON v{i}."patno" = k."patno" AND v{i}."event_id" = k."event_id"'
+        )
+    return (
+        f"SELECT {', '.join(columns)}\n"
+        f"    FROM (\n        {keys}\n    ) AS k\n"
+        + "".join(f"    {join}\n" for join in joins)
+    )
+
+
+def _create_visit_matrix(cur, sources: List[VisitSource]) -> None:
+    """Fills patient_visit from the visit tables, truncating it if its columns are
+    unchanged (which keeps dependent views) and recreating it otherwise"""
+    columns = list(VISIT_KEYS) + [name for source in sources for name in source.visit_columns]
+    if table_columns(cur, VISIT_TABLE) == columns:
+        cur.execute(f'TRUNCATE "{VISIT_TABLE}"'.encode())
+        cur.execute(f'INSERT INTO "{VISIT_TABLE}" {visit_matrix_query(sources)}'.encode())
+    else:
+        cur.execute(f'DROP TABLE IF EXISTS "{VISIT_TABLE}"'.encode())
+        cur.execute(f'CREATE TABLE "{VISIT_TABLE}" AS {visit_matrix_query(sources)}'.encode())
+        cur.execute(f'ALTER TABLE "{VISIT_TABLE}" ADD PRIMARY KEY ("patno", "event_id")'.encode())
+    cur.execute(f'ANALYZE "{VISIT_TABLE}"'.encode())
+
+
+def _drop_stale_visit_tables(cur, sources: List[VisitSource]) -> None:
+    """Drops the visit tables of tables that are no longer sources"""
+    cur.execute(
+        "SELECT tablename FROM pg_tables WHERE schemaname = current_schema() AND starts_with(tablename, %s)".encode(),
+        (VISIT_TABLE_PREFIX,),
+    )
+    current = {source.visit_table for source in sources}
+    for (table_name,) in cur.fetchall():
+        if table_name not in current:
+            cur.execute(f'DROP TABLE "{table_name}"'.encode())
+
+
+def _read_visit_state(con) -> Dict[str, tuple]:
+    """Returns (crc32, fingerprint) of the source tables of the last build, by table name"""
+    with con.cursor() as cur:
+        cur.execute(f'SELECT table_name, crc32, fingerprint FROM "{VISIT_SOURCES_TABLE}"'.encode())
+        state = {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+        cur.execute("SELECT to_regclass(%s)".encode(), (f'"{VISIT_TABLE}"',))
+        if cur.fetchone()[0] is None:
+            state = {}
+    con.commit()
+    return state
+
+
+def build_visit_matrix(
+    uri: str,
+    schema: Optional[str] = None,
+    tables: Optional[Iterable[str]] = None,
+    jobs: int = 1,
+    full: bool = False,
+) -> VisitMatrixResult:
+    """Builds or refreshes patient_visit (see module docstring) in the database at URI,
+    in SCHEMA if given, from TABLES (default: all source tables).  Visit tables are
+    built over JOBS connections.  With FULL, the matrix is rebuilt even if a refresh
+    would do."""
+    import psycopg
+    from psycopg_pool import ConnectionPool
+
+    result = VisitMatrixResult()
+    with psycopg.connect(uri) as con:
+        if schema:
+            set_search_path(con, schema)
+        ensure_visit_state(con)
+        con.commit()
+        sources = visit_sources(con, tables)
+        if not sources:
+            raise RuntimeError("No source tables with patno and event_id columns")
+        state = _read_visit_state(con)
+        current = {source.table_name: source.fingerprint for source in sources}
+        result.full = full or current != {table_name: fingerprint for table_name, (_, fingerprint) in state.items()}
+        if result.full:
+            with con.cursor() as cur:
+                cur.execute(f'DELETE FROM "{VISIT_SOURCES_TABLE}"'.encode())
+            con.commit()
+            to_build = sources
+        else:
+            to_build = [s for s in sources if s.crc32 is None or s.crc32 != state[s.table_name][0]]
+        _logger.info(
+            f"{'Building' if result.full else 'Refreshing'} {VISIT_TABLE} from {len(sources)} tables; "
+            f"rebuilding {len(to_build)} visit tables"
+        )
+
+        errors = []
+        if to_build:
+            with (
+                ConnectionPool(
+                    uri,
+                    min_size=1,
+                    max_size=jobs,
+                    configure=(lambda c: set_search_path(c, schema)) if schema else None,
+                ) as pool,
+                ThreadPoolExecutor(max_workers=jobs) as executor,
+            ):
+
+                def build(source: VisitSource) -> None:
+                    with pool.connection() as pool_con:
+                        build_visit_table(pool_con, source, diff=not result.full)
+
+                # largest first, so that the longest builds start early
+                to_build = sorted(to_build, key=lambda s: s.size, reverse=True)
+                futures = {executor.submit(build, source): source for source in to_build}
+                for future, source in futures.items():
+                    try:
+                        future.result()
+                        result.rebuilt.append(source.table_name)
+                    except Exception as e:
+                        _logger.error(f"{source.table_name}: Error building visit table: {e}")
+                        errors.append(source.table_name + " (" + str(e) + ")")
+        if errors:
+            raise RuntimeError(f"{VISIT_TABLE} was not updated; failed visit tables: {', '.join(errors)}")
+
+        try:
+            with con.cursor() as cur:
+                if result.full:
+                    _create_visit_matrix(cur, sources)
+                    _drop_stale_visit_tables(cur, sources)
+                else:
+                    cur.execute(f'SELECT count(*) FROM "{VISIT_CHANGES_TABLE}"'.encode())
+                    result.patients = cur.fetchone()[0]
+                    if result.patients:
+                        cur.execute(
+                            f'DELETE FROM "{VISIT_TABLE}" WHERE "patno" IN (SELECT "patno" FROM "{VISIT_CHANGES_TABLE}")'.encode()
+                        )
+                        cur.execute(
+                            f'INSERT INTO "{VISIT_TABLE}" {visit_matrix_query(sources, changed_only=True)}'.encode()
+                        )
+                        cur.execute(f'ANALYZE "{VISIT_TABLE}"'.encode())
+                cur.execute(f'DELETE FROM "{VISIT_CHANGES_TABLE}"'.encode())
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+
+    if result.full:
+        _logger.warning(f"Built {VISIT_TABLE} from {len(sources)} tables")
+    else:
+        _logger.warning(
+            f"Refreshed {VISIT_TABLE}: rebuilt {len(result.rebuilt)} visit tables, replaced {result.patients} patients"
+        )
+    return result
@@ -0,0 +1,29 @@
+from pathlib import Path
+
+import pytest
+
+from ppmidb.sources import PPMI_CSV_ENCODING, CsvMember
+
+HEADER = '"REC_ID","PATNO","EVENT_ID","PAG_NAME","INFODT","SCORE","COMMENT"'
+
+
+def member_text(n_rows: int) -> str:
+    """Returns PPMI-like CSV text with N_ROWS records, a \\"-escaped quote, a
+    quoted newline and no newline after the last record"""
+    lines = [HEADER]
+    for i in range(n_rows):
+        comment = 'said \\"no\\"' if i % 3 == 0 else ("two\nlines" if i % 3 == 1 else "Résumé")
+        lines.append(f'"IA{i}","{3000 + i % 7}","V{i % 4:02d}","MOCA","0{1 + i % 9}/2020","{i % 30}","{comment}"')
+    return "\r\n".join(lines)
+
+
+@pytest.fixture
+def make_member(tmp_path):
+    """Returns a function that writes a standalone member with N_ROWS records"""
+
+    def make(n_rows: int = 50, name: str = "Test_Table_20250401.csv") -> CsvMember:
+        path = Path(tmp_path) / name
+        path.write_bytes(member_text(n_rows).encode(PPMI_CSV_ENCODING))
+        return CsvMember(csv_path=str(path), file_size=path.stat().st_size)
+
+    return make
@@ -0,0 +1,79 @@
+"""Stand-ins for google.cloud.bigquery and a BigQuery client
+
+FakeBigQueryClient.load_table_from_file reads the uploaded Parquet file
+and returns a FakeLoadJob that is done after a number of polls, so that
+load_bigquery's windowing and polling can be exercised without BigQuery.
+Pass the fakebigquery module itself as load_bigquery's bigquery argument.
+"""
+
+from dataclasses import dataclass, field
+import threading
+from typing import Dict, List, Optional, Set
+
+import polars as pl
+
+
+@dataclass
+class SchemaField:
+    name: str
+    field_type: str
+    mode: str = "NULLABLE"
+
+
+class SourceFormat:
+    PARQUET = "PARQUET"
+
+
+@dataclass
+class LoadJobConfig:
+    source_format: Optional[str] = None
+    schema: List[SchemaField] = field(default_factory=list)
+
+
+class FakeLoadJob:
+    def __init__(self, client: "FakeBigQueryClient", table_id: str, error: Optional[Exception]):
+        self.client = client
+        self.table_id = table_id
+        self.error = error
+        self.polls_left = client.polls_per_job
+
+    def done(self) -> bool:
+        if self.polls_left > 0:
+            self.polls_left -= 1
+            return False
+        self.client.finish(self)
+        return True
+
+    def result(self):
+        if self.polls_left > 0:
+            raise AssertionError("result() called before done()")
+        if self.error is not None:
+            raise self.error
+        return self
+
+
+class FakeBigQueryClient:
+    def __init__(self, polls_per_job: int = 2, failing_tables: Set[str] = frozenset()):
+        self.polls_per_job = polls_per_job
+        self.failing_tables = failing_tables
+        self.tables: Dict[str, pl.DataFrame] = {}
+        self.job_configs: Dict[str, LoadJobConfig] = {}
+        self.running: Set[str] = set()
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def load_table_from_file(self, fh, table_id: str, job_config: LoadJobConfig) -> FakeLoadJob:
+        frame = pl.read_parquet(fh)
+        table_name = table_id.rsplit(".", 1)[-1]
+        error = RuntimeError(f"Load failed for {table_id}") if table_name in self.failing_tables else None
+        with self._lock:
+            if error is None:
+                self.tables[table_id] = frame
+            self.job_configs[table_id] = job_config
+            self.running.add(table_id)
+            self.max_running = max(self.max_running, len(self.running))
+        return FakeLoadJob(self, table_id, error)
+
+    def finish(self, job: FakeLoadJob) -> None:
+        with self._lock:
+            self.running.discard(job.table_id)
@@ -0,0 +1,121 @@
+"""A stand-in for a psycopg connection that records statements
+
+Statements are recorded (whitespace-normalized) in FakeConnection.log.
+Results for SELECT (and other row-returning) statements are taken in
+order from RESULTS.  Tables are tracked by name: CREATE TABLE adds a
+table and DROP TABLE removes it, and statements on the _ppmidb_*
+bookkeeping tables fail with UndefinedTable unless the table exists, as
+they would in a fresh database.
+"""
+
+import csv
+from io import StringIO
+import re
+
+import psycopg
+
+RETURNS_ROWS = ("SELECT", "WITH", "MERGE")
+
+
+class FakeCopy:
+    def __init__(self, cursor, query: str):
+        self.cursor = cursor
+        self.query = query
+        self.text = []
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            if self.rows:
+                self.cursor.rowcount = len(self.rows)
+            else:
+                records = list(csv.reader(StringIO("".join(self.text))))
+                self.cursor.rowcount = len(records) - (1 if "HEADER" in self.query else 0)
+            self.cursor.con.copied.append((self.query, "".join(self.text), self.rows))
+
+    def write(self, data):
+        self.text.append(data.decode() if isinstance(data, (bytes, bytearray, memoryview)) else data)
+
+    def set_types(self, types):
+        pass
+
+    def write_row(self, row):
+        self.rows.append(row)
+
+
+class FakeCursor:
+    def __init__(self, con):
+        self.con = con
+        self.rowcount = -1
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, query, params=None):
+        query = " ".join((query.decode() if isinstance(query, bytes) else query).split())
+        self.con.log.append((query, params))
+        for statement in query.split(";"):
+            if m := re.match(r'CREATE (?:UNLOGGED )?TABLE (?:IF NOT EXISTS )?"([^"]+)"', statement.strip()):
+                self.con.tables.add(m.group(1))
+            elif m := re.match(r'DROP TABLE (?:IF EXISTS )?"([^"]+)"', statement.strip()):
+                self.con.tables.discard(m.group(1))
+        for name in re.findall(r'"(_ppmidb_[a-z_]+)"', query):
+            if name not in self.con.tables and not query.startswith("CREATE"):
+                raise psycopg.errors.UndefinedTable(f'relation "{name}" does not exist')
+        self._rows = self.con.results.pop(0) if self.con.results and query.startswith(RETURNS_ROWS) else []
+        self.rowcount = len(self._rows)
+
+    def executemany(self, query, params_seq):
+        for params in params_seq:
+            self.execute(query, params)
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def copy(self, query):
+        return FakeCopy(self, query.decode() if isinstance(query, bytes) else query)
+
+
+class FakeConnection:
+    def __init__(self, results=None, tables=()):
+        self.log = []  # (statement, params)
+        self.copied = []  # (COPY statement, text, rows)
+        self.results = list(results or [])
+        self.tables = set(tables)
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def cancel(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def statements(self, prefix: str = ""):
+        return [query for query, _ in self.log if query.startswith(prefix)]
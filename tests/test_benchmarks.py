@@ -0,0 +1,23 @@
+from pathlib import Path
+import sys
+
+import psycopg
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "benchmarks"))
+
+import suite  # noqa: E402
+from synthetic_freeze import write_synthetic_freeze  # noqa: E402
+
+from ppmidb.sources import member_generator  # noqa: E402
+
+from fakepg import FakeConnection  # noqa: E402
+
+
+def test_bench_copy_loads_into_scratch_schema(tmp_path, monkeypatch):
+    con = FakeConnection()
+    monkeypatch.setattr(psycopg, "connect", lambda uri: con)
+    zip_path = write_synthetic_freeze(tmp_path / "PPMI_20990101.zip", n_tables=3, n_rows=40)
+    members = list(member_generator(file_paths=[], zip_file=str(zip_path)))
+    suite.bench_copy("postgresql://localhost/scratch", members)
+    assert len(con.copied) == 3
+    assert con.statements(f'DROP SCHEMA IF EXISTS "{suite.BENCH_SCHEMA}"')
@@ -0,0 +1,40 @@
+from ppmidb.bigquery_loader import load_bigquery
+from ppmidb.export import ExportOptions
+
+import fakebigquery
+from fakebigquery import FakeBigQueryClient
+
+
+def make_members(make_member, n: int):
+    return [make_member(10 * (i + 1), name=f"Table_{i}_20250401.csv") for i in range(n)]
+
+
+def test_load_bigquery_with_fake_client(make_member):
+    client = FakeBigQueryClient(polls_per_job=3)
+    errors, metrics = [], []
+    load_bigquery(
+        client, "proj.ppmi", make_members(make_member, 5), ExportOptions(), jobs=2, errors=errors,
+        max_load_jobs=2, bigquery=fakebigquery, poll_interval=0.001, metrics=metrics,
+    )
+    assert errors == []
+    assert sorted(client.tables) == [f"proj.ppmi.table_{i}" for i in range(5)]
+    assert client.tables["proj.ppmi.table_4"].height == 50
+    assert 1 <= client.max_running <= 2
+    assert client.running == set()
+    assert len(metrics) == 5 and all("load" in m.stages for m in metrics)
+    config = client.job_configs["proj.ppmi.table_0"]
+    assert config.source_format == "PARQUET"
+    assert {f.mode for f in config.schema} == {"NULLABLE"}
+    assert {f.name: f.field_type for f in config.schema}["patno"] == "INT64"
+
+
+def test_load_bigquery_reports_failed_jobs(make_member):
+    client = FakeBigQueryClient(polls_per_job=1, failing_tables={"table_1"})
+    errors = []
+    load_bigquery(
+        client, "proj.ppmi", make_members(make_member, 3), ExportOptions(), jobs=1, errors=errors,
+        max_load_jobs=1, bigquery=fakebigquery, poll_interval=0.001,
+    )
+    assert errors == ["table_1 (Load failed for proj.ppmi.table_1)"]
+    assert sorted(client.tables) == ["proj.ppmi.table_0", "proj.ppmi.table_2"]
+    assert client.max_running == 1
@@ -0,0 +1,14 @@
+from ppmidb.bridge import refresh_bridge
+
+from fakepg import FakeConnection
+
+
+def test_refresh_bridge_refreshes_code_decode_first_and_concurrently():
+    con = FakeConnection(results=[[("a_view",), ("code_decode",)], [(True,)], [(False,)]])
+    assert refresh_bridge(con, "bridge") == ["code_decode", "a_view"]
+    refreshes = con.statements("REFRESH")
+    assert refreshes == [
+        'REFRESH MATERIALIZED VIEW CONCURRENTLY "bridge"."code_decode"',
+        'REFRESH MATERIALIZED VIEW "bridge"."a_view"',
+    ]
+    assert con.commits == 1
@@ -0,0 +1,40 @@
+import logging
+
+from click.testing import CliRunner
+import psycopg
+import pytest
+
+from ppmidb.cli import cli
+
+from fakepg import FakeConnection
+
+
+@pytest.mark.parametrize(
+    "args, message",
+    [
+        (["set-alias", "--uri", "postgresql://db", "ppmi_20250401"], "Schema ppmi_20250401 has no tables"),
+        (["refresh-bridge", "--uri", "postgresql://db", "bridge"], "Schema bridge has no materialized views"),
+    ],
+)
+def test_schema_errors_are_reported_without_traceback(monkeypatch, caplog, args, message):
+    con = FakeConnection()
+    monkeypatch.setattr(psycopg, "connect", lambda uri: con)
+    with caplog.at_level(logging.CRITICAL):
+        result = CliRunner().invoke(cli, args)
+    assert result.exception is None
+    assert any(message in record.getMessage() for record in caplog.records)
+    assert con.rollbacks == 1
+
+
+def test_load_reports_bridge_errors_and_closes_connection(monkeypatch, caplog, make_member):
+    con = FakeConnection()
+    monkeypatch.setattr(psycopg, "connect", lambda uri: con)
+    member = make_member(5)
+    with caplog.at_level(logging.CRITICAL):
+        result = CliRunner().invoke(
+            cli, ["load", "--uri", "postgresql://db", "--refresh-bridge", "bridge", "--no-schema-cache", member.csv_path]
+        )
+    assert result.exception is None
+    assert len(con.copied) == 1
+    assert any("Schema bridge has no materialized views" in record.getMessage() for record in caplog.records)
+    assert con.closed
@@ -0,0 +1,44 @@
+from ppmidb.delta import DELTAS_TABLE, apply_delta, choose_key, merge_delta
+
+from fakepg import FakeConnection
+
+COLUMNS = ["rec_id", "patno", "event_id", "pag_name", "score"]
+
+
+def test_choose_key_uses_live_unique_index():
+    con = FakeConnection(results=[[(True, True)], [(["rec_id"],)]])
+    with con.cursor() as cur:
+        assert choose_key(cur, "t", "t__delta", COLUMNS) == ("rec_id",)
+    scans = con.statements("SELECT count(*)")
+    assert len(scans) == 1 and scans[0].endswith('FROM "t__delta"')
+
+
+def test_choose_key_scans_live_table_once_without_index():
+    con = FakeConnection(results=[[(True, True)], [], [(False, True)]])
+    with con.cursor() as cur:
+        assert choose_key(cur, "t", "t__delta", COLUMNS) == ("patno", "event_id", "pag_name")
+    assert [q.rsplit(" ", 1)[-1] for q in con.statements("SELECT count(*)")] == ['"t__delta"', '"t"']
+
+
+def test_choose_key_without_candidates():
+    con = FakeConnection(results=[[(False,)]])
+    with con.cursor() as cur:
+        assert choose_key(cur, "t", "t__delta", ["rec_id", "score"]) is None
+        assert choose_key(cur, "t", "t__delta", ["score"]) is None
+
+
+def test_merge_delta_counts_actions_on_the_server():
+    con = FakeConnection(results=[[("UPDATE", 3), ("DELETE", 1)]])
+    with con.cursor() as cur:
+        counts = merge_delta(cur, "t", "t__delta", COLUMNS, ("rec_id",))
+    assert (counts.inserted, counts.updated, counts.deleted, counts.key) == (0, 3, 1, ("rec_id",))
+    (query,) = con.statements("WITH m AS ( MERGE")
+    assert "RETURNING merge_action() AS action ) SELECT action, count(*) FROM m GROUP BY action" in query
+
+
+def test_apply_delta_replaces_table_without_key():
+    con = FakeConnection(results=[[("score",)], [(12,)]], tables={DELTAS_TABLE})
+    with con.cursor() as cur:
+        counts = apply_delta(cur, "t", "t__delta")
+    assert counts.deleted == 12 and counts.key is None
+    assert con.statements('TRUNCATE "t"')
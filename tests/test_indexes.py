@@ -0,0 +1,27 @@
+from pathlib import Path
+
+import polars as pl
+
+from ppmidb.indexes import DEFAULT_INDEX_POLICY, IndexPolicy, load_index_policy, plan_indexes
+from ppmidb.infer_schema import ColumnSchema
+
+SCHEMA = [
+    ColumnSchema("PATNO", "patno", pl.Int64, False, sql_type="INTEGER NOT NULL"),
+    ColumnSchema("EVENT_ID", "event_id", pl.String, True, sql_type="TEXT NULL"),
+    ColumnSchema("INFODT", "infodt", pl.Date, True, sql_type="DATE NULL"),
+]
+
+
+def test_default_policy_has_no_brin_indexes():
+    specs = plan_indexes(SCHEMA)
+    assert [(spec.columns, spec.method) for spec in specs] == [(("patno", "event_id"), "btree")]
+
+
+def test_brin_indexes_by_policy():
+    specs = plan_indexes(SCHEMA, IndexPolicy(brin_types=("DATE",)))
+    assert (("infodt",), "brin") in [(spec.columns, spec.method) for spec in specs]
+
+
+def test_example_policy_file_matches_defaults():
+    path = Path(__file__).parents[1] / "misc" / "index_policy.toml"
+    assert load_index_policy(path) == DEFAULT_INDEX_POLICY
@@ -0,0 +1,53 @@
+import psycopg
+import pytest
+
+from ppmidb.loader import LoadOptions, load_member
+from ppmidb.manifest import MANIFEST_TABLE
+
+from fakepg import FakeConnection, FakeCursor
+
+
+@pytest.mark.parametrize("create_table", [False, True])
+def test_load_member_into_fresh_database(make_member, create_table):
+    con = FakeConnection()
+    errors = []
+    load_member(con, make_member(20), LoadOptions(create_table=create_table), errors)
+    assert errors == []
+    assert MANIFEST_TABLE in con.tables
+    assert len(con.copied) == 1
+    assert con.statements(f'INSERT INTO "{MANIFEST_TABLE}"')
+    if create_table:
+        assert "test_table" in con.tables
+    params = [params for query, params in con.log if query.startswith(f'INSERT INTO "{MANIFEST_TABLE}"')]
+    assert params[0][0] == "test_table" and params[0][-1] == 20
+
+
+def test_load_member_reports_failures(make_member, monkeypatch):
+    def copy(self, query):
+        raise psycopg.errors.BadCopyFileFormat("extra data after last expected column")
+
+    monkeypatch.setattr(FakeCursor, "copy", copy)
+    con = FakeConnection()
+    errors = []
+    load_member(con, make_member(5), LoadOptions(), errors)
+    assert errors == ["test_table (extra data after last expected column)"]
+    assert con.rollbacks == 1
+    assert not con.statements(f'INSERT INTO "{MANIFEST_TABLE}"')
+
+
+def test_bulk_load_swaps_in_staging_table(make_member):
+    con = FakeConnection(results=[[]])  # no dependent views
+    errors = []
+    load_member(con, make_member(10), LoadOptions(create_table=True, bulk=True), errors)
+    assert errors == []
+    assert con.copied[0][0].startswith("COPY test_table__staging ")
+    assert con.statements('ALTER TABLE "test_table__staging" RENAME TO "test_table"')
+
+
+def test_bulk_load_refuses_to_drop_table_with_views(make_member):
+    con = FakeConnection(results=[[("ppmi.test_table",)]])
+    errors = []
+    load_member(con, make_member(10), LoadOptions(create_table=True, bulk=True), errors)
+    assert len(errors) == 1 and "views depend on it: ppmi.test_table" in errors[0]
+    assert not con.copied
+    assert not con.statements('DROP TABLE IF EXISTS "test_table"')
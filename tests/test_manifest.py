@@ -0,0 +1,55 @@
+from ppmidb.indexes import IndexPolicy
+from ppmidb.loader import LoadOptions, expected_fingerprint, load_member
+from ppmidb.manifest import MANIFEST_TABLE, ManifestEntry, plan_reload
+from ppmidb.partitions import PartitionPolicy
+from ppmidb.schema_cache import SchemaCache
+
+from fakepg import FakeConnection
+
+
+def entry_for(member, **kwargs) -> ManifestEntry:
+    return ManifestEntry(member.table_name, member.csv_path, member.content_crc(), member.file_size, **kwargs)
+
+
+def test_plan_reload(make_member):
+    same = make_member(10, name="Same_20250401.csv")
+    changed = make_member(10, name="Changed_20250401.csv")
+    added = make_member(10, name="Added_20250401.csv")
+    manifest = {
+        "same": entry_for(same),
+        "changed": ManifestEntry("changed", changed.csv_path, 0, changed.file_size),
+        "gone": ManifestEntry("gone", "Gone_20250101.csv", 1, 1),
+    }
+    plan = plan_reload([same, changed, added], manifest, complete=True)
+    assert (plan.unchanged, plan.changed, plan.added, plan.removed) == (["same"], ["changed"], ["added"], ["gone"])
+    assert plan.to_load == [changed, added]
+    assert plan_reload([same], manifest, complete=False).removed == []
+
+
+def test_plan_reload_compares_fingerprints(make_member):
+    member = make_member(10)
+    manifest = {"test_table": entry_for(member, schema_fingerprint="abc")}
+    assert plan_reload([member], manifest, True, fingerprint=lambda m: "abc").unchanged == ["test_table"]
+    assert plan_reload([member], manifest, True, fingerprint=lambda m: None).unchanged == ["test_table"]
+    plan = plan_reload([member], manifest, True, fingerprint=lambda m: "def")
+    assert plan.reconfigured == ["test_table"] and plan.to_load == [member]
+
+
+def test_expected_fingerprint_matches_load_and_tracks_options(tmp_path, make_member):
+    member = make_member(40)
+    options = LoadOptions(create_table=True, schema_cache=SchemaCache(tmp_path / "cache.sqlite"))
+    con = FakeConnection()
+    errors = []
+    load_member(con, member, options, errors)
+    assert errors == []
+    recorded = [params for query, params in con.log if query.startswith(f'INSERT INTO "{MANIFEST_TABLE}"')][0][4]
+    assert expected_fingerprint(member, options) == recorded
+    assert expected_fingerprint(member, LoadOptions(create_table=True)) == recorded
+
+    variants = [
+        LoadOptions(create_table=True, tight_types=("dates",)),
+        LoadOptions(create_table=True, partition_policy=PartitionPolicy(min_rows=10, partitions=4)),
+        LoadOptions(create_table=True, index_policy=IndexPolicy(composite=(("rec_id",),))),
+    ]
+    assert all(expected_fingerprint(member, variant) != recorded for variant in variants)
+    assert expected_fingerprint(member, LoadOptions()) is None
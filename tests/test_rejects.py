@@ -0,0 +1,91 @@
+import psycopg
+import pytest
+
+from ppmidb.rejects import SAVEPOINT, RejectingCopy, iter_records, record_text
+
+
+class SavepointCursor:
+    """Tracks the savepoint stack and fails COPYs that contain a bad record"""
+
+    def __init__(self, bad: str = "bad"):
+        self.bad = bad
+        self.savepoints = []
+        self.max_depth = 0
+        self.copied = []
+        self.n_copies = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, query):
+        query = query.decode()
+        if query == f"SAVEPOINT {SAVEPOINT}":
+            self.savepoints.append(len(self.copied))
+            self.max_depth = max(self.max_depth, len(self.savepoints))
+        elif query == f"ROLLBACK TO SAVEPOINT {SAVEPOINT}":
+            del self.copied[self.savepoints[-1] :]
+        elif query == f"RELEASE SAVEPOINT {SAVEPOINT}":
+            self.savepoints.pop()
+
+    def copy(self, query):
+        cursor = self
+
+        class Copy:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, exc_type, exc, tb):
+                pass
+
+            def write(self, data):
+                cursor.n_copies += 1
+                records = data.splitlines()
+                if any(cursor.bad in record for record in records):
+                    raise psycopg.errors.InvalidTextRepresentation("invalid input syntax for type integer")
+                cursor.copied.extend(records)
+
+        return Copy()
+
+
+class Connection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+
+def records(n: int, bad_lines=()):
+    return [(i + 2, f'"{"bad" if i + 2 in bad_lines else i}"\n') for i in range(n)]
+
+
+def test_bisection_rejects_only_bad_records():
+    cur = SavepointCursor()
+    rejecting = RejectingCopy("t", batch_rows=16)
+    n_rows = rejecting.copy(Connection(cur), "COPY t FROM STDIN", records(100, bad_lines={5, 40, 41, 101}))
+    assert n_rows == 96 == len(cur.copied)
+    assert [r.line_number for r in rejecting.rejected] == [5, 40, 41, 101]
+    assert rejecting.rejected[0].error == "invalid input syntax for type integer"
+    assert rejecting.rejected[0].record == '"bad"'
+
+
+def test_bisection_does_not_leak_savepoints():
+    cur = SavepointCursor()
+    RejectingCopy("t", batch_rows=1024).copy(Connection(cur), "COPY t FROM STDIN", records(1024, bad_lines={7, 900}))
+    assert cur.savepoints == []
+    assert cur.max_depth == 1
+
+
+def test_too_many_rejected_records_fail():
+    cur = SavepointCursor()
+    with pytest.raises(ValueError, match="More than 2 rows rejected"):
+        RejectingCopy("t", max_rejected=2).copy(Connection(cur), "COPY t FROM STDIN", records(10, bad_lines={2, 3, 4}))
+
+
+def test_iter_records_joins_quoted_newlines():
+    chunks = ['"a","b"\n"1","x', '\ny"\n"2","z"']
+    assert list(iter_records(chunks)) == [(1, '"a","b"\n'), (2, '"1","x\ny"\n'), (4, '"2","z"')]
+    assert record_text((1, None, "x,y")) == '1,,"x,y"'
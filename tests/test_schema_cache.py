@@ -0,0 +1,34 @@
+from ppmidb.infer_schema import infer_schema_from_csv
+from ppmidb.schema_cache import SchemaCache, cached_infer, inference_variant, schema_cache_key
+from ppmidb.sources import spool_chunks
+
+
+def test_inference_variant():
+    assert inference_variant() == ""
+    assert inference_variant(("flags", "dates")) == "tight=dates,flags"
+    assert inference_variant((), 1000) == "sample=1000"
+    assert inference_variant(("dates",), 1000) != inference_variant(("dates",))
+
+
+def test_sampled_and_full_schemas_are_cached_separately(tmp_path, make_member):
+    member = make_member(30)
+    spool_path = tmp_path / "member.csv"
+    spool_chunks(member.iter_chunks(), spool_path)
+    cache = SchemaCache(tmp_path / "cache.sqlite")
+    calls = []
+
+    def infer(sample_size):
+        def run():
+            calls.append(sample_size)
+            return infer_schema_from_csv(spool_path, sample_size=sample_size)
+
+        return run
+
+    full = cached_infer(cache, member, infer(None), inference_variant())
+    sampled = cached_infer(cache, member, infer(10), inference_variant((), 10))
+    assert calls == [None, 10]
+    assert cached_infer(cache, member, infer(None), inference_variant()) == full
+    assert cached_infer(cache, member, infer(10), inference_variant((), 10)) == sampled
+    assert calls == [None, 10]
+    assert schema_cache_key(member, "sample=10") != schema_cache_key(member)
+    assert full[0].n_rows == 30
@@ -0,0 +1,58 @@
+import csv
+from io import StringIO
+
+import pytest
+
+from ppmidb.shards import COPY_END, ShardOptions, iter_copy_data, open_shard, write_member_shards
+
+
+def shard_texts(out_dir, shards):
+    texts = []
+    for shard in shards:
+        with open_shard(out_dir / shard.path, "rt", shard.compression) as fh:
+            texts.append(fh.read())
+    return texts
+
+
+@pytest.mark.parametrize("shard_bytes", [None, 500])
+@pytest.mark.parametrize("compression", ["gzip", "none"])
+def test_shards_are_terminated_scripts(tmp_path, make_member, shard_bytes, compression):
+    member = make_member(50)
+    shards, metrics = write_member_shards(member, tmp_path, ShardOptions(compression, shard_bytes=shard_bytes))
+    assert len(shards) == 1 if shard_bytes is None else len(shards) > 1
+    for text in shard_texts(tmp_path, shards):
+        assert text.startswith("SET client_encoding = 'UTF8';\nCOPY ")
+        assert text.endswith("\n" + COPY_END)
+        assert not text[: -len(COPY_END)].endswith("\n\n")
+    if shard_bytes:
+        assert metrics.rows == sum(shard.rows for shard in shards) == 50
+
+
+def test_shards_reassemble_member(tmp_path, make_member):
+    member = make_member(50)
+    shards, _ = write_member_shards(member, tmp_path, ShardOptions("none", shard_bytes=300))
+    data = ""
+    for shard in sorted(shards, key=lambda s: s.shard):
+        with open_shard(tmp_path / shard.path, "rt", shard.compression) as fh:
+            while not fh.readline().startswith("COPY "):
+                pass
+            data += "".join(iter_copy_data(fh))
+    records = list(csv.reader(StringIO(data)))
+    assert [r[0] for r in records] == [f"IA{i}" for i in range(50)]
+    assert records[0][-1] == 'said "no"'
+    assert records[1][-1] == "two\nlines"
+
+
+def test_iter_copy_data_detects_truncation():
+    with pytest.raises(ValueError, match="Truncated"):
+        list(iter_copy_data(StringIO('"1","2"\n')))
+
+
+def test_member_crc_is_computed_once(tmp_path, make_member, monkeypatch):
+    member = make_member(50)
+    calls = []
+    content_crc = type(member).content_crc
+    monkeypatch.setattr(type(member), "content_crc", lambda self: calls.append(1) or content_crc(self))
+    shards, _ = write_member_shards(member, tmp_path, ShardOptions("none", shard_bytes=300))
+    assert len(shards) > 1 and len(calls) == 1
+    assert {shard.crc32 for shard in shards} == {content_crc(member)}
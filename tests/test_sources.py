@@ -0,0 +1,74 @@
+from contextlib import contextmanager
+from io import BytesIO
+
+import pytest
+
+from ppmidb.sources import (
+    PPMI_CSV_ENCODING,
+    CsvMember,
+    StreamReplacer,
+    StreamStripper,
+    iter_fixed_chunks,
+    split_header,
+    table_name_for,
+)
+
+from conftest import HEADER, member_text
+
+DIAGNOSIS_PATH = "Primary_Clinical_Diagnosis_20250401.csv"
+
+
+def feed_all(stage, text: str, size: int) -> str:
+    return "".join(stage.feed(text[i : i + size]) for i in range(0, len(text), size)) + stage.flush()
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_stream_replacer_matches_str_replace(size):
+    text = 'a\\"b\\\\"c\\"\\"d\\'
+    assert feed_all(StreamReplacer('\\"', '""'), text, size) == text.replace('\\"', '""')
+    assert feed_all(StreamReplacer("aa", "b"), "aaaaa", size) == "bba"
+
+
+@pytest.mark.parametrize("size", [1, 4, 1000])
+def test_stream_stripper(size):
+    assert feed_all(StreamStripper(), "  \r\n a b \n c\r\n\r\n  ", size) == "a b \n c"
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 64, 1 << 20])
+@pytest.mark.parametrize("csv_path", ["Test_20250401.csv", DIAGNOSIS_PATH])
+def test_iter_fixed_chunks(chunk_size, csv_path):
+    text = "\r\n" + member_text(20) + '\r\n"x","no tremors today. \\"",,"3",\r\n\r\n'
+    raw = text.encode(PPMI_CSV_ENCODING)
+    timings = {}
+    fixed = "".join(iter_fixed_chunks(BytesIO(raw), csv_path, chunk_size=chunk_size, timings=timings))
+    # the \\" rule runs first, so the diagnosis rule no longer matches here
+    expected = member_text(20).replace('\\"', '""') + '\r\n"x","no tremors today. """,,"3",'
+    assert fixed == expected
+    assert "Résumé" in fixed
+    assert set(timings) == {"read", "decode", "fix"}
+
+
+def test_split_header_keeps_header_in_chunks():
+    header, chunks = split_header(iter(['"A","B', '"\n"1","2"\n']))
+    assert header == '"A","B"'
+    assert "".join(chunks) == '"A","B"\n"1","2"\n'
+
+
+def test_table_name_for():
+    assert table_name_for("dir/MDS-UPDRS_Part_III_20250401.csv") == "mds_updrs_part_iii"
+
+
+def test_read_header_closes_member(make_member, monkeypatch):
+    member = make_member(5)
+    handles = []
+    open_member = CsvMember.open
+
+    @contextmanager
+    def recording_open(self):
+        with open_member(self) as fh:
+            handles.append(fh)
+            yield fh
+
+    monkeypatch.setattr(CsvMember, "open", recording_open)
+    assert member.read_header() == HEADER
+    assert len(handles) == 1 and handles[0].closed